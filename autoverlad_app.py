@@ -3,27 +3,44 @@ import pandas as pd
 import sqlite3
 import altair as alt
 import datetime
+import time
 from logic import (
-    fetch_all_data, 
-    init_db, 
+    get_latest_state,
+    get_recent_wait_times,
+    seconds_until_next_ingest,
     DB_NAME, 
     CH_TZ, 
-    get_furka_status,
-    get_loetschberg_status,
-    get_gemini_situation_report
+    get_gemini_situation_report,
+    fetch_source_with_age,
+    get_last_good_response,
+    get_source_health,
+    get_http_cache_stats,
+    get_gemini_cache_stats,
+    get_travel_time_stats,
+    get_feed_stats,
+    get_feed_events,
+    get_gsheets_backlog,
+    get_metrics_summary,
+    record_metric,
+    get_rollup_history,
+    get_chart_window,
+    CHART_WINDOWS,
+    HISTORY_RANGES
 )
 from streamlit_autorefresh import st_autorefresh
 
+render_start = time.perf_counter()
+
 # 1. Seiteneinstellungen
 st.set_page_config(page_title="Autoverlad Monitor", layout="wide")
 
-# 2. Daten initialisieren & abrufen
-init_db()  
-
-data = fetch_all_data()
+# 2. Daten abrufen (Schema legt logic.py einmal pro Prozess an)
+# Nur lesen: Wartezeiten und Status kommen aus dem prozessweiten Snapshot (vom Collector gespeist)
+live = get_latest_state()
+data = live["wait_times"]
 
-furka_aktiv = get_furka_status() 
-loetschberg_aktiv = get_loetschberg_status()
+furka_aktiv = live["furka_aktiv"]
+loetschberg_aktiv = live["loetschberg_aktiv"]
 
 st.title("🏔️ Autoverlad Monitor")
 
@@ -38,6 +55,12 @@ if not furka_aktiv or not loetschberg_aktiv:
     if not loetschberg_aktiv:
         st.error("🚨 **Hinweis:** Der Verladbetrieb am **Lötschberg** (Kandersteg/Goppenstein) ist aktuell **eingestellt**.")
 
+# Quelle gestört: letzter guter Stand wird angezeigt, aber als veraltet markiert statt geraten
+veraltet = live.get("stale", {})
+for quelle in ("Furka", "Lötschberg"):
+    if quelle in veraltet:
+        st.warning(f"⚠️ Betriebsstatus **{quelle}** seit {veraltet[quelle]} Min nicht bestätigt (Quelle gestört) – angezeigt wird der letzte bekannte Stand.")
+
 # --- 1. METRIKEN ---
 cols = st.columns(4)
 for i, (name, d) in enumerate(data.items()):
@@ -54,32 +77,54 @@ for i, (name, d) in enumerate(data.items()):
             delta_color="inverse"
         )
     else:
-        cols[i % 4].metric(label=name, value=f"{d['min']} Min")
+        if name in veraltet:
+            cols[i % 4].metric(label=name, value=f"{d['min']} Min", delta=f"veraltet ({veraltet[name]} Min)", delta_color="off")
+        else:
+            cols[i % 4].metric(label=name, value=f"{d['min']} Min")
 
-# --- 2. DATEN LADEN (Historie für Chart) ---
-with sqlite3.connect(DB_NAME) as conn:
-    df = pd.read_sql_query("SELECT * FROM stats WHERE timestamp >= datetime('now', '-24 hours')", conn)
-    df_history = pd.read_sql_query("SELECT * FROM stats ORDER BY timestamp DESC LIMIT 100", conn)
+# --- 2. DATEN LADEN (Historie für Debug-Tab) ---
+@st.cache_data(max_entries=1)
+def load_history(datenstand):
+    # Nur neu lesen, wenn der Collector einen neuen Slot geschrieben hat
+    with sqlite3.connect(DB_NAME) as conn:
+        return pd.read_sql_query("SELECT * FROM stats_full ORDER BY timestamp DESC LIMIT 100", conn)
+
+df_history = load_history(live["timestamp"])
 
 # --- 3. TREND CHART ---
-st.subheader("📈 24h Trend")
-if not df.empty:
-    df_plot = df.copy()
+st.subheader("📈 Trend")
+zeitraum = st.radio("Zeitraum", [*CHART_WINDOWS, *HISTORY_RANGES], horizontal=True, label_visibility="collapsed")
+kurz = zeitraum in CHART_WINDOWS
+
+if kurz:
+    # Rohdaten aus dem inkrementellen Prozess-Cache, bereits geparst, gefiltert und ggf. per LTTB reduziert
+    df_plot = get_chart_window(CHART_WINDOWS[zeitraum])
+    x_format, tooltip_extra = ('%H:%M' if zeitraum == "24h" else '%d.%m. %H:%M'), []
+else:
+    # Lange Zeiträume kommen aus den Rollup-Tabellen (Durchschnitt pro Stunde bzw. Tag)
+    df_plot = get_rollup_history(zeitraum)
     df_plot['timestamp'] = pd.to_datetime(df_plot['timestamp'])
     df_plot = df_plot[df_plot['minutes'] < 500]
-    
+    x_format = '%d.%m. %H:%M' if zeitraum == "7 Tage" else '%d.%m.'
+    tooltip_extra = [
+        alt.Tooltip('p90_minutes:Q', title='P90 (Min)'),
+        alt.Tooltip('max_minutes:Q', title='Max (Min)')
+    ]
+
+if not df_plot.empty:
     chart = alt.Chart(df_plot).mark_line(
         interpolate='monotone', 
         size=3, 
-        point=True
+        point=zeitraum == "24h"
     ).encode(
-        x=alt.X('timestamp:T', title="Uhrzeit (CET)", axis=alt.Axis(format='%H:%M')),
-        y=alt.Y('minutes:Q', title="Wartezeit (Minuten)", scale=alt.Scale(domain=[0, 180])),
+        x=alt.X('timestamp:T', title="Uhrzeit (CET)" if kurz else "Datum", axis=alt.Axis(format=x_format)),
+        y=alt.Y('minutes:Q', title="Wartezeit (Minuten)" if kurz else "Ø Wartezeit (Minuten)", scale=alt.Scale(domain=[0, 180])),
         color=alt.Color('station:N', title="Station"),
         tooltip=[
-            alt.Tooltip('timestamp:T', format='%H:%M', title='Zeit'),
+            alt.Tooltip('timestamp:T', format=x_format, title='Zeit'),
             alt.Tooltip('station:N', title='Station'),
-            alt.Tooltip('minutes:Q', title='Wartezeit (Min)')
+            alt.Tooltip('minutes:Q', title='Wartezeit (Min)'),
+            *tooltip_extra
         ]
     ).properties(height=400).interactive()
     
@@ -94,7 +139,7 @@ with st.expander("🛠️ Debug Informationen & Experten-Diagnose"):
     col_stat1.write(f"Furka-Status (RSS): **{'✅ Aktiv' if furka_aktiv else '❌ Eingestellt'}**")
     col_stat2.write(f"Lötschberg-Status (API): **{'✅ Aktiv' if loetschberg_aktiv else '❌ Eingestellt'}**")
     
-    tab1, tab2, tab3 = st.tabs(["JSON Rohdaten", "Datenbank Historie", "Experten-Diagnose (Live)"])
+    tab1, tab2, tab3, tab4 = st.tabs(["JSON Rohdaten", "Datenbank Historie", "Experten-Diagnose (Live)", "Metriken (24h)"])
     
     with tab1:
         st.write("Aktuelle Wartezeit-Daten:")
@@ -105,43 +150,76 @@ with st.expander("🛠️ Debug Informationen & Experten-Diagnose"):
         st.dataframe(df_history, use_container_width=True)
         
     with tab3:
-        st.write("### Live-Abfrage der Verkehrs-Feeds")
+        st.write("### Rohdaten der Verkehrs-Feeds")
+        # Standard: letzter Stand im Prozess, ohne Upstream-Abfrage (der Tab-Inhalt läuft bei jedem Rerun)
+        live_abfrage = st.button("Feeds jetzt live abfragen")
+        roh = {name: fetch_source_with_age(name, stale_ok=True) if live_abfrage else get_last_good_response(name)
+               for name in ("mgb_furka", "bls_traffic")}
         diag_col1, diag_col2 = st.columns(2)
-        import requests
         with diag_col1:
             st.markdown("**Furka (MGB RSS)**")
-            try:
-                f_res = requests.get("https://mgb-prod.oevfahrplan.ch/incident-manager-api/incidentmanager/rss?publicId=av_furka&lang=de", timeout=5)
-                st.text_area("Roh-Text Furka (Auszug):", f_res.text[:500], height=150)
-            except Exception as e:
-                st.error(f"Fehler Furka-Feed: {e}")
+            f_res, f_alter = roh["mgb_furka"]
+            if f_res is None:
+                st.info("Kein Abruf in diesem Prozess (der Collector läuft separat) – live abfragen.")
+            else:
+                try:
+                    st.caption(f"Stand vor {f_alter // 60:.0f} Min")
+                    st.text_area("Roh-Text Furka (Auszug):", f_res.text[:500], height=150)
+                except Exception as e:
+                    st.error(f"Fehler Furka-Feed: {e}")
 
         with diag_col2:
             st.markdown("**Lötschberg (BLS API)**")
-            try:
-                l_res = requests.get("https://www.bls.ch/api/TrafficInformation/GetNewNotifications?sc_lang=de&sc_site=internet-bls", 
-                                     headers={'User-Agent': 'Mozilla/5.0'}, timeout=5)
-                st.json(l_res.json().get("trafficInformations", []))
-            except Exception as e:
-                st.error(f"Fehler BLS-API: {e}")
+            l_res, l_alter = roh["bls_traffic"]
+            if l_res is None:
+                st.info("Kein Abruf in diesem Prozess (der Collector läuft separat) – live abfragen.")
+            else:
+                try:
+                    st.caption(f"Stand vor {l_alter // 60:.0f} Min")
+                    st.json(l_res.json().get("trafficInformations", []))
+                except Exception as e:
+                    st.error(f"Fehler BLS-API: {e}")
+
+        st.write("**Upstream-Zustand (Circuit-Breaker):**")
+        st.json(get_source_health())
+        st.write("**HTTP-Cache (prozessweit):**")
+        st.json(get_http_cache_stats())
+        st.write("**Gemini-Cache (Modelle & Antworten):**")
+        st.json(get_gemini_cache_stats())
+        st.write("**Fahrzeit-Speicher (Google Maps):**")
+        st.json(get_travel_time_stats())
+        st.write("**RSS-Feeds (inkrementell, nur neue/geänderte Items ausgewertet):**")
+        st.json(get_feed_stats())
+        events = get_feed_events(20)
+        if events:
+            st.dataframe(pd.DataFrame(events[::-1]), use_container_width=True)
+
+    with tab4:
+        st.write("Latenz (ms) und Fehlerquote pro Stufe über die letzten 24 Stunden:")
+        metriken = get_metrics_summary(24)
+        if metriken.empty:
+            st.info("Noch keine Messungen vorhanden.")
+        else:
+            metriken["fehlerquote"] = (metriken["fehlerquote"] * 100).round(1)
+            st.dataframe(metriken.rename(columns={"fehlerquote": "fehler_%"}), use_container_width=True, hide_index=True)
 
 # --- 5. STATUS & CLOUD-INFO ---
 try:
     current_ws = st.secrets["connections"]["gsheets"]["worksheet"]
     st.success(f"✅ Cloud-Backup aktiv: Tab **'{current_ws}'**.")
+    backlog = get_gsheets_backlog()
+    if backlog:
+        st.warning(f"⏳ {backlog} Zeilen warten in der Outbox auf den nächsten Sheets-Sync.")
 except Exception:
     st.info("ℹ️ Cloud-Backup: Standard-Modus aktiv.")
 
 # --- 6. DYNAMISCHER AUTOREFRESH ---
 now = datetime.datetime.now(CH_TZ)
-seconds_past_interval = (now.minute % 5) * 60 + now.second
-seconds_to_wait = (300 - seconds_past_interval) + 10 
-
-if seconds_to_wait < 10:
-    seconds_to_wait += 300
+# Etwas später als der Collector neu laden, damit der neue Slot schon in der DB steht
+seconds_to_wait = seconds_until_next_ingest(now) + 20
 
 st_autorefresh(interval=seconds_to_wait * 1000, key="auto_sync_trigger")
-st.caption(f"Letztes Update: {now.strftime('%H:%M:%S')} | Nächstes Update in ~{int(seconds_to_wait)}s")
+st.caption(f"Datenstand: {live['timestamp'] or '–'} | Letztes Update: {now.strftime('%H:%M:%S')} | Nächstes Update in ~{int(seconds_to_wait)}s")
 
 # =====================================================================
 # --- 7. GEMINI LAGEBERICHT GANZ ZUM SCHLUSS LADEN (AUF KNOPFDRUCK) ---
@@ -154,11 +232,11 @@ with report_placeholder.container():
     if st.button("Lagebericht jetzt generieren", type="primary"):
         # Während Gemini rechnet, zeigen wir einen schicken Lade-Spinner
         with st.spinner("🤖 KI analysiert die Verkehrslage..."):
-            with sqlite3.connect(DB_NAME) as conn:
-                df_trend = pd.read_sql_query(
-                    "SELECT timestamp, station, minutes FROM stats ORDER BY timestamp DESC LIMIT 40", 
-                    conn
-                )
+            # Verlauf aus dem Ringpuffer des Prozess-Snapshots statt einer eigenen DB-Abfrage
+            df_trend = pd.DataFrame(
+                [(ts, station, minutes) for station, ring in get_recent_wait_times().items() for ts, minutes in ring],
+                columns=["timestamp", "station", "minutes"]
+            ).sort_values("timestamp", ascending=False).head(40)
             
             report = get_gemini_situation_report(data, df_trend)
             
@@ -167,3 +245,5 @@ with report_placeholder.container():
     else:
         # Standard-Ansicht, wenn der Button noch nicht geklickt wurde
         st.info("Klicke auf den Button oben, um eine aktuelle KI-Analyse der Verkehrslage zu erstellen.", icon="💡")
+
+record_metric("render:dashboard", (time.perf_counter() - render_start) * 1000)
@@ -0,0 +1,102 @@
+"""
+Offline-Benchmark für die Sperr-Erkennung: Genauigkeit und Latenz auf dem gelabelten Korpus
+(benchmarks/data/closure_corpus.json). "quelle" hält fest, ob ein Fall aus einem echten Feed erfasst
+("erfasst YYYY-MM-DD") oder von Hand geschrieben wurde; die Genauigkeit wird je Quelle ausgewiesen.
+
+    python benchmarks/closure_classifier.py            # nur lokaler Klassifikator
+    python benchmarks/closure_classifier.py --gemini   # inkl. Gemini-Fallback (braucht GEMINI_API_KEY in secrets.toml)
+    python benchmarks/closure_classifier.py --capture >> neu.json
+                                                       # aktuelle MGB/BLS-Meldungen als ungelabelte Fälle erfassen
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import time
+from types import SimpleNamespace
+from xml.sax.saxutils import escape
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import core  # noqa: E402
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "closure_corpus.json")
+
+
+def load_corpus(path=CORPUS):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def to_upstream_payload(case):
+    """Baut aus einem Korpus-Eintrag die Rohform, die der jeweilige Feed liefert."""
+    if case["operator"] == "furka":
+        items = "".join(f"<item><title>{escape(t)}</title><description></description></item>" for t in case["items"])
+        return SimpleNamespace(status_code=200, content=f"<rss><channel>{items}</channel></rss>".encode("utf-8"))
+    return {"trafficInformations": [{"title": t} for t in case["items"]]}
+
+
+def classify(case, use_gemini):
+    if not use_gemini:
+        return core.classify_closure(case["items"])
+    payload = to_upstream_payload(case)
+    if case["operator"] == "furka":
+        return core.classify_furka_status(payload)
+    return core.classify_loetschberg_status(payload)
+
+
+def run(use_gemini=False, repeat=200):
+    corpus = [case for case in load_corpus() if case["label"]]  # erfasst, aber noch nicht gelabelt: überspringen
+    rows, correct, low_conf = [], 0, 0
+    started = time.perf_counter()
+    for case in corpus:
+        t0 = time.perf_counter()
+        for _ in range(1 if use_gemini else repeat):
+            result = classify(case, use_gemini)
+        latency_ms = (time.perf_counter() - t0) * 1000 / (1 if use_gemini else repeat)
+        ok = result["decision"] == case["label"]
+        correct += ok
+        low_conf += result["confidence"] < core.CLASSIFIER_MIN_CONFIDENCE
+        rows.append((case["id"], case["label"], result["decision"], result["confidence"], latency_ms, ok))
+    total_s = time.perf_counter() - started
+
+    for case_id, label, decision, conf, latency_ms, ok in rows:
+        print(f"{'✅' if ok else '❌'} {case_id:<32} soll={label:<9} ist={decision:<9} conf={conf:.2f} {latency_ms:8.3f} ms")
+    print(f"\nGenauigkeit: {correct}/{len(corpus)} = {correct / len(corpus):.1%}")
+    for quelle in sorted({case["quelle"].split()[0] for case in corpus}):
+        hits = [row[-1] for case, row in zip(corpus, rows) if case["quelle"].split()[0] == quelle]
+        print(f"  davon {quelle}: {sum(hits)}/{len(hits)}")
+    print(f"Unsichere Fälle (-> Gemini): {low_conf}")
+    print(f"Ø Latenz: {sum(r[4] for r in rows) / len(rows):.3f} ms pro Snapshot, Gesamt {total_s:.2f}s")
+    return correct / len(corpus)
+
+
+def capture():
+    """Holt die Status-Feeds live und gibt jede Meldung als ungelabelten Fall aus (Label-Vorschlag = lokaler Klassifikator)."""
+    today = datetime.date.today().isoformat()
+    cases = []
+    for source, operator in (("mgb_furka", "furka"), ("bls_traffic", "loetschberg")):
+        response = core.fetch_source(source)
+        if response is None:
+            print(f"{source}: nicht erreichbar", file=sys.stderr)
+            continue
+        if operator == "furka":
+            items = [r["text"] for r in core.process_feed(source, response.content)]
+        else:
+            items = [n.get("title", "") for n in response.json().get("trafficInformations", [])]
+        for i, text in enumerate(items):
+            decision, confidence = core.classify_closure_item(text)
+            cases.append({"id": f"{operator}-{today}-{i}", "operator": operator, "quelle": f"erfasst {today}",
+                          "label": None, "vorschlag": decision, "konfidenz": confidence, "items": [text]})
+    print(json.dumps(cases, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark Sperr-Klassifikator")
+    parser.add_argument("--gemini", action="store_true", help="Unsichere Fälle wie im Betrieb an Gemini geben")
+    parser.add_argument("--capture", action="store_true", help="Live-Meldungen als ungelabelte Fälle ausgeben")
+    args = parser.parse_args()
+    if args.capture:
+        capture()
+    else:
+        run(use_gemini=args.gemini)
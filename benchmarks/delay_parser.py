@@ -0,0 +1,133 @@
+"""
+Regression und Durchsatz des Wartezeit-Parsers auf dem gelabelten Korpus
+(benchmarks/data/delay_messages.json) bzw. auf den echten raw_text-Werten einer DB.
+"quelle" hält fest, ob ein Fall aus einer DB exportiert ("erfasst ...") oder von Hand geschrieben wurde.
+
+Bestanden, wenn der Parser ohne Cache mindestens MIN_UNCACHED_RATIO des alten (nur deutschen) Parsers schafft
+und memoisiert schneller ist als dieser. Ohne Cache ist der mehrsprachige Parser bewusst langsamer (~0.6x):
+ein Regex-Durchgang über alle Bausteine statt weniger Substring-Vergleiche. Im Betrieb greift der Cache,
+weil dieselbe Meldung stundenlang im Feed steht.
+
+    python benchmarks/delay_parser.py                      # Korpus: Genauigkeit + Durchsatz
+    python benchmarks/delay_parser.py --db autoverlad.db   # Durchsatz auf echten Meldungen (mit Wiederholungen)
+    python benchmarks/delay_parser.py --export autoverlad.db > neu.json
+                                                           # unbekannte Meldungen zum Labeln exportieren
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import core  # noqa: E402
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "delay_messages.json")
+MIN_UNCACHED_RATIO = 0.5
+
+
+def load_corpus(path=CORPUS):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def legacy_parse_time_to_minutes(time_str):
+    """Bisheriger Parser (nur Deutsch), als Vergleichsbasis für den Durchsatz."""
+    if not time_str: return 0
+    text = time_str.lower()
+    mapping = {
+        "4 stunden": 240, "3 stunden 30 minuten": 210, "3 stunden": 180,
+        "2 stunden 30 minuten": 150, "2 stunden": 120, "1 stunde 30 minuten": 90,
+        "1 stunde": 60, "45 minuten": 45, "30 minuten": 30, "15 minuten": 15,
+        "keine wartezeit": 0, "no waiting": 0
+    }
+    for phrase, minutes in mapping.items():
+        if phrase in text: return minutes
+    total_min = 0
+    hour_match = re.search(r'(\d+)\s*stunde', text)
+    if hour_match: total_min += int(hour_match.group(1)) * 60
+    min_match = re.search(r'(?<!:)(\b\d+)\s*(?:min|minute)', text)
+    if min_match: total_min += int(min_match.group(1))
+    return total_min
+
+
+def db_messages(path):
+    with sqlite3.connect(path) as conn:
+        return [r[0] for r in conn.execute("SELECT raw_text FROM stats_full ORDER BY timestamp") if r[0]]
+
+
+def throughput(fn, texts, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for text in texts:
+            fn(text)
+    elapsed = time.perf_counter() - started
+    return repeat * len(texts) / elapsed if elapsed else float("inf")
+
+
+def report_throughput(texts, repeat):
+    uncached = core.parse_delay_message.__wrapped__
+    core.parse_delay_message.cache_clear()
+    rows = [("alt (nur DE)", throughput(legacy_parse_time_to_minutes, texts, repeat)),
+            ("neu, ohne Cache", throughput(uncached, texts, repeat)),
+            ("neu, memoisiert", throughput(core.parse_delay_message, texts, repeat))]
+    for name, rate in rows:
+        print(f"{name:<18} {rate:>12,.0f} Meldungen/s")
+    info = core.parse_delay_message.cache_info()
+    print(f"Cache: {info.hits} Treffer, {info.misses} Fehlgriffe, {info.currsize} Einträge")
+    legacy, uncached, cached = (rate for _, rate in rows)
+    ok = uncached >= MIN_UNCACHED_RATIO * legacy and cached > legacy
+    print(f"{'✅' if ok else '❌'} ohne Cache {uncached / legacy:.2f}x alt (Minimum {MIN_UNCACHED_RATIO}x), "
+          f"memoisiert {cached / legacy:.0f}x alt")
+    return ok
+
+
+def run_corpus(repeat=2000):
+    corpus = load_corpus()
+    correct = 0
+    for case in corpus:
+        info = core.parse_delay_message(case["text"])
+        expected = (case["minutes"], case["station"], case["direction"], case["wait"])
+        ok = (info.minutes, info.station, info.direction, info.wait) == expected
+        correct += ok
+        if not ok:
+            print(f"❌ {case['text']!r}: soll={'/'.join(map(str, expected))} "
+                  f"ist={info.minutes}/{info.station}/{info.direction}/{info.wait}")
+    print(f"Genauigkeit: {correct}/{len(corpus)} = {correct / len(corpus):.1%}")
+    for quelle in sorted({c["quelle"].split()[0] for c in corpus}):
+        print(f"  davon {quelle}: {sum(1 for c in corpus if c['quelle'].split()[0] == quelle)} Fälle")
+    print()
+    return correct == len(corpus) and report_throughput([c["text"] for c in corpus], repeat)
+
+
+def export_unlabelled(path):
+    """Gibt alle distinkten Meldungen der DB, die noch nicht im Korpus stehen, mit dem aktuellen Ergebnis als Label-Vorschlag aus."""
+    known = {c["text"] for c in load_corpus()}
+    seen, out = set(), []
+    for text in db_messages(path):
+        if text in known or text in seen:
+            continue
+        seen.add(text)
+        info = core.parse_delay_message(text)
+        out.append({"text": text, "minutes": info.minutes, "station": info.station, "direction": info.direction, "wait": info.wait,
+                    "quelle": f"erfasst {os.path.basename(path)}"})
+    # Gleiches Format wie der Korpus (ein Fall pro Zeile), zum direkten Übernehmen nach dem Prüfen
+    print("[\n" + ",\n".join("  " + json.dumps(case, ensure_ascii=False) for case in out) + "\n]")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark Wartezeit-Parser")
+    parser.add_argument("--db", help="Durchsatz auf den raw_text-Werten dieser SQLite-DB messen")
+    parser.add_argument("--export", metavar="DB", help="Ungelabelte Meldungen aus dieser DB als JSON ausgeben")
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+    if args.export:
+        export_unlabelled(args.export)
+    elif args.db:
+        texts = db_messages(args.db)
+        print(f"{len(texts)} Meldungen, davon {len(set(texts))} verschieden")
+        sys.exit(0 if report_throughput(texts, max(1, args.repeat // 100)) else 1)
+    else:
+        sys.exit(0 if run_corpus(args.repeat) else 1)
@@ -0,0 +1,208 @@
+"""
+Offline-End-to-End-Benchmark: alle Upstreams laufen gegen den lokalen Stub (benchmarks/upstream_stub.py),
+Sheets und Gemini gegen In-Process-Fakes, die DB liegt in einem Temp-Verzeichnis.
+
+    python benchmarks/e2e.py                                  # Standard: 10 Läufe, 30 ms Upstream-Latenz
+    python benchmarks/e2e.py --latency-ms 200 --fail-rate 0.2
+    python benchmarks/e2e.py --json vorher.json               # Ergebnis ablegen ...
+    python benchmarks/e2e.py --compare vorher.json            # ... und später gegen einen anderen Commit vergleichen
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.dirname(BENCH_DIR), BENCH_DIR]
+import core  # noqa: E402
+from upstream_stub import FakeGemini, FakeWorksheet, UpstreamStub  # noqa: E402
+
+SAMPLE_WAIT_TIMES = {"Realp": {"min": 45, "raw": "Wartezeit in Realp ca. 45 Minuten"},
+                     "Oberwald": {"min": 0, "raw": "Keine Wartezeit in Oberwald"},
+                     "Kandersteg": {"min": 30, "raw": "Wartezeit ca. 30 Minuten"},
+                     "Goppenstein": {"min": 0, "raw": "Keine Wartezeit"}}
+
+
+def reset_process_caches():
+    """Prozessweite Caches leeren, damit ein 'kalter' Lauf wirklich upstream geht."""
+    core._http_cache.clear()
+    core._feed_state.clear()
+    core._source_health.clear()
+    core._last_good.clear()
+    core._gemini_responses.clear()
+    core.parse_delay_message.cache_clear()
+    with core._snapshot_lock:
+        core._snapshot["state"] = None
+    with core._forecast_lock:
+        core._forecast["loaded"] = None
+    with core._chart_lock:
+        core._chart_cache["df"] = None
+
+
+class SlotClock:
+    """Ersetzt core.current_slot: jeder tick() ist ein neuer 5-Minuten-Slot, damit DB-Writes nicht ins Leere laufen."""
+
+    def __init__(self, start=None):
+        now = datetime.datetime.now(core.CH_TZ).replace(tzinfo=None, second=0, microsecond=0)
+        self.slot = start or now.replace(minute=now.minute // 5 * 5)
+
+    def tick(self):
+        self.slot += datetime.timedelta(minutes=5)
+
+    def __call__(self, now=None):
+        return self.slot.strftime('%Y-%m-%d %H:%M:%S')
+
+
+@contextlib.contextmanager
+def bench_environment(latency_ms, fail_rate, sheets_latency_ms, gemini_latency_ms):
+    saved = {name: getattr(core, name) for name in ("DB_NAME", "current_slot")}
+    stub, gemini = UpstreamStub(latency_ms=latency_ms, fail_rate=fail_rate), FakeGemini(latency_ms=gemini_latency_ms)
+    with tempfile.TemporaryDirectory() as tmp:
+        core.DB_NAME = os.path.join(tmp, "bench.db")
+        clock = SlotClock()
+        core.current_slot = clock
+        # Restore-Quelle (ein Tag Historie) und Sync-Ziel als Fake-Worksheets
+        history = [core.GSHEETS_COLUMNS] + [
+            [(clock.slot - datetime.timedelta(minutes=5 * i)).strftime('%Y-%m-%d %H:%M:%S'), station, 10 + i % 30, ""]
+            for i in range(288, 0, -1) for station in SAMPLE_WAIT_TIMES]
+        core._gsheets_worksheets["Sheet1"] = FakeWorksheet(history, latency_ms=sheets_latency_ms)
+        core._gsheets_worksheets["Development"] = FakeWorksheet([core.GSHEETS_COLUMNS], latency_ms=sheets_latency_ms)
+        stub.start().install()
+        gemini.install()
+        try:
+            core.init_db()
+            yield {"stub": stub, "gemini": gemini, "clock": clock}
+        finally:
+            gemini.uninstall()
+            stub.stop()
+            core._gsheets_worksheets.clear()
+            reset_process_caches()
+            for name, value in saved.items():
+                setattr(core, name, value)
+
+
+def decision_page(start="Buchrain"):
+    """Rechenweg der Winter-Entscheidungshilfe ohne Streamlit: Status, Maps, Fahrplan, Prognose, Planer."""
+    jetzt = datetime.datetime.now(core.CH_TZ).replace(tzinfo=None)
+    live = core.get_latest_state()
+    strecken = {"anfahrt_f": [start, "Autoverlad Realp"], "anfahrt_l": [start, "Autoverlad Kandersteg"]}
+    if live["furka_aktiv"]: strecken["ziel_f"] = ["Oberwald", "Ried-Mörel"]
+    if live["loetschberg_aktiv"]: strecken["ziel_l"] = ["Goppenstein", "Ried-Mörel"]
+    dauer = core.get_google_maps_durations(strecken)
+    totals = {}
+    for key, route, station, zug in (("f", "furka", "Realp", 25), ("l", "loetschberg", "Kandersteg", 20)):
+        ankunft = jetzt + datetime.timedelta(minutes=dauer[f"anfahrt_{key}"])
+        naechster = core.next_departure(route, ankunft)
+        if naechster and f"ziel_{key}" in dauer:
+            warte = max(int((naechster - ankunft).total_seconds() // 60), core.forecast_wait(station, ankunft))
+            totals[route] = dauer[f"anfahrt_{key}"] + warte + zug + dauer[f"ziel_{key}"]
+    plan = core.plan_best_departures(start, live, step_min=15)
+    return totals, len(plan)
+
+
+def scenarios(env):
+    clock = env["clock"]
+
+    def cold(fn):
+        def run():
+            reset_process_caches()
+            return fn()
+        return run
+
+    def next_slot(fn):
+        def run():
+            clock.tick()
+            return fn()
+        return run
+
+    def status_checks():
+        return core.get_furka_status(), core.get_loetschberg_status(), core.get_pass_status()
+
+    return [
+        ("fetch_all_data (kalt)", cold(next_slot(core.fetch_all_data))),
+        ("fetch_all_data (warm)", next_slot(core.fetch_all_data)),
+        ("status_checks (kalt)", cold(status_checks)),
+        ("ingest_cycle (kalt)", cold(next_slot(core.ingest_cycle))),
+        ("db_write", next_slot(lambda: core.save_to_db(SAMPLE_WAIT_TIMES))),
+        ("sheets_sync", next_slot(lambda: core.save_to_google_sheets(SAMPLE_WAIT_TIMES))),
+        ("decision_page (kalt)", cold(decision_page)),
+        ("decision_page (warm)", decision_page),
+    ]
+
+
+def summarize(timings):
+    ordered = sorted(timings)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    return {"n": len(ordered), "median_ms": round(statistics.median(ordered), 2), "p95_ms": round(p95, 2),
+            "min_ms": round(ordered[0], 2), "mean_ms": round(statistics.fmean(ordered), 2)}
+
+
+def git_revision():
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True).stdout.strip()
+        return rev + ("-dirty" if dirty else "")
+    except Exception:
+        return "unbekannt"
+
+
+def run(repeat=10, latency_ms=30, fail_rate=0.0, sheets_latency_ms=50, gemini_latency_ms=300, warmup=1):
+    config = {"repeat": repeat, "latency_ms": latency_ms, "fail_rate": fail_rate,
+              "sheets_latency_ms": sheets_latency_ms, "gemini_latency_ms": gemini_latency_ms}
+    results = {}
+    with bench_environment(latency_ms, fail_rate, sheets_latency_ms, gemini_latency_ms) as env:
+        for name, fn in scenarios(env):
+            for _ in range(warmup):
+                fn()
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                fn()
+                timings.append((time.perf_counter() - started) * 1000)
+            results[name] = summarize(timings)
+        upstream_requests = dict(env["stub"].requests)
+        gemini_calls = env["gemini"].calls
+    return {"revision": git_revision(), "python": platform.python_version(), "config": config,
+            "results": results, "upstream_requests": upstream_requests, "gemini_calls": gemini_calls}
+
+
+def print_report(report, baseline=None):
+    print(f"Revision {report['revision']} | Python {report['python']} | {json.dumps(report['config'])}")
+    if baseline:
+        print(f"Vergleich mit {baseline['revision']} ({json.dumps(baseline['config'])})")
+    print(f"{'Szenario':<24}{'Median':>10}{'P95':>10}{'Min':>10}" + ("   Δ Median" if baseline else ""))
+    for name, r in report["results"].items():
+        line = f"{name:<24}{r['median_ms']:>9.1f}ms{r['p95_ms']:>8.1f}ms{r['min_ms']:>8.1f}ms"
+        old = (baseline or {}).get("results", {}).get(name)
+        if old and old["median_ms"]:
+            line += f"   {(r['median_ms'] - old['median_ms']) / old['median_ms']:+7.1%}"
+        print(line)
+    print(f"Upstream-Requests: {report['upstream_requests']} | Gemini-Aufrufe: {report['gemini_calls']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline-End-to-End-Benchmark")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=30)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--sheets-latency-ms", type=float, default=50)
+    parser.add_argument("--gemini-latency-ms", type=float, default=300)
+    parser.add_argument("--json", help="Ergebnis als JSON speichern")
+    parser.add_argument("--compare", help="JSON eines früheren Laufs zum Vergleich")
+    args = parser.parse_args()
+    report = run(args.repeat, args.latency_ms, args.fail_rate, args.sheets_latency_ms, args.gemini_latency_ms)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
@@ -0,0 +1,79 @@
+"""
+Saison-Auswertung aus dem Parquet-Export vs. direkt aus SQLite, auf einer synthetischen Historie
+(5-Minuten-Raster, 4 Stationen) in einem Temp-Verzeichnis.
+
+    python benchmarks/history_read.py                 # 180 Tage, Auswertung über 3 Monate
+    python benchmarks/history_read.py --days 365 --months 6
+"""
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import core  # noqa: E402
+
+STATIONS = ("Realp", "Oberwald", "Kandersteg", "Goppenstein")
+MESSAGES = ["Keine Wartezeit"] + [f"Wartezeit ca. {m} Minuten" for m in (15, 30, 45, 60, 90)]
+
+
+def synthetic_rows(start, days):
+    for slot in range(days * 288):
+        ts = (start + datetime.timedelta(minutes=5 * slot)).strftime(core.HISTORY_TS_FORMAT)
+        for i, station in enumerate(STATIONS):
+            message = MESSAGES[(slot // 12 + i) % len(MESSAGES)]
+            yield ts, station, core.parse_time_to_minutes(message), message
+
+
+def timed_ms(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - started) * 1000
+
+
+def run(days=180, months=3):
+    saved = core.DB_NAME, core.restore_from_gsheets
+    with tempfile.TemporaryDirectory() as tmp:
+        core.DB_NAME = os.path.join(tmp, "bench.db")
+        core.restore_from_gsheets = lambda conn, hours=None: None  # leere DB, kein Cloud-Restore
+        try:
+            core.init_db()
+            now = core.CH_TZ.localize(datetime.datetime.now().replace(hour=12, minute=0, second=0, microsecond=0))
+            first_day = (now - datetime.timedelta(days=days)).replace(tzinfo=None, hour=0)
+            with core.db_connect() as conn:
+                core.insert_stats(conn, list(synthetic_rows(first_day, days)))
+            directory = os.path.join(tmp, "history")
+            # Erst-Export am Stück (im Betrieb gedeckelt auf HISTORY_EXPORT_MAX_DAYS pro Zyklus)
+            export, export_ms = timed_ms(lambda: core.export_history(directory, now=now, max_days=days + 1))
+            _, noop_ms = timed_ms(lambda: core.export_history(directory, now=now))
+            size = sum(os.path.getsize(os.path.join(d, f)) for d, _, fs in os.walk(directory) for f in fs)
+
+            start = (now - datetime.timedelta(days=30 * months)).replace(tzinfo=None, hour=0)
+            end = now.replace(tzinfo=None, hour=0)
+            parquet, parquet_ms = timed_ms(lambda: core.read_history(start, end, columns=["station", "minutes"]))
+
+            def from_sqlite():
+                import pandas as pd
+                with core.db_connect() as conn:
+                    return pd.read_sql_query("SELECT station, minutes FROM stats_full WHERE timestamp >= ? AND timestamp < ?",
+                                             conn, params=(start.strftime(core.HISTORY_TS_FORMAT), end.strftime(core.HISTORY_TS_FORMAT)))
+            sqlite, sqlite_ms = timed_ms(from_sqlite)
+            agg, agg_ms = timed_ms(lambda: parquet.groupby("station", observed=True)["minutes"].describe())
+        finally:
+            core.DB_NAME, core.restore_from_gsheets = saved
+    print(f"Export: {len(export['partitions'])} Partitionen, {export['rows']:,} Zeilen in {export_ms:.0f} ms "
+          f"({size / 1e6:.1f} MB); erneuter Aufruf ohne geänderten Tag: {noop_ms:.1f} ms")
+    print(f"{months} Monate lesen (station, minutes): Parquet {parquet_ms:.0f} ms ({len(parquet):,} Zeilen) | "
+          f"SQLite {sqlite_ms:.0f} ms ({len(sqlite):,} Zeilen)")
+    print(f"Auswertung pro Station: {agg_ms:.0f} ms\n{agg.round(1)}")
+    return {"export_ms": export_ms, "parquet_ms": parquet_ms, "sqlite_ms": sqlite_ms, "rows": len(parquet)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark Parquet-Historie")
+    parser.add_argument("--days", type=int, default=180)
+    parser.add_argument("--months", type=int, default=3)
+    args = parser.parse_args()
+    run(args.days, args.months)
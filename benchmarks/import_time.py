@@ -0,0 +1,70 @@
+"""
+Kalte Importzeit von core (ohne UI) und logic (Streamlit-Adapter), jeweils in einem frischen Interpreter.
+Schlägt fehl, wenn core über dem Budget liegt oder einen der schweren Clients schon beim Import lädt.
+
+    python benchmarks/import_time.py                  # 5 Läufe pro Modul
+    python benchmarks/import_time.py --budget-ms 120  # strengeres Budget, z.B. in CI
+    python benchmarks/import_time.py --top 15         # teuerste Importe von core (python -X importtime)
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORE_IMPORT_BUDGET_MS = 200  # gemessen ~95 ms (Median), Rest ist Reserve für langsame CI-Maschinen
+# Dürfen erst beim ersten Gebrauch geladen werden
+LAZY_MODULES = ("numpy", "pandas", "pyarrow", "requests", "streamlit", "streamlit_gsheets", "google.generativeai", "gspread")
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = (time.perf_counter() - started) * 1000
+print(json.dumps({{"ms": elapsed, "loaded": [m for m in {lazy!r} if m in sys.modules]}}))
+"""
+
+
+def cold_import(module):
+    """Importiert `module` in einem neuen Prozess; gibt Dauer (ms) und bereits geladene schwere Module zurück."""
+    out = subprocess.run([sys.executable, "-c", PROBE.format(module=module, lazy=LAZY_MODULES)],
+                         cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def measure(module, repeat=5):
+    runs = [cold_import(module) for _ in range(repeat)]
+    timings = [r["ms"] for r in runs]
+    return {"module": module, "median_ms": round(statistics.median(timings), 1), "min_ms": round(min(timings), 1),
+            "loaded": sorted(set().union(*(r["loaded"] for r in runs)))}
+
+
+def top_imports(module, n=10):
+    """Die n teuersten Einzelimporte laut python -X importtime (kumuliert, in ms)."""
+    err = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                         cwd=ROOT, capture_output=True, text=True, check=True).stderr
+    rows = []
+    for line in err.splitlines()[1:]:
+        parts = line.split("|")
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            rows.append((int(parts[1]) / 1000, parts[2].rstrip()))
+    return sorted(rows, reverse=True)[:n]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark Importzeit")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=CORE_IMPORT_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=0, help="Teuerste Importe von core anzeigen")
+    args = parser.parse_args()
+    results = [measure("core", args.repeat), measure("logic", args.repeat)]
+    for r in results:
+        print(f"{r['module']:<8}{r['median_ms']:>9.1f} ms (min {r['min_ms']:.1f})   schwer geladen: {', '.join(r['loaded']) or '–'}")
+    for ms, name in top_imports("core", args.top) if args.top else []:
+        print(f"{ms:>9.1f} ms {name}")
+    core_result = results[0]
+    if core_result["loaded"] or core_result["median_ms"] > args.budget_ms:
+        print(f"❌ core über Budget ({args.budget_ms:.0f} ms) oder lädt schwere Clients beim Import")
+        sys.exit(1)
@@ -0,0 +1,211 @@
+"""
+Lokale Stand-ins für alle Upstreams, damit Benchmarks ohne Netz und ohne Secrets laufen:
+
+- UpstreamStub: HTTP-Server auf 127.0.0.1, spielt die aufgezeichneten Payloads aus
+  benchmarks/data/upstream/ ab (inkl. ETag/304) und beantwortet Distance-Matrix-Anfragen.
+  Latenz und Fehlerquote (HTTP 503) sind einstellbar, auch pro Quelle.
+- FakeWorksheet: gspread-Worksheet im Speicher (append_rows, get, col_values).
+- FakeGemini: ersetzt list_models/GenerativeModel von google.generativeai.
+"""
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import core  # noqa: E402
+
+PAYLOADS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "upstream")
+CONTENT_TYPES = {".json": "application/json", ".xml": "application/rss+xml"}
+
+
+class UpstreamStub:
+    def __init__(self, latency_ms=0, fail_rate=0.0, source_latency_ms=None, seed=0, payload_dir=PAYLOADS):
+        self.latency_ms = latency_ms
+        self.fail_rate = fail_rate
+        self.source_latency_ms = dict(source_latency_ms or {})
+        self.payloads = {}
+        for filename in os.listdir(payload_dir):
+            name, ext = os.path.splitext(filename)
+            with open(os.path.join(payload_dir, filename), "rb") as f:
+                body = f.read()
+            self.payloads[name] = (body, CONTENT_TYPES.get(ext, "application/octet-stream"),
+                                   '"%s"' % hashlib.sha1(body).hexdigest()[:16])
+        self.requests = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._restore = []
+
+    # --- Server ---
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub._handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="upstream-stub", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.uninstall()
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start().install()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def _handle(self, req):
+        url = urlparse(req.path)
+        name = url.path.strip("/").split("/")[-1]
+        with self._lock:
+            self.requests[name] = self.requests.get(name, 0) + 1
+            fail = self._random.random() < self.fail_rate
+        time.sleep(self.source_latency_ms.get(name, self.latency_ms) / 1000)
+        if fail:
+            return self._send(req, 503, b"Service Unavailable", "text/plain")
+        if name == "maps":
+            return self._send(req, 200, json.dumps(self._distance_matrix(parse_qs(url.query))).encode(), "application/json")
+        if name not in self.payloads:
+            return self._send(req, 404, b"Not Found", "text/plain")
+        body, content_type, etag = self.payloads[name]
+        if req.headers.get("If-None-Match") == etag:
+            return self._send(req, 304, b"", content_type, etag)
+        return self._send(req, 200, body, content_type, etag)
+
+    @staticmethod
+    def _send(req, status, body, content_type, etag=None):
+        req.send_response(status)
+        req.send_header("Content-Type", content_type)
+        req.send_header("Content-Length", str(len(body)))
+        if etag:
+            req.send_header("ETag", etag)
+        req.end_headers()
+        req.wfile.write(body)
+
+    @staticmethod
+    def _distance_matrix(query):
+        # Deterministische Fahrzeiten (30-120 Min) je Paar, damit Läufe vergleichbar bleiben
+        origins = query.get("origins", [""])[0].split("|")
+        destinations = query.get("destinations", [""])[0].split("|")
+        rows = []
+        for o in origins:
+            elements = []
+            for d in destinations:
+                seconds = 1800 + int(hashlib.sha1(f"{o}|{d}".encode()).hexdigest(), 16) % 5400
+                elements.append({"status": "OK", "duration": {"value": seconds}, "duration_in_traffic": {"value": seconds}})
+            rows.append({"elements": elements})
+        return {"status": "OK", "rows": rows}
+
+    # --- core.py auf den Stub umbiegen ---
+    def install(self):
+        for name, source in core.FEED_SOURCES.items():
+            self._patch(source, "url", f"{self.base_url}/feed/{name}")
+        self._patch(core, "MAPS_URL", f"{self.base_url}/maps")
+        return self
+
+    def uninstall(self):
+        while self._restore:
+            target, attr, value = self._restore.pop()
+            if isinstance(target, dict): target[attr] = value
+            else: setattr(target, attr, value)
+
+    def _patch(self, target, attr, value):
+        if isinstance(target, dict):
+            self._restore.append((target, attr, target[attr]))
+            target[attr] = value
+        else:
+            self._restore.append((target, attr, getattr(target, attr)))
+            setattr(target, attr, value)
+
+
+class FakeWorksheet:
+    """Minimaler gspread-Ersatz für Outbox-Sync und Restore."""
+
+    def __init__(self, rows=None, latency_ms=0):
+        self.rows = [list(r) for r in (rows or [])]
+        self.latency_ms = latency_ms
+        self.calls = 0
+
+    def _call(self):
+        self.calls += 1
+        time.sleep(self.latency_ms / 1000)
+
+    @property
+    def row_count(self):
+        return len(self.rows)
+
+    def col_values(self, col):
+        self._call()
+        return [r[col - 1] for r in self.rows if len(r) >= col]
+
+    def append_row(self, row, **kwargs):
+        self._call()
+        self.rows.append(list(row))
+
+    def append_rows(self, rows, **kwargs):
+        self._call()
+        self.rows.extend(list(r) for r in rows)
+
+    def get(self, a1):
+        self._call()
+        start, end = a1.split(":")
+        width = ord(end[0]) - ord(start[0]) + 1
+        return [row[:width] for row in self.rows[int(start[1:]) - 1:int(end[1:])]]
+
+
+class FakeGemini:
+    """Ersetzt die google.generativeai-Aufrufe; jede Antwort kostet `latency_ms`."""
+
+    def __init__(self, answer="OFFEN", latency_ms=0):
+        self.answer = answer
+        self.latency_ms = latency_ms
+        self.calls = 0
+        self._restore = []
+
+    def install(self):
+        fake = self
+
+        class Model:
+            def __init__(self, name):
+                self.name = name
+
+            def generate_content(self, prompt):
+                fake.calls += 1
+                time.sleep(fake.latency_ms / 1000)
+                return type("Response", (), {"text": fake.answer})()
+
+        model_info = type("ModelInfo", (), {"name": "models/gemini-1.5-flash", "supported_generation_methods": ["generateContent"]})
+        genai = core._genai()
+        for attr, value in (("configure", lambda **kw: None), ("list_models", lambda: [model_info()]),
+                            ("GenerativeModel", Model)):
+            self._restore.append((attr, getattr(genai, attr)))
+            setattr(genai, attr, value)
+        return self
+
+    def uninstall(self):
+        genai = core._genai()
+        while self._restore:
+            attr, value = self._restore.pop()
+            setattr(genai, attr, value)
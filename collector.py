@@ -0,0 +1,60 @@
+"""
+Headless Collector: holt alle 5 Minuten die Upstream-Feeds, schreibt Wartezeiten und Status
+in die SQLite-DB und synchronisiert Google Sheets. Dashboard und Entscheidungshilfen lesen nur noch.
+
+Start:  python collector.py          (Endlosschleife im 5-Minuten-Raster)
+        python collector.py --once   (ein einzelner Durchgang, z.B. für cron)
+
+Ohne eigenen Worker (z.B. Streamlit Cloud): EMBEDDED_COLLECTOR = true in .streamlit/secrets.toml,
+dann startet logic.py den Collector als Daemon-Thread im Server-Prozess (standardmässig aus).
+"""
+import argparse
+import threading
+import time
+import datetime
+
+from core import init_db, ingest_cycle, seconds_until_next_ingest, subscribe_feed_events, CH_TZ
+
+
+def run_once():
+    started = time.perf_counter()
+    live = ingest_cycle()
+    now = datetime.datetime.now(CH_TZ).strftime('%H:%M:%S')
+    print(f"[{now}] Ingestion fertig in {time.perf_counter() - started:.2f}s: "
+          f"{len(live['wait_times'])} Stationen, Furka {'offen' if live['furka_aktiv'] else 'ZU'}, "
+          f"Lötschberg {'offen' if live['loetschberg_aktiv'] else 'ZU'}")
+    return live
+
+
+def log_feed_event(event):
+    # Nur neue, geänderte oder verschwundene Feed-Meldungen landen im Log
+    print(f"[Feed {event['source']}] {event['kind']}: {event['title']}")
+
+
+def run_forever(stop_event=None):
+    stop_event = stop_event or threading.Event()
+    init_db()
+    subscribe_feed_events(log_feed_event)
+    while not stop_event.is_set():
+        try: run_once()
+        except Exception as e: print(f"Collector Fehler: {e}")
+        stop_event.wait(seconds_until_next_ingest())
+
+
+def start_background_collector():
+    """Startet den Collector als Daemon-Thread im laufenden Prozess (z.B. Streamlit Cloud ohne eigenen Worker)."""
+    stop_event = threading.Event()
+    thread = threading.Thread(target=run_forever, args=(stop_event,), name="autoverlad-collector", daemon=True)
+    thread.start()
+    return stop_event
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Autoverlad Collector")
+    parser.add_argument("--once", action="store_true", help="Nur einen Durchgang ausführen")
+    args = parser.parse_args()
+    if args.once:
+        init_db()
+        run_once()
+    else:
+        run_forever()
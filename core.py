@@ -0,0 +1,2077 @@
+"""
+Kern des Autoverlad Monitors ohne UI-Abhängigkeit: Parsing, Fahrplan, Speicher, Routing und Ingestion.
+Schwere Clients (pandas, Gemini, Google Sheets) werden erst beim ersten Gebrauch importiert, damit Collector,
+CLI und Tests schnell starten. Die Streamlit-Anbindung (Secrets, Meldungen) liegt in logic.py.
+"""
+import xml.etree.ElementTree as ET
+import io
+import os
+import re
+import math
+import sqlite3
+import json
+import hashlib
+import unicodedata
+import threading
+from functools import lru_cache
+from contextlib import contextmanager
+import time
+from bisect import bisect_left
+from itertools import groupby
+from collections import defaultdict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+import tomllib
+import datetime
+import pytz
+
+# Konstanten
+DB_NAME = 'autoverlad.db'
+CH_TZ = pytz.timezone('Europe/Zurich')
+
+BLS_DELAYS_URL = "https://www.bls.ch/api/avwV2/delays?dataSourceId={808904A8-0874-44AC-8DE3-4A5FC33D8CF1}"
+BLS_TRAFFIC_URL = "https://www.bls.ch/api/TrafficInformation/GetNewNotifications?sc_lang=de&sc_site=internet-bls"
+MGB_FURKA_RSS_URL = "https://mgb-prod.oevfahrplan.ch/incident-manager-api/incidentmanager/rss?publicId=av_furka&lang=de"
+ALPEN_PAESSE_RSS_URL = "https://www.alpen-paesse.ch/de/alpenpaesse/status.rss"
+HTTP_TIMEOUT = 10
+BROWSER_HEADERS = {'User-Agent': 'Mozilla/5.0'}
+
+# Alle Upstream-Feeds: Name -> URL + Header + Cache-TTL (Sekunden). Jeder Feed wird pro Zyklus genau einmal geholt.
+FEED_SOURCES = {
+    "bls_delays": {"url": BLS_DELAYS_URL, "headers": BROWSER_HEADERS, "ttl": 60},
+    "bls_traffic": {"url": BLS_TRAFFIC_URL, "headers": BROWSER_HEADERS, "ttl": 60},
+    "mgb_furka": {"url": MGB_FURKA_RSS_URL, "headers": {}, "ttl": 60},
+    "alpen_paesse": {"url": ALPEN_PAESSE_RSS_URL, "headers": {}, "ttl": 600},
+}
+WAIT_TIME_SOURCES = ("bls_delays", "mgb_furka")
+STATUS_SOURCES = ("bls_traffic", "mgb_furka", "alpen_paesse")
+
+# Ingestion-Raster: alle 5 Minuten, 10 s nach dem Slot-Beginn
+INGEST_INTERVAL = 300
+INGEST_OFFSET = 10
+
+# --- KONFIGURATION (INJIZIERBAR) ---
+# Reihenfolge: per configure() gesetzte Werte -> Provider (z.B. st.secrets), ohne Provider secrets.toml -> Default
+SECRETS_PATHS = (os.path.join(os.path.expanduser("~"), ".streamlit", "secrets.toml"),
+                 os.path.join(".streamlit", "secrets.toml"))
+
+_config = {"settings": {}, "provider": None, "notify": None, "gsheets_opener": None, "secrets": None}
+
+def configure(settings=None, provider=None, notify=None, gsheets_opener=None):
+    """
+    Injiziert die Laufzeit-Konfiguration. settings: feste Werte; provider(key): Lookup, der bei fehlendem
+    Schlüssel wirft; notify(level, text): Kanal für Meldungen an die UI; gsheets_opener(sheet_name): Worksheet.
+    """
+    if settings is not None: _config["settings"] = dict(settings)
+    if provider is not None: _config["provider"] = provider
+    if notify is not None: _config["notify"] = notify
+    if gsheets_opener is not None:
+        _config["gsheets_opener"] = gsheets_opener
+        _gsheets_worksheets.clear()
+
+def _secrets_file():
+    # Gleiche Datei, die auch st.secrets liest; Projekt-Datei überschreibt die globale
+    if _config["secrets"] is None:
+        secrets = {}
+        for path in SECRETS_PATHS:
+            try:
+                with open(path, "rb") as f:
+                    secrets.update(tomllib.load(f))
+            except (OSError, tomllib.TOMLDecodeError):
+                pass
+        _config["secrets"] = secrets
+    return _config["secrets"]
+
+def get_setting(key, default=None):
+    """Liest einen Konfigurationswert; ohne Eintrag gilt der Default."""
+    if key in _config["settings"]:
+        return _config["settings"][key]
+    if _config["provider"] is not None:
+        try: return _config["provider"](key)
+        except Exception: return default
+    return _secrets_file().get(key, default)
+
+def notify(level, text):
+    """Meldung an die UI (info/warning/error); ohne UI nur ins Log."""
+    if _config["notify"] is not None:
+        try: return _config["notify"](level, text)
+        except Exception: pass
+    print(f"[{level}] {text}")
+
+def get_worksheet_name(default):
+    return (get_setting("connections") or {}).get("gsheets", {}).get("worksheet", default)
+
+def current_slot(now=None):
+    """Beginn des aktuellen 5-Minuten-Slots als Schweizer Lokalzeit-String (Format der stats-Tabelle)."""
+    now = now or datetime.datetime.now(CH_TZ)
+    return now.replace(minute=(now.minute // 5) * 5, second=0, microsecond=0).strftime('%Y-%m-%d %H:%M:%S')
+
+# --- ZENTRALE ROBUSTE KI-LOGIK MIT FREUNDLICHER FEHLERMELDUNG ---
+
+GEMINI_MODEL_LIST_TTL = 6 * 3600
+GEMINI_RESPONSE_TTL = 3600
+GEMINI_PREFERRED_ORDER = ['gemini-1.5-flash', 'gemini-2.0-flash', 'gemini-pro']
+
+_gemini_lock = threading.Lock()
+_gemini_models = {"api_key": None, "models": None, "fetched": 0.0}
+_gemini_responses = {}
+_gemini_stats = {"hits": 0, "misses": 0, "model_refreshes": 0}
+
+def _genai():
+    # Erst beim ersten KI-Aufruf laden (~1 s Importzeit)
+    import google.generativeai as genai
+    return genai
+
+def get_gemini_models():
+    """Priorisierte Modell-Liste; configure/list_models laufen nur beim ersten Aufruf und danach alle 6 h."""
+    genai = _genai()
+    api_key = get_setting("GEMINI_API_KEY")
+    with _gemini_lock:
+        if _gemini_models["api_key"] != api_key:
+            genai.configure(api_key=api_key)
+            _gemini_models.update(api_key=api_key, models=None)
+        if _gemini_models["models"] is None or time.monotonic() - _gemini_models["fetched"] > GEMINI_MODEL_LIST_TTL:
+            # Dynamische Modellsuche
+            available_models = [m.name for m in genai.list_models() if 'generateContent' in m.supported_generation_methods]
+            models_to_try = []
+            for pref in GEMINI_PREFERRED_ORDER:
+                found = [m for m in available_models if pref in m]
+                models_to_try.extend(found)
+            _gemini_models.update(models=models_to_try or available_models, fetched=time.monotonic())
+            _gemini_stats["model_refreshes"] += 1
+        return list(_gemini_models["models"])
+
+def _forget_gemini_model(model_name):
+    with _gemini_lock:
+        if _gemini_models["models"] and model_name in _gemini_models["models"]:
+            _gemini_models["models"].remove(model_name)
+
+def get_gemini_cache_stats():
+    with _gemini_lock:
+        return dict(_gemini_stats, cached_responses=len(_gemini_responses))
+
+def generate_content_with_fallback(prompt):
+    # Gleicher Prompt (= gleiche Feed- bzw. Routendaten) innerhalb der TTL -> gespeicherte Antwort, kein API-Call
+    key = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    now = time.monotonic()
+    with _gemini_lock:
+        cached = _gemini_responses.get(key)
+        if cached and now - cached[0] < GEMINI_RESPONSE_TTL:
+            _gemini_stats["hits"] += 1
+            return cached[1]
+        _gemini_stats["misses"] += 1
+    with timed("gemini") as outcome:
+        text, ok = _generate_content_uncached(prompt)
+        outcome["ok"] = ok
+    if ok:
+        with _gemini_lock:
+            for k in [k for k, (t, _) in _gemini_responses.items() if now - t >= GEMINI_RESPONSE_TTL]:
+                del _gemini_responses[k]
+            _gemini_responses[key] = (now, text)
+    return text
+
+def _generate_content_uncached(prompt):
+    """Gibt (Text, ok) zurück; Fehlermeldungen (ok=False) werden nicht gecacht."""
+    try:
+        models_to_try = get_gemini_models()
+
+        last_error = ""
+        for model_name in models_to_try:
+            try:
+                model = _genai().GenerativeModel(model_name)
+                response = model.generate_content(prompt)
+                return response.text, True
+            except Exception as e:
+                last_error = str(e)
+                # Falls das Limit erreicht ist (429), sofort die schöne Meldung zurückgeben
+                if "429" in last_error:
+                    return "🤖 Der KI-Lagebericht macht gerade ein kurzes Päuseli (Limit erreicht). Die Daten unten sind aber aktuell! ✅", False
+                
+                # Bei anderen Fehlern (z.B. 404) nächstes Modell versuchen und das Modell aus der Liste nehmen
+                if any(x in last_error.lower() for x in ["404", "not found"]):
+                    _forget_gemini_model(model_name)
+                    continue
+                else:
+                    break
+        
+        # Wenn alle Modelle durchprobiert wurden oder ein unbekannter Fehler auftrat
+        return "🤖 Der KI-Lagebericht macht gerade ein kurzes Päuseli. Die Live-Daten unten sind aber aktuell! ✅", False
+
+    except Exception as e:
+        # Falls die API-Konfiguration selbst wegen Quota scheitert
+        if "429" in str(e):
+            return "🤖 Der KI-Lagebericht macht gerade ein kurzes Päuseli (Limit erreicht). Die Daten unten sind aber aktuell! ✅", False
+        return "🤖 Lagebericht aktuell nicht verfügbar. Die Live-Daten unten sind aber aktuell! ✅", False
+
+# --- DATENBANK & FETCH LOGIK (UNVERÄNDERT) ---
+
+def db_connect():
+    """SQLite-Verbindung mit Busy-Timeout, damit Leser und Collector sich im WAL-Modus nicht blockieren."""
+    conn = sqlite3.connect(DB_NAME, timeout=10)
+    conn.execute("PRAGMA busy_timeout = 10000")
+    return conn
+
+# --- METRIKEN: LATENZ & FEHLER PRO STUFE ---
+METRICS_RETENTION_DAYS = 7
+METRICS_FLUSH_AT = 200          # Puffer-Grösse, ab der sofort geschrieben wird
+METRICS_FLUSH_INTERVAL_S = 60   # sonst höchstens einmal pro Minute ein Batch
+
+_metrics_lock = threading.Lock()
+_metrics_buffer = []
+_metrics_flushed = {"at": time.monotonic()}
+
+def record_metric(stage, ms, ok=True):
+    """Merkt sich eine Messung im Speicher; geschrieben wird gebündelt (siehe flush_metrics)."""
+    with _metrics_lock:
+        _metrics_buffer.append((int(time.time()), stage, round(ms, 1), int(bool(ok))))
+        due = len(_metrics_buffer) >= METRICS_FLUSH_AT or time.monotonic() - _metrics_flushed["at"] >= METRICS_FLUSH_INTERVAL_S
+    if due:
+        flush_metrics()
+
+@contextmanager
+def timed(stage):
+    """
+    Misst Dauer und Ausgang eines Abschnitts. Exceptions zählen als Fehler und werden weitergereicht;
+    mit outcome["ok"] = False lässt sich ein Fehler ohne Exception markieren (z.B. HTTP 5xx).
+    """
+    outcome = {"ok": True}
+    started = time.perf_counter()
+    try:
+        yield outcome
+    except Exception:
+        outcome["ok"] = False
+        raise
+    finally:
+        record_metric(stage, (time.perf_counter() - started) * 1000, outcome["ok"])
+
+def flush_metrics():
+    with _metrics_lock:
+        rows = list(_metrics_buffer)
+        _metrics_buffer.clear()
+        _metrics_flushed["at"] = time.monotonic()
+    if not rows or not os.path.exists(DB_NAME):
+        return 0  # Metriken legen nie selbst eine DB an
+    try:
+        with db_connect() as conn:
+            conn.executemany("INSERT INTO metrics VALUES (?, ?, ?, ?)", rows)
+            conn.execute("DELETE FROM metrics WHERE ts < ?", (int(time.time()) - METRICS_RETENTION_DAYS * 86400,))
+    except sqlite3.OperationalError as e:
+        print(f"Metriken nicht gespeichert: {e}")
+    return len(rows)
+
+def get_metrics_summary(hours=24):
+    """p50/p95/p99 (ms) und Fehlerquote je Stufe über die letzten `hours` Stunden."""
+    import pandas as pd
+    flush_metrics()
+    columns = ["stage", "n", "p50_ms", "p95_ms", "p99_ms", "fehlerquote"]
+    try:
+        with db_connect() as conn:
+            df = pd.read_sql_query("SELECT stage, ms, ok FROM metrics WHERE ts >= ?", conn,
+                                   params=(int(time.time()) - hours * 3600,))
+    except Exception:
+        return pd.DataFrame(columns=columns)
+    if df.empty:
+        return pd.DataFrame(columns=columns)
+    g = df.groupby("stage")
+    summary = pd.DataFrame({"n": g.size(), "p50_ms": g["ms"].quantile(0.5), "p95_ms": g["ms"].quantile(0.95),
+                            "p99_ms": g["ms"].quantile(0.99), "fehlerquote": 1 - g["ok"].mean()})
+    return summary.round({"p50_ms": 1, "p95_ms": 1, "p99_ms": 1, "fehlerquote": 3}).reset_index()[columns]
+
+def _migrate_stats_primary_key(conn):
+    # Alte Tabelle ohne Schlüssel -> (station, timestamp) als Primärschlüssel, Duplikate fallen weg
+    conn.execute("DROP TABLE IF EXISTS stats_new")  # Rest eines früher abgebrochenen Laufs
+    conn.execute('''CREATE TABLE stats_new
+                    (timestamp DATETIME NOT NULL, station TEXT NOT NULL, minutes INTEGER, raw_text TEXT,
+                     PRIMARY KEY (station, timestamp))''')
+    conn.execute("INSERT OR IGNORE INTO stats_new SELECT timestamp, station, minutes, raw_text FROM stats ORDER BY rowid")
+    conn.execute("DROP TABLE stats")
+    conn.execute("ALTER TABLE stats_new RENAME TO stats")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_stats_timestamp ON stats (timestamp)")
+
+# --- ROLLUPS (STÜNDLICH / TÄGLICH) FÜR LANGE ZEITRÄUME ---
+
+# Tabelle -> Länge des Timestamp-Präfixes, das den Bucket bildet ('YYYY-MM-DD HH' bzw. 'YYYY-MM-DD')
+ROLLUP_TABLES = {"stats_hourly": 13, "stats_daily": 10}
+
+def _percentile(sorted_values, q):
+    # Nearest-Rank auf bereits sortierten Werten
+    idx = max(0, math.ceil(q * len(sorted_values)) - 1)
+    return sorted_values[idx]
+
+def update_rollups(conn, since=None):
+    """
+    Berechnet die Rollup-Buckets ab `since` neu (pro Ingest nur die aktuelle Stunde bzw. der aktuelle Tag).
+    Ohne `since` werden alle Buckets neu aufgebaut.
+    """
+    for table, prefix_len in ROLLUP_TABLES.items():
+        start = since[:prefix_len] if since else ""
+        rows = conn.execute("""SELECT station, substr(timestamp, 1, ?) AS bucket, minutes FROM stats
+                               WHERE timestamp >= ? ORDER BY station, bucket, minutes""", (prefix_len, start)).fetchall()
+        out = []
+        for (station, bucket), group in groupby(rows, key=lambda r: (r[0], r[1])):
+            values = [r[2] for r in group if r[2] is not None]
+            if not values: continue
+            bucket_ts = bucket + ":00:00" if prefix_len == 13 else bucket + " 00:00:00"
+            out.append((station, bucket_ts, len(values), values[0], round(sum(values) / len(values), 1),
+                        values[-1], _percentile(values, 0.9)))
+        conn.executemany(f"INSERT OR REPLACE INTO {table} VALUES (?, ?, ?, ?, ?, ?, ?)", out)
+
+def _migrate_rollup_tables(conn):
+    for table in ROLLUP_TABLES:
+        conn.execute(f'''CREATE TABLE IF NOT EXISTS {table}
+                         (station TEXT NOT NULL, bucket DATETIME NOT NULL, n INTEGER,
+                          min_minutes INTEGER, avg_minutes REAL, max_minutes INTEGER, p90_minutes INTEGER,
+                          PRIMARY KEY (station, bucket))''')
+    update_rollups(conn)
+
+def season_start(now=None):
+    """Beginn der laufenden Saison: Sommer ab 1. Mai, Winter ab 1. November."""
+    now = now or datetime.datetime.now(CH_TZ)
+    if 5 <= now.month <= 10: return now.replace(month=5, day=1, hour=0, minute=0, second=0, microsecond=0)
+    year = now.year if now.month >= 11 else now.year - 1
+    return now.replace(year=year, month=11, day=1, hour=0, minute=0, second=0, microsecond=0)
+
+# Zeitraum -> (Rollup-Tabelle, Startzeitpunkt)
+HISTORY_RANGES = {
+    "7 Tage": ("stats_hourly", lambda now: now - datetime.timedelta(days=7)),
+    "30 Tage": ("stats_daily", lambda now: now - datetime.timedelta(days=30)),
+    "Saison": ("stats_daily", season_start),
+}
+
+def get_rollup_history(range_key):
+    """Langzeit-Verlauf aus den Rollups; Kosten unabhängig davon, wie viele Rohzeilen existieren."""
+    import pandas as pd
+    table, start_fn = HISTORY_RANGES[range_key]
+    start = start_fn(datetime.datetime.now(CH_TZ)).strftime('%Y-%m-%d %H:%M:%S')
+    with db_connect() as conn:
+        return pd.read_sql_query(f"""SELECT bucket AS timestamp, station, avg_minutes AS minutes,
+                                     min_minutes, p90_minutes, max_minutes, n FROM {table}
+                                     WHERE bucket >= ? ORDER BY bucket""", conn, params=(start,))
+
+# --- INKREMENTELLER CHART-DATENSATZ (ROHDATEN, LETZTE STUNDEN) ---
+# Zeitraum -> Stunden; breitere Fenster werden serverseitig per LTTB auf CHART_MAX_POINTS pro Station reduziert
+CHART_WINDOWS = {"24h": 24, "72h": 72}
+CHART_MAX_POINTS = 300
+
+_chart_lock = threading.Lock()
+_chart_cache = {"db": None, "hours": 0, "last_ts": None, "df": None}
+
+def lttb_indices(x, y, threshold):
+    """Largest-Triangle-Three-Buckets: Indizes der `threshold` Punkte, die die Kurvenform am besten erhalten."""
+    import numpy as np
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    idx = np.empty(threshold, dtype=np.int64)
+    idx[0], idx[-1] = 0, n - 1
+    bucket = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        start, end = int(i * bucket) + 1, int((i + 1) * bucket) + 1
+        next_end = min(int((i + 2) * bucket) + 1, n)
+        avg_x, avg_y = x[end:next_end].mean(), y[end:next_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        idx[i + 1] = a
+    return idx
+
+def _read_chart_rows(conn, where, param):
+    import pandas as pd
+    df = pd.read_sql_query(f"SELECT timestamp, station, minutes FROM stats WHERE {where} AND minutes < 500 ORDER BY timestamp",
+                           conn, params=(param,))
+    df["timestamp"] = pd.to_datetime(df["timestamp"])
+    return df
+
+def _window_start(now, hours):
+    # Grenze in Schweizer Lokalzeit, im Format der stats-Tabelle (nicht SQLite 'now' = UTC)
+    start = now - datetime.timedelta(hours=hours)
+    return (CH_TZ.normalize(start) if start.tzinfo else start).strftime('%Y-%m-%d %H:%M:%S')
+
+def get_chart_window(hours=24, max_points=CHART_MAX_POINTS, now=None):
+    """
+    Rohdaten der letzten `hours` Stunden für den Trend-Chart, prozessweit gecacht.
+    Gelesen werden nur Zeilen nach dem zuletzt gesehenen Zeitstempel, Zeilen ausserhalb des Fensters
+    fallen raus; ein breiteres Fenster lädt einmal komplett.
+    """
+    import pandas as pd
+    import numpy as np
+    now = now or datetime.datetime.now(CH_TZ)
+    with _chart_lock:
+        cache = _chart_cache
+        if cache["df"] is None or cache["db"] != DB_NAME or hours > cache["hours"]:
+            with db_connect() as conn:
+                df = _read_chart_rows(conn, "timestamp >= ?", _window_start(now, hours))
+            cache.update(db=DB_NAME, hours=hours)
+        else:
+            df = cache["df"]
+            with db_connect() as conn:
+                if cache["last_ts"]:
+                    new_rows = _read_chart_rows(conn, "timestamp > ?", cache["last_ts"])
+                else:
+                    new_rows = _read_chart_rows(conn, "timestamp >= ?", _window_start(now, cache["hours"]))
+            if not new_rows.empty:
+                df = new_rows if df.empty else pd.concat([df, new_rows], ignore_index=True)
+            df = df[df["timestamp"] >= pd.Timestamp(_window_start(now, cache["hours"]))]
+        cache["df"] = df
+        if not df.empty:
+            cache["last_ts"] = df["timestamp"].iloc[-1].strftime('%Y-%m-%d %H:%M:%S')
+    window = df[df["timestamp"] >= pd.Timestamp(_window_start(now, hours))].reset_index(drop=True)
+    if not max_points or window.empty:
+        return window
+    parts = []
+    for _, part in window.groupby("station", sort=False):
+        x = part["timestamp"].to_numpy().astype("datetime64[m]").astype(np.int64)
+        parts.append(part.iloc[lttb_indices(x, part["minutes"].to_numpy(), max_points)])
+    return pd.concat(parts).sort_values("timestamp", kind="stable").reset_index(drop=True)
+
+# --- DEDUPLIZIERTE ROHMELDUNGEN ---
+
+def message_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def intern_messages(conn, texts):
+    """Legt jede Meldung nur einmal in `messages` ab und gibt ein Mapping Text -> id zurück."""
+    unique = {t: message_hash(t) for t in set(texts) if t is not None}
+    conn.executemany("INSERT OR IGNORE INTO messages (hash, text) VALUES (?, ?)", [(h, t) for t, h in unique.items()])
+    ids = {}
+    for t, h in unique.items():
+        ids[t] = conn.execute("SELECT id FROM messages WHERE hash = ?", (h,)).fetchone()[0]
+    return ids
+
+def insert_stats(conn, rows):
+    """Schreibt (timestamp, station, minutes, raw_text)-Zeilen; raw_text wird über `messages` referenziert."""
+    ids = intern_messages(conn, [r[3] for r in rows])
+    # rowcount statt total_changes: Änderungen durch Trigger (history_dirty) zählen nicht mit
+    return conn.executemany("INSERT OR IGNORE INTO stats (timestamp, station, minutes, message_id) VALUES (?, ?, ?, ?)",
+                            [(ts, station, minutes, ids.get(raw)) for ts, station, minutes, raw in rows]).rowcount
+
+def _migrate_message_table(conn):
+    conn.create_function("sha1", 1, lambda t: message_hash(t) if t is not None else None)
+    conn.execute('''CREATE TABLE IF NOT EXISTS messages
+                    (id INTEGER PRIMARY KEY, hash TEXT NOT NULL UNIQUE, text TEXT NOT NULL)''')
+    conn.execute("INSERT OR IGNORE INTO messages (hash, text) SELECT sha1(raw_text), raw_text FROM stats WHERE raw_text IS NOT NULL GROUP BY raw_text")
+    conn.execute("DROP TABLE IF EXISTS stats_new")
+    conn.execute('''CREATE TABLE stats_new
+                    (timestamp DATETIME NOT NULL, station TEXT NOT NULL, minutes INTEGER,
+                     message_id INTEGER REFERENCES messages (id),
+                     PRIMARY KEY (station, timestamp))''')
+    conn.execute("""INSERT INTO stats_new SELECT s.timestamp, s.station, s.minutes, m.id
+                    FROM stats s LEFT JOIN messages m ON m.hash = sha1(s.raw_text)""")
+    conn.execute("DROP TABLE stats")
+    conn.execute("ALTER TABLE stats_new RENAME TO stats")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_stats_timestamp ON stats (timestamp)")
+    # Lese-Sicht mit vollem Text (Debug-Historie, Lagebericht)
+    conn.execute("""CREATE VIEW IF NOT EXISTS stats_full AS
+                    SELECT s.timestamp, s.station, s.minutes, m.text AS raw_text
+                    FROM stats s LEFT JOIN messages m ON m.id = s.message_id""")
+
+def _migrate_travel_times(conn):
+    # Jede beobachtete Fahrzeit; Profil-Bucket = Wochentag * 24 + Stunde (Schweizer Lokalzeit)
+    conn.execute('''CREATE TABLE IF NOT EXISTS travel_times
+                    (origin TEXT NOT NULL, destination TEXT NOT NULL, avoid_tolls INTEGER NOT NULL DEFAULT 0,
+                     bucket INTEGER NOT NULL, seconds INTEGER NOT NULL, observed DATETIME NOT NULL)''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_travel_times_leg ON travel_times (origin, destination, avoid_tolls, observed)")
+
+def _migrate_wait_forecast(conn):
+    # Vorberechnetes Wartezeit-Profil je Station x Wochen-Slot (Wochentag * 288 + 5-Min-Slot des Tages)
+    conn.execute('''CREATE TABLE IF NOT EXISTS wait_forecast
+                    (station TEXT NOT NULL, slot INTEGER NOT NULL, n INTEGER NOT NULL, mean REAL NOT NULL,
+                     PRIMARY KEY (station, slot))''')
+    rebuild_forecast(conn)
+
+def _migrate_metrics(conn):
+    # Eine Zeile pro Messung: Unix-Sekunden, Stufe (z.B. "fetch:bls_delays"), Dauer in ms, 1 = ok
+    conn.execute('''CREATE TABLE IF NOT EXISTS metrics
+                    (ts INTEGER NOT NULL, stage TEXT NOT NULL, ms REAL NOT NULL, ok INTEGER NOT NULL)''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_metrics_ts ON metrics (ts)")
+
+def _migrate_ingest_lease(conn):
+    # Eine Zeile pro 5-Minuten-Slot: wer ingestiert (owner), seit wann, wann fertig und mit welchem Ergebnis
+    conn.execute('''CREATE TABLE IF NOT EXISTS ingest_lease
+                    (slot TEXT PRIMARY KEY, owner TEXT NOT NULL, acquired REAL NOT NULL, finished REAL, result TEXT)''')
+
+def _migrate_history_dirty(conn):
+    # Tage mit neuen Zeilen (Ingest, Restore, Nachträge) -> Parquet-Partition muss (neu) geschrieben werden
+    conn.execute("CREATE TABLE IF NOT EXISTS history_dirty (day TEXT PRIMARY KEY)")
+    conn.execute("""CREATE TRIGGER IF NOT EXISTS stats_history_dirty AFTER INSERT ON stats
+                    BEGIN INSERT OR IGNORE INTO history_dirty VALUES (substr(NEW.timestamp, 1, 10)); END""")
+    conn.execute("INSERT OR IGNORE INTO history_dirty SELECT DISTINCT substr(timestamp, 1, 10) FROM stats")
+
+# Schema-Migrationen in Reihenfolge; der Stand steht in PRAGMA user_version
+SCHEMA_MIGRATIONS = [
+    _migrate_stats_primary_key,
+    _migrate_rollup_tables,
+    _migrate_message_table,
+    _migrate_travel_times,
+    _migrate_wait_forecast,
+    _migrate_metrics,
+    _migrate_ingest_lease,
+    _migrate_history_dirty,
+]
+
+def migrate_db(conn):
+    """
+    Jede Migration läuft atomar unter BEGIN IMMEDIATE (Schreibsperre); die Version wird erst nach der Sperre
+    erneut gelesen, damit parallele init_db()-Aufrufe (Sessions, Collector) sie nicht doppelt ausführen.
+    """
+    if conn.in_transaction:
+        conn.commit()
+    for target, migration in enumerate(SCHEMA_MIGRATIONS, start=1):
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= target:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("PRAGMA user_version").fetchone()[0] < target:
+                migration(conn)
+                conn.execute(f"PRAGMA user_version = {target}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+def init_db():
+    conn = db_connect()
+    conn.execute("PRAGMA journal_mode = WAL")
+    c = conn.cursor()
+    # Basisschema (Version 0); alle Änderungen daran laufen über SCHEMA_MIGRATIONS
+    c.execute('''CREATE TABLE IF NOT EXISTS stats
+                 (timestamp DATETIME, station TEXT, minutes INTEGER, raw_text TEXT)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS feed_status
+                 (source TEXT PRIMARY KEY, aktiv INTEGER, updated DATETIME)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS gsheets_outbox
+                 (timestamp DATETIME, station TEXT, minutes INTEGER, raw_text TEXT, synced INTEGER DEFAULT 0,
+                  PRIMARY KEY (timestamp, station))''')
+    c.execute('''CREATE TABLE IF NOT EXISTS sync_state
+                 (key TEXT PRIMARY KEY, value TEXT)''')
+    conn.commit()
+    migrate_db(conn)
+    c.execute("SELECT COUNT(*) FROM stats")
+    if c.fetchone()[0] == 0:
+        restore_from_gsheets(conn)
+    conn.close()
+
+RESTORE_WINDOW_HOURS = 24
+RESTORE_CHUNK_ROWS = 1000
+
+def find_restore_start_row(ws, cutoff):
+    """
+    Sucht von hinten in Spalte A (chronologisch angehängt) die erste Zeile nach dem Cutoff.
+    Liest dabei nur so viele Blöcke der Timestamp-Spalte wie das Zeitfenster braucht.
+    row_count ist die Grösse des Rasters: leere Blöcke unterhalb der Daten werden übersprungen.
+    """
+    hi = ws.row_count
+    start_row = None
+    while hi >= 2:
+        lo = max(2, hi - RESTORE_CHUNK_ROWS + 1)
+        block = [row[0] if row else "" for row in ws.get(f"A{lo}:A{hi}")]
+        if start_row is None and not any(block):
+            hi = lo - 1
+            continue
+        newer = [i for i, ts in enumerate(block) if ts and ts > cutoff]
+        if not newer: break
+        start_row = lo + newer[0]
+        if newer[0] > 0 and block[newer[0] - 1]: break
+        hi = lo - 1
+    return start_row
+
+def restore_from_gsheets(sqlite_conn, hours=None):
+    """
+    Kaltstart-Restore: lädt nur das Zeitfenster der letzten `hours` Stunden aus dem Sheet,
+    blockweise und idempotent (bereits vorhandene Zeilen werden übersprungen).
+    """
+    hours = hours or get_setting("RESTORE_WINDOW_HOURS", RESTORE_WINDOW_HOURS)
+    started = time.perf_counter()
+    loaded = 0
+    try:
+        sheet_name = get_worksheet_name("Sheet1")
+        ws = get_gsheets_worksheet(sheet_name)
+        cutoff = (datetime.datetime.now(CH_TZ) - datetime.timedelta(hours=hours)).strftime('%Y-%m-%d %H:%M:%S')
+        row = find_restore_start_row(ws, cutoff)
+        while row is not None and row <= ws.row_count:
+            end_row = min(row + RESTORE_CHUNK_ROWS - 1, ws.row_count)
+            values = ws.get(f"A{row}:D{end_row}")
+            if not values: break  # nur noch leere Rasterzeilen
+            chunk = [(r[0], r[1], int(float(r[2] or 0)), r[3] if len(r) > 3 else "")
+                     for r in values if len(r) >= 3 and r[0] > cutoff]
+            loaded += insert_stats(sqlite_conn, chunk)
+            sqlite_conn.commit()
+            row = end_row + 1
+        if loaded:
+            update_rollups(sqlite_conn, cutoff)
+            rebuild_forecast(sqlite_conn)
+            sqlite_conn.commit()
+        duration = time.perf_counter() - started
+        print(f"Cloud-Restore: {loaded} Zeilen ({hours}h) in {duration:.2f}s")
+        if loaded:
+            notify("info", f"🔄 {loaded} Einträge der letzten {hours}h aus Cloud-Tab '{sheet_name}' wiederhergestellt ({duration:.1f}s).")
+        return {"rows": loaded, "seconds": round(duration, 3), "hours": hours}
+    except Exception as e:
+        notify("warning", f"Cloud-Restore übersprungen: {e}")
+        return {"rows": loaded, "seconds": round(time.perf_counter() - started, 3), "hours": hours, "error": str(e)}
+
+# --- MEHRSPRACHIGER WARTEZEIT-PARSER (DE/FR/IT/EN) ---
+DelayInfo = namedtuple("DelayInfo", ["minutes", "direction", "station", "wait"])
+
+# Gegenüberliegende Verladestation = Fahrtrichtung, wenn die Meldung keine nennt
+VERLAD_GEGENSTATION = {"Realp": "Oberwald", "Oberwald": "Realp", "Kandersteg": "Goppenstein", "Goppenstein": "Kandersteg"}
+# Ohne die Artikel "a"/"an": die treffen gewöhnlichen IT/EN-Text ("Partenza a ore 14:00"); "an hour" hat ein eigenes Muster
+_WORD_NUMBERS = {"ein": 1, "eine": 1, "einer": 1, "une": 1, "un": 1, "un'": 1, "una": 1, "one": 1,
+                 "zwei": 2, "deux": 2, "due": 2, "two": 2, "drei": 3, "trois": 3, "tre": 3, "three": 3}
+_NUM_WORDS = "|".join(sorted((re.escape(w) for w in _WORD_NUMBERS), key=len, reverse=True))
+_HOUR_UNIT = r"\s*(?:stunden?|std\b\.?|heures?|ore|ora|hours?|hrs?\b)"
+_STATIONS = "|".join(s.lower() for s in VERLAD_GEGENSTATION)
+
+# Ein einziges kompiliertes Muster; ein finditer-Durchgang liefert alle Bausteine der Meldung.
+# Alle Bausteine beginnen am Wortanfang: das vorangestellte (?<!\w) verwirft Positionen mitten im Wort sofort.
+# Die Zahl-Bausteine stehen gemeinsam hinter (?=\d), damit Wortanfänge ohne Ziffer sie gar nicht erst probieren
+# (vorher je ein eigener Lookbehind pro Zweig: ~30 % langsamer). Der Text wird vorher kleingeschrieben.
+DELAY_PATTERN = re.compile(rf"""
+  (?<!\w)(?:
+    (?=\d)(?<!:)(?:
+        (?P<hm_h>\d)\s*h\s*(?P<hm_m>[0-5]\d)\b
+      | (?P<h>\d+(?:[.,]\d+)?){_HOUR_UNIT}
+      | (?<![.,])(?P<hs>\d(?:[.,]\d)?)\s*h\b
+      | (?P<m>\d+)\s*(?:minuten|minutes?|minuti|minuto|mins?\b\.?|')
+    )
+  | (?P<wait>wartezeit|warten|temps\s+d'attente|attente|tempo\s+di\s+attesa|attesa|waiting|wait)
+  | (?P<st>{_STATIONS})\b
+  | (?P<none>keine\s+wartezeit(?:en)?|no\s+wait(?:ing)?(?:\s+time)?|pas\s+d'attente|aucune\s+attente
+        |aucun\s+temps\s+d'attente|nessuna\s+attesa|nessun\s+tempo\s+di\s+attesa)
+  | (?P<half>(?:eine\s+)?halbe\s+stunde|(?:une\s+)?demi-heure|mezz'ora|mezzora|half\s+an\s+hour)
+  | (?P<hw>{_NUM_WORDS}){_HOUR_UNIT}
+  | (?P<an_hour>an?\s+hour)\b
+  | (?P<dir>richtung|nach|direction|vers|en\s+direction\s+de|direzione|verso|per|towards|to)\s+(?P<dir_st>{_STATIONS})\b
+  )
+""", re.VERBOSE)
+
+# Fahrplan-Hinweise ("stündlich", "Abfahrt jeweils ...") sind keine Wartezeit-Meldungen
+TIMETABLE_NOTICE = re.compile(r"stündlich|abfahrt|toutes\s+les\s+heures|départ|ogni\s+ora|partenz|hourly|departure", re.IGNORECASE)
+
+def _to_number(token):
+    token = token.lower()
+    return _WORD_NUMBERS[token] if token in _WORD_NUMBERS else float(token.replace(",", "."))
+
+@lru_cache(maxsize=4096)
+def parse_delay_message(text):
+    """
+    Wartezeit, Fahrtrichtung und Station aus einer Meldung (DE/FR/IT/EN) in einem Durchgang.
+    Erste Stunden- und erste Minutenangabe zählen (wie bisher); Uhrzeiten wie 14:30 oder 14h30 nicht.
+    wait ist nur bei einem Wartezeit-Stichwort gesetzt; eine Dauer allein ist noch keine Wartezeit-Meldung.
+    Memoisiert, weil dieselbe Meldung oft stundenlang unverändert im Feed steht.
+    """
+    if not text:
+        return DelayInfo(0, None, None, False)
+    norm = unicodedata.normalize("NFKC", text).replace("\u2019", "'").replace("\u00b4", "'").lower()
+    hours = minutes = None
+    station = direction = None
+    wait = False
+    for m in DELAY_PATTERN.finditer(norm):
+        kind = m.lastgroup  # bei zusammengesetzten Bausteinen die letzte Gruppe (hm_m, dir_st)
+        if kind == "wait" or kind == "none":
+            wait = True
+        elif kind == "st":
+            if station is None: station = m.group("st").title()
+        elif kind == "m":
+            if minutes is None: minutes = int(m.group("m"))
+        elif kind == "h" or kind == "hs" or kind == "hw":
+            if hours is None: hours = _to_number(m.group(kind))
+        elif kind == "hm_m":
+            if hours is None: hours, minutes = int(m.group("hm_h")), int(m.group("hm_m"))
+        elif kind == "dir_st":
+            if direction is None: direction = m.group("dir_st").title()
+        elif kind == "half":
+            if minutes is None: minutes = 30
+        elif kind == "an_hour":
+            if hours is None: hours = 1
+    if direction is None and station:
+        direction = VERLAD_GEGENSTATION[station]
+    elif station is None and direction:
+        station = VERLAD_GEGENSTATION[direction]
+    total = round((hours or 0) * 60) + (minutes or 0)
+    return DelayInfo(total, direction, station, wait)
+
+def parse_time_to_minutes(time_str):
+    return parse_delay_message(time_str).minutes
+
+# --- INKREMENTELLE RSS-VERARBEITUNG (GUID / PUBDATE) ---
+FEED_EVENT_LOG_SIZE = 200
+
+_feed_lock = threading.Lock()
+_feed_state = {}  # Quelle -> {"digest", "items": {Schlüssel: Record}, "records": [Record, ...]}
+_feed_events = deque(maxlen=FEED_EVENT_LOG_SIZE)
+_feed_listeners = []
+_feed_stats = {"payload_unchanged": 0, "items_unchanged": 0, "items_processed": 0}
+
+def iter_rss_items(content):
+    """Streaming-Parse: liefert (guid, pubDate, title, description) je <item>, verarbeitete Elemente werden verworfen."""
+    for _, elem in ET.iterparse(io.BytesIO(content), events=("end",)):
+        if elem.tag == "item":
+            yield elem.findtext("guid"), elem.findtext("pubDate"), elem.findtext("title") or "", elem.findtext("description") or ""
+            elem.clear()
+
+def _feed_record(key, pubdate, title, description, fingerprint):
+    # Abgeleitete Werte werden genau einmal pro neuem/geändertem Item berechnet
+    text = f"{title} {description}".strip()
+    return {"key": key, "pubdate": pubdate, "title": title, "text": text, "fingerprint": fingerprint,
+            "timetable": TIMETABLE_NOTICE.search(text) is not None,
+            "delay": parse_delay_message(text), "closure": classify_closure_item(text)}
+
+def subscribe_feed_events(callback):
+    """Registriert einen Empfänger für Änderungs-Events ({source, kind, key, title, pubdate})."""
+    with _feed_lock:
+        if callback not in _feed_listeners:
+            _feed_listeners.append(callback)
+
+def get_feed_events(limit=50):
+    with _feed_lock:
+        return list(_feed_events)[-limit:]
+
+def get_feed_stats():
+    with _feed_lock:
+        return dict(_feed_stats, feeds={source: len(feed["records"]) for source, feed in _feed_state.items()})
+
+def process_feed(source, content):
+    """
+    Liefert die Items eines RSS-Feeds als Records (Reihenfolge wie im Feed).
+    Unveränderter Payload wird gar nicht geparst; sonst werden nur neue oder geänderte Items
+    (Schlüssel = GUID, sonst Titel; Fingerprint = pubDate + Text) neu ausgewertet und als Events gemeldet.
+    """
+    digest = hashlib.sha1(content).hexdigest()
+    with _feed_lock:
+        state = _feed_state.get(source)
+        if state and state["digest"] == digest:
+            _feed_stats["payload_unchanged"] += 1
+            return state["records"]
+        known = state["items"] if state else {}
+    items, events, unchanged = {}, [], 0
+    for guid, pubdate, title, description in iter_rss_items(content):
+        key = guid or title
+        n = 1
+        while key in items:  # gleiche Titel ohne GUID auseinanderhalten
+            n += 1
+            key = f"{guid or title}#{n}"
+        fingerprint = hashlib.sha1(f"{pubdate}|{title}|{description}".encode("utf-8")).hexdigest()
+        old = known.get(key)
+        if old and old["fingerprint"] == fingerprint:
+            items[key] = old
+            unchanged += 1
+            continue
+        items[key] = _feed_record(key, pubdate, title, description, fingerprint)
+        events.append({"source": source, "kind": "changed" if old else "added", "key": key, "title": title, "pubdate": pubdate})
+    events += [{"source": source, "kind": "removed", "key": key, "title": old["title"], "pubdate": old["pubdate"]}
+               for key, old in known.items() if key not in items]
+    records = list(items.values())
+    with _feed_lock:
+        _feed_state[source] = {"digest": digest, "items": items, "records": records}
+        _feed_stats["items_unchanged"] += unchanged
+        _feed_stats["items_processed"] += len(records) - unchanged
+        _feed_events.extend(events)
+        listeners = list(_feed_listeners)
+    for event in events:
+        for listener in listeners:
+            try: listener(event)
+            except Exception as e: print(f"Feed-Event-Empfänger Fehler: {e}")
+    return records
+
+# --- PARALLELE FETCH-ENGINE ---
+
+_http_session = None
+_http_lock = threading.Lock()
+_fetch_executor = ThreadPoolExecutor(max_workers=len(FEED_SOURCES), thread_name_prefix="feed-fetch")
+
+def get_http_session():
+    """Prozessweite requests-Session mit Connection-Pool (Keep-Alive statt neuem TLS-Handshake pro Aufruf)."""
+    global _http_session
+    import requests
+    from requests.adapters import HTTPAdapter
+    with _http_lock:
+        if _http_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=len(FEED_SOURCES), pool_maxsize=16)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _http_session = session
+    return _http_session
+
+# --- PROZESSWEITER HTTP-CACHE (TTL + ETag/Last-Modified) ---
+
+_http_cache = {}
+_http_cache_locks = defaultdict(threading.Lock)
+_http_cache_stats = {"hits": 0, "misses": 0, "revalidated": 0}
+
+def cached_get(url, ttl, headers=None):
+    """
+    GET mit prozessweitem Cache pro URL. Innerhalb der TTL wird die gespeicherte Response
+    zurückgegeben; danach wird mit If-None-Match/If-Modified-Since revalidiert.
+    Gleichzeitige Aufrufe derselben URL warten aufeinander, damit nur einer upstream geht.
+    """
+    with _http_lock:
+        url_lock = _http_cache_locks[url]
+    with url_lock:
+        entry = _http_cache.get(url)
+        if entry and time.monotonic() - entry["fetched"] < ttl:
+            with _http_lock: _http_cache_stats["hits"] += 1
+            return entry["response"]
+
+        req_headers = dict(headers or {})
+        if entry:
+            if entry["etag"]: req_headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]: req_headers["If-Modified-Since"] = entry["last_modified"]
+        response = get_http_session().get(url, headers=req_headers, timeout=HTTP_TIMEOUT)
+
+        if response.status_code == 304 and entry:
+            entry.update(fetched=time.monotonic(), fetched_at=time.time())
+            with _http_lock: _http_cache_stats["revalidated"] += 1
+            return entry["response"]
+        with _http_lock: _http_cache_stats["misses"] += 1
+        if response.status_code == 200:
+            _http_cache[url] = {"response": response, "fetched": time.monotonic(), "fetched_at": time.time(),
+                                "etag": response.headers.get("ETag"),
+                                "last_modified": response.headers.get("Last-Modified")}
+        return response
+
+def cached_fetch_time(url, response):
+    """Wanduhr-Zeit, zu der `response` upstream geholt bzw. bestätigt wurde (Cache-Treffer sind älter als jetzt)."""
+    entry = _http_cache.get(url)
+    return entry["fetched_at"] if entry and entry["response"] is response else time.time()
+
+def get_http_cache_stats():
+    with _http_lock:
+        stats = dict(_http_cache_stats)
+    total = stats["hits"] + stats["misses"] + stats["revalidated"]
+    stats["hit_rate"] = round((stats["hits"] + stats["revalidated"]) / total, 3) if total else 0.0
+    return stats
+
+# Circuit-Breaker pro Upstream: nach CIRCUIT_FAILURE_THRESHOLD Fehlern in Folge wird die Quelle
+# mit exponentiell wachsender Pause nicht mehr angefragt; danach prüft genau ein Probe-Request.
+# Solange liefert fetch_source_with_age sofort den letzten guten Stand samt Alter.
+CIRCUIT_FAILURE_THRESHOLD = 2
+CIRCUIT_BASE_BACKOFF_S = 30
+CIRCUIT_MAX_BACKOFF_S = 900
+
+_health_lock = threading.Lock()
+_source_health = defaultdict(lambda: {"failures": 0, "open_until": 0.0, "probing": False, "last_error": None, "last_ok": None})
+_last_good = {}  # Quelle -> (Response, time.time() des letzten Erfolgs)
+_revalidating = set()
+
+def _breaker_allows(name):
+    with _health_lock:
+        health = _source_health[name]
+        if health["failures"] < CIRCUIT_FAILURE_THRESHOLD:
+            return True
+        if time.monotonic() < health["open_until"] or health["probing"]:
+            return False
+        health["probing"] = True  # halb offen: genau ein Probe-Request
+        return True
+
+def _record_outcome(name, response=None, error=None, fetched_at=None):
+    with _health_lock:
+        health = _source_health[name]
+        health["probing"] = False
+        if error is None:
+            health.update(failures=0, open_until=0.0, last_error=None, last_ok=time.time())
+            _last_good[name] = (response, fetched_at or time.time())
+            return
+        health["failures"] += 1
+        health["last_error"] = str(error)[:200]
+        if health["failures"] >= CIRCUIT_FAILURE_THRESHOLD:
+            backoff = min(CIRCUIT_BASE_BACKOFF_S * 2 ** (health["failures"] - CIRCUIT_FAILURE_THRESHOLD), CIRCUIT_MAX_BACKOFF_S)
+            health["open_until"] = time.monotonic() + backoff
+
+def _last_good_with_age(name):
+    with _health_lock:
+        entry = _last_good.get(name)
+    return (entry[0], time.time() - entry[1]) if entry else (None, None)
+
+def get_last_good_response(name):
+    """Letzter erfolgreicher Abruf einer Quelle in diesem Prozess als (Response, Alter in s), ohne Upstream-Abfrage."""
+    return _last_good_with_age(name)
+
+def _fetch_upstream(name):
+    source = FEED_SOURCES[name]
+    try:
+        with timed(f"fetch:{name}") as outcome:
+            response = cached_get(source["url"], source["ttl"], headers=source["headers"])
+            outcome["ok"] = response.status_code < 400
+        if response.status_code >= 400:
+            import requests
+            raise requests.HTTPError(f"HTTP {response.status_code}")
+    except Exception as e:
+        print(f"Fehler Fetch {name}: {e}")
+        _record_outcome(name, error=e)
+        return None
+    _record_outcome(name, response, fetched_at=cached_fetch_time(source["url"], response))
+    return response
+
+def _revalidate_in_background(name):
+    with _health_lock:
+        if name in _revalidating: return
+        _revalidating.add(name)
+    def run():
+        try: _fetch_upstream(name)
+        finally:
+            with _health_lock: _revalidating.discard(name)
+    _fetch_executor.submit(run)
+
+def fetch_source_with_age(name, stale_ok=False):
+    """
+    Gibt (Response, Alter in s) zurück: Alter 0 = frisch, > 0 = letzter guter Stand, (None, None) = nie erfolgreich.
+    Bei offenem Breaker wird gar nicht angefragt. Mit stale_ok=True (UI) wird ein abgelaufener Stand sofort
+    geliefert und im Hintergrund erneuert (stale-while-revalidate), statt auf den Upstream zu warten.
+    """
+    if not _breaker_allows(name):
+        return _last_good_with_age(name)
+    if stale_ok:
+        stale, age = _last_good_with_age(name)
+        if stale is not None and age > FEED_SOURCES[name]["ttl"]:
+            # Ein evtl. gesetztes probing bleibt stehen: die Hintergrund-Abfrage ist der Probe-Request
+            _revalidate_in_background(name)
+            return stale, age
+    response = _fetch_upstream(name)
+    return (response, 0) if response is not None else _last_good_with_age(name)
+
+def fetch_source(name, stale_ok=False):
+    """Holt einen einzelnen Feed aus FEED_SOURCES (über HTTP-Cache und Breaker). Gibt die Response oder None zurück."""
+    return fetch_source_with_age(name, stale_ok)[0]
+
+def get_source_health():
+    """Zustand je Upstream für die Diagnose: ok / gestört / offen (Breaker) samt Alter des letzten guten Stands."""
+    now_mono, now = time.monotonic(), time.time()
+    with _health_lock:
+        out = {}
+        for name in FEED_SOURCES:
+            health = _source_health[name]
+            open_for = max(0.0, health["open_until"] - now_mono)
+            state = "offen" if health["failures"] >= CIRCUIT_FAILURE_THRESHOLD else ("gestört" if health["failures"] else "ok")
+            out[name] = {"zustand": state, "fehler_in_folge": health["failures"], "naechster_versuch_s": round(open_for),
+                         "letzter_fehler": health["last_error"],
+                         "alter_s": round(now - _last_good[name][1]) if name in _last_good else None}
+        return out
+
+def fetch_sources_with_age(names=tuple(FEED_SOURCES)):
+    """
+    Holt alle angefragten Feeds gleichzeitig (Latenz = langsamster Feed, nicht die Summe).
+    Gibt {Name: (Response, Alter in s)} zurück; hängende Quellen liefern den letzten guten Stand.
+    """
+    futures = {name: _fetch_executor.submit(fetch_source_with_age, name) for name in names}
+    wait(futures.values(), timeout=HTTP_TIMEOUT * 2)
+    return {name: (f.result() if f.done() else _last_good_with_age(name)) for name, f in futures.items()}
+
+def parse_bls_delays(payload):
+    results = {}
+    for s in payload.get("Stations", []):
+        name = s.get("Station")
+        if name in ["Kandersteg", "Goppenstein"]:
+            msg = s.get("DelayMessage", "")
+            results[name] = {"min": parse_time_to_minutes(msg), "raw": msg if msg else "Keine Wartezeit"}
+    return results
+
+def furka_wait_times(records):
+    """Wartezeiten Realp/Oberwald aus den (bereits ausgewerteten) Feed-Records."""
+    results = {}
+    furka_found = {"Oberwald": False, "Realp": False}
+    for record in records:
+        if record["timetable"] or not record["delay"].wait: continue
+        for loc in furka_found.keys():
+            if loc in record["text"] and not furka_found[loc]:
+                results[loc] = {"min": record["delay"].minutes, "raw": record["text"]}
+                furka_found[loc] = True
+    for loc, found in furka_found.items():
+        if not found: results[loc] = {"min": 0, "raw": "Keine Meldung"}
+    return results
+
+# Welche Quelle welchen Status liefert (für das Überspringen nicht bestätigter Werte)
+STATUS_SOURCE_OF = {"furka_aktiv": "mgb_furka", "loetschberg_aktiv": "bls_traffic", "pass_status": "alpen_paesse"}
+
+def fetch_live_state(sources=tuple(FEED_SOURCES), check_status=True):
+    """
+    Holt die angefragten Feeds parallel, parst jede Antwort genau einmal und liefert
+    Wartezeiten und Betriebsstatus gemeinsam zurück. Speichert nichts.
+    Mit check_status=False wird die (evtl. KI-gestützte) Statusprüfung übersprungen.
+    Quellen ohne frische Antwort stehen in "stale_sources" (Name -> Alter in s oder None);
+    aus ihnen wird nichts abgeleitet, damit kein alter Stand als neuer Slot gespeichert wird.
+    """
+    fetched = fetch_sources_with_age(sources)
+    responses = {name: r for name, (r, age) in fetched.items() if r is not None and not age}
+    state = {"wait_times": {}, "furka_aktiv": True, "loetschberg_aktiv": True, "pass_status": None,
+             "stale_sources": {name: age for name, (r, age) in fetched.items() if name not in responses}}
+
+    l_res = responses.get("bls_delays")
+    if l_res is not None:
+        try: state["wait_times"].update(parse_bls_delays(l_res.json()))
+        except Exception as e: print(f"Fehler Lötschberg Fetch: {e}")
+
+    f_res = responses.get("mgb_furka")
+    if f_res is not None:
+        try: state["wait_times"].update(furka_wait_times(process_feed("mgb_furka", f_res.content)))
+        except Exception as e: print(f"Fehler Furka Fetch: {e}")
+        if check_status:
+            try:
+                with timed("status:furka"): state["furka_aktiv"] = check_furka_status(f_res)
+            except Exception as e:
+                print(f"Fehler Furka-Status: {e}")
+                state["stale_sources"]["mgb_furka"] = None
+
+    t_res = responses.get("bls_traffic")
+    if t_res is not None and check_status:
+        try:
+            with timed("status:loetschberg"): state["loetschberg_aktiv"] = check_loetschberg_status(t_res.json())
+        except Exception as e:
+            print(f"Fehler Lötschberg-Status: {e}")
+            state["stale_sources"]["bls_traffic"] = None
+
+    p_res = responses.get("alpen_paesse")
+    if p_res is not None:
+        state["pass_status"] = parse_pass_status(p_res.content)
+
+    return state
+
+def store_wait_times(results):
+    if results:
+        save_to_db(results)
+        if get_worksheet_name("Development") != "Development": save_to_google_sheets(results)
+
+def fetch_all_data():
+    results = fetch_live_state(WAIT_TIME_SOURCES, check_status=False)["wait_times"]
+    store_wait_times(results)
+    return results
+
+def save_to_db(data):
+    try:
+        ts_str = current_slot()
+        rows = [(ts_str, station, info.get('min', 0), info.get('raw', '')) for station, info in data.items()]
+        with timed("db_write"), db_connect() as conn:
+            # Ein Batch pro Zyklus; ein zweiter Durchgang im selben Slot ändert nichts
+            inserted = insert_stats(conn, rows)
+            if inserted:
+                update_forecast(conn, rows)
+            update_rollups(conn, ts_str)
+        if inserted:
+            _snapshot_record_waits(rows)
+    except Exception as e: print(f"DB Error: {e}")
+
+# --- GOOGLE SHEETS: INKREMENTELLER APPEND ÜBER LOKALE OUTBOX ---
+
+GSHEETS_COLUMNS = ["timestamp", "station", "minutes", "raw_text"]
+GSHEETS_BATCH_SIZE = 500
+_gsheets_worksheets = {}
+
+def get_sync_state(conn, key, default=None):
+    row = conn.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else default
+
+def set_sync_state(conn, key, value):
+    conn.execute("INSERT OR REPLACE INTO sync_state VALUES (?, ?)", (key, value))
+
+def get_gsheets_worksheet(sheet_name):
+    """gspread-Worksheet des konfigurierten Sheets, pro Prozess nur einmal geöffnet."""
+    if sheet_name not in _gsheets_worksheets:
+        opener = _config["gsheets_opener"] or _open_gsheets_worksheet
+        _gsheets_worksheets[sheet_name] = opener(sheet_name)
+    return _gsheets_worksheets[sheet_name]
+
+def _open_gsheets_worksheet(sheet_name):
+    """
+    Öffnet das Worksheet über die öffentliche gspread-API mit denselben Secrets wie st.connection("gsheets")
+    ([connections.gsheets]: spreadsheet = URL oder Titel, dazu die Felder des Service-Accounts).
+    gspread wird erst beim ersten Sync bzw. Restore geladen.
+    """
+    import gspread
+    credentials = dict((get_setting("connections") or {}).get("gsheets") or {})
+    spreadsheet = credentials.pop("spreadsheet", None)
+    credentials.pop("worksheet", None)
+    if not spreadsheet or credentials.get("type") != "service_account":
+        raise RuntimeError("Google Sheets nicht konfiguriert: [connections.gsheets] braucht spreadsheet "
+                           "und einen Service-Account (type = \"service_account\")")
+    client = gspread.service_account_from_dict(credentials)
+    book = client.open_by_url(spreadsheet) if spreadsheet.startswith("https://") else client.open(spreadsheet)
+    return book.worksheet(sheet_name)
+
+def enqueue_for_gsheets(data, ts_str=None):
+    """Legt die Zeilen des aktuellen Slots in die Outbox. Bereits synchronisierte Slots werden ignoriert."""
+    ts_str = ts_str or current_slot()
+    with db_connect() as conn:
+        hwm = get_sync_state(conn, "gsheets_hwm", "")
+        if ts_str < hwm: return 0
+        rows = [(ts_str, s, i.get('min', 0), i.get('raw', '')) for s, i in data.items()]
+        cur = conn.executemany("INSERT OR IGNORE INTO gsheets_outbox (timestamp, station, minutes, raw_text) VALUES (?, ?, ?, ?)", rows)
+        return cur.rowcount
+
+def flush_gsheets_outbox(sheet_name):
+    """
+    Hängt alle offenen Outbox-Zeilen batchweise ans Sheet an (kein Lesen/Neuschreiben des ganzen Sheets).
+    Schlägt ein Batch fehl, bleiben die Zeilen offen und werden beim nächsten Zyklus erneut versucht.
+    """
+    ws = get_gsheets_worksheet(sheet_name)
+    pushed = 0
+    with db_connect() as conn:
+        if get_sync_state(conn, "gsheets_hwm") is None:
+            # Erster Sync: Header anlegen bzw. High-Water-Mark aus dem bestehenden Sheet übernehmen
+            existing = ws.col_values(1)
+            if not existing: ws.append_row(GSHEETS_COLUMNS)
+            set_sync_state(conn, "gsheets_hwm", existing[-1] if len(existing) > 1 else "")
+            conn.commit()
+        while True:
+            batch = conn.execute("""SELECT timestamp, station, minutes, raw_text FROM gsheets_outbox
+                                    WHERE synced = 0 ORDER BY timestamp, station LIMIT ?""", (GSHEETS_BATCH_SIZE,)).fetchall()
+            if not batch: break
+            ws.append_rows([list(r) for r in batch], value_input_option="RAW")
+            conn.executemany("UPDATE gsheets_outbox SET synced = 1 WHERE timestamp = ? AND station = ?", [(r[0], r[1]) for r in batch])
+            hwm = max(batch[-1][0], get_sync_state(conn, "gsheets_hwm", ""))
+            set_sync_state(conn, "gsheets_hwm", hwm)
+            conn.commit()
+            pushed += len(batch)
+        # Synchronisierte Zeilen nur einen Tag lang behalten (Schutz vor Doppel-Enqueue im selben Slot)
+        cutoff = (datetime.datetime.now(CH_TZ) - datetime.timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S')
+        conn.execute("DELETE FROM gsheets_outbox WHERE synced = 1 AND timestamp < ?", (cutoff,))
+    return pushed
+
+def get_gsheets_backlog():
+    try:
+        with db_connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM gsheets_outbox WHERE synced = 0").fetchone()[0]
+    except sqlite3.OperationalError:
+        return 0
+
+def save_to_google_sheets(data):
+    try:
+        sheet_name = get_worksheet_name("Development")
+        with timed("sheets_sync"):
+            enqueue_for_gsheets(data)
+            flush_gsheets_outbox(sheet_name)
+        return True
+    except Exception as e:
+        _gsheets_worksheets.clear()
+        notify("error", f"GSheets Sync Fehler: {e}")
+        return False
+
+def get_latest_wait_times(station):
+    return int(get_latest_state()["wait_times"].get(station, {}).get("min", 0))
+
+# --- HISTORIEN-EXPORT: PARQUET, NACH TAG PARTITIONIERT ---
+# Layout <HISTORY_DIR>/date=YYYY-MM-DD/part.parquet (Hive-Stil). Exportiert werden nur abgeschlossene Tage;
+# bekommt ein Tag später noch Zeilen, wird seine Partition neu geschrieben. Auswertungen über Monate lesen danach nur die nötigen Dateien und Spalten von der Platte.
+HISTORY_COLUMNS = ("timestamp", "station", "minutes", "raw_text")
+HISTORY_TS_FORMAT = '%Y-%m-%d %H:%M:%S'
+HISTORY_EXPORT_MAX_DAYS = 14    # pro Ingestion-Zyklus; ein grosser Erst-Export verteilt sich so über mehrere Slots
+
+def history_dir():
+    """Export-Verzeichnis: Setting HISTORY_DIR, sonst 'history' neben der DB."""
+    return get_setting("HISTORY_DIR") or os.path.join(os.path.dirname(os.path.abspath(DB_NAME)), "history")
+
+def _partition_path(directory, day):
+    return os.path.join(directory, f"date={day}", "part.parquet")
+
+def _write_partition(directory, day, rows):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+    timestamps, stations, minutes, texts = zip(*rows)
+    table = pa.table({
+        "timestamp": pc.strptime(pa.array(timestamps), format=HISTORY_TS_FORMAT, unit="s"),  # Schweizer Lokalzeit
+        "station": pa.array(stations).dictionary_encode(),
+        "minutes": pa.array(minutes, type=pa.int32()),
+        "raw_text": pa.array(texts, type=pa.string()),
+    })
+    path = _partition_path(directory, day)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Erst vollständig schreiben, dann umbenennen: Leser sehen nie eine halbe Partition
+    pq.write_table(table, path + ".tmp", compression="zstd")
+    os.replace(path + ".tmp", path)
+
+def export_history(directory=None, now=None, max_days=None):
+    """
+    Schreibt jeden abgeschlossenen Tag mit neuen Zeilen (neu) als Partition, älteste zuerst und höchstens
+    `max_days` pro Aufruf. Ohne geänderten Tag bleibt es bei einer Abfrage auf history_dirty (kein pyarrow).
+    """
+    directory = directory or history_dir()
+    today = (now or datetime.datetime.now(CH_TZ)).strftime('%Y-%m-%d')
+    max_days = max_days or HISTORY_EXPORT_MAX_DAYS
+    with db_connect() as conn:
+        days = [r[0] for r in conn.execute("SELECT day FROM history_dirty WHERE day < ? ORDER BY day LIMIT ?",
+                                           (today, max_days))]
+    partitions, total = [], 0
+    for day in days:
+        # Erst als erledigt markieren, dann lesen: Zeilen, die währenddessen dazukommen, markieren den Tag erneut
+        with db_connect() as conn:
+            conn.execute("DELETE FROM history_dirty WHERE day = ?", (day,))
+        try:
+            with db_connect() as conn:
+                rows = conn.execute("""SELECT timestamp, station, minutes, raw_text FROM stats_full
+                                       WHERE timestamp >= ? AND timestamp < ? ORDER BY timestamp, station""",
+                                    (day, (datetime.date.fromisoformat(day) + datetime.timedelta(days=1)).isoformat())).fetchall()
+            if rows:
+                _write_partition(directory, day, rows)
+        except Exception:
+            with db_connect() as conn:
+                conn.execute("INSERT OR IGNORE INTO history_dirty VALUES (?)", (day,))
+            raise
+        partitions.append(day)
+        total += len(rows)
+    with db_connect() as conn:
+        pending = conn.execute("SELECT COUNT(*) FROM history_dirty WHERE day < ?", (today,)).fetchone()[0]
+    return {"partitions": partitions, "rows": total, "pending": pending}
+
+def _history_bound(value):
+    # datetime (mit/ohne Zone), date oder 'YYYY-MM-DD[ HH:MM:SS]' -> naive Schweizer Lokalzeit
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    elif not isinstance(value, datetime.datetime):
+        value = datetime.datetime.combine(value, datetime.time())
+    if value.tzinfo:
+        value = value.astimezone(CH_TZ).replace(tzinfo=None)
+    return value
+
+def history_partitions(start, end, directory=None):
+    """Vorhandene Partitionsdateien, die [start, end) berühren."""
+    directory = directory or history_dir()
+    start, end = _history_bound(start), _history_bound(end)
+    day, files = start.date(), []
+    while datetime.datetime.combine(day, datetime.time()) < end:
+        path = _partition_path(directory, day.isoformat())
+        if os.path.exists(path):
+            files.append(path)
+        day += datetime.timedelta(days=1)
+    return files
+
+def read_history(start, end=None, columns=None, stations=None, directory=None):
+    """
+    Verlauf [start, end) aus den Parquet-Partitionen als DataFrame, ohne SQLite oder Sheets.
+    Gelesen werden nur die Tage im Bereich und nur die angefragten Spalten (plus die für Filter nötigen).
+    Der laufende Tag ist erst nach seinem Export enthalten.
+    """
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+    end = end or datetime.datetime.now(CH_TZ)
+    columns = list(columns or HISTORY_COLUMNS)
+    files = history_partitions(start, end, directory)
+    if not files:
+        return pd.DataFrame(columns=columns)
+    filter_columns = ["timestamp"] + (["station"] if stations else [])
+    table = pq.read_table(files, columns=columns + [c for c in filter_columns if c not in columns])
+    ts = table["timestamp"]
+    mask = pc.and_(pc.greater_equal(ts, pa.scalar(_history_bound(start), type=pa.timestamp("s"))),
+                   pc.less(ts, pa.scalar(_history_bound(end), type=pa.timestamp("s"))))
+    if stations:
+        mask = pc.and_(mask, pc.is_in(table["station"].cast(pa.string()), value_set=pa.array(list(stations))))
+    return table.filter(mask).select(columns).to_pandas()
+
+# --- WARTEZEIT-PROGNOSE (WOCHENTAG x 5-MINUTEN-SLOT) ---
+FORECAST_SLOT_MIN = 5
+FORECAST_SLOTS = 7 * 24 * 60 // FORECAST_SLOT_MIN  # 2016 Slots pro Woche
+FORECAST_HISTORY_WEEKS = 8      # Startwert des Profils = Mittel der letzten 8 Wochen
+FORECAST_ALPHA = 0.25           # Gewicht einer neuen Beobachtung im Slot (gleitend über die Wochen)
+FORECAST_BLEND_TAU_MIN = 60     # Abklingzeit der aktuellen Abweichung vom Profil
+FORECAST_RELOAD_S = 300         # Neu laden, damit Schreibzugriffe anderer Prozesse (Collector) ankommen
+
+_forecast_lock = threading.Lock()
+_forecast = {"loaded": None, "profile": {}, "n": {}, "latest": {}}
+
+def forecast_slots(times):
+    """Wochen-Slot (Mo 00:00 = 0) für ein Array naiver Schweizer Lokalzeiten."""
+    import numpy as np
+    times = np.asarray(times, dtype="datetime64[m]")
+    days = times.astype("datetime64[D]")
+    wd = (days.astype(np.int64) + 3) % 7  # 1970-01-01 war ein Donnerstag
+    return wd * (FORECAST_SLOTS // 7) + (times - days).astype(np.int64) // FORECAST_SLOT_MIN
+
+def _slot_of(ts_str):
+    ts = datetime.datetime.strptime(ts_str, '%Y-%m-%d %H:%M:%S')
+    return ts.weekday() * (FORECAST_SLOTS // 7) + (ts.hour * 60 + ts.minute) // FORECAST_SLOT_MIN
+
+def rebuild_forecast(conn, weeks=FORECAST_HISTORY_WEEKS):
+    """Berechnet das Profil komplett aus der stats-Historie (Migration bzw. Reparatur)."""
+    cutoff = (datetime.datetime.now(CH_TZ) - datetime.timedelta(weeks=weeks)).strftime('%Y-%m-%d %H:%M:%S')
+    conn.execute("DELETE FROM wait_forecast")
+    conn.execute(f"""INSERT INTO wait_forecast (station, slot, n, mean)
+                     SELECT station, ((CAST(strftime('%w', timestamp) AS INTEGER) + 6) % 7) * {FORECAST_SLOTS // 7}
+                                     + (CAST(strftime('%H', timestamp) AS INTEGER) * 60
+                                        + CAST(strftime('%M', timestamp) AS INTEGER)) / {FORECAST_SLOT_MIN},
+                            COUNT(*), AVG(minutes)
+                     FROM stats WHERE timestamp >= ? AND minutes < 500 GROUP BY 1, 2""", (cutoff,))
+    with _forecast_lock:
+        _forecast["loaded"] = None
+
+def update_forecast(conn, rows):
+    """Inkrementell pro Ingestion: ein Upsert je Station, Speicherkopie wird gleich mitgezogen."""
+    import numpy as np
+    rows = [(ts, station, int(minutes)) for ts, station, minutes, *_ in rows]
+    conn.executemany("""INSERT INTO wait_forecast (station, slot, n, mean) VALUES (?, ?, 1, ?)
+                        ON CONFLICT(station, slot) DO UPDATE SET
+                        mean = mean + MAX(?, 1.0 / (n + 1)) * (excluded.mean - mean), n = n + 1""",
+                     [(station, _slot_of(ts), minutes, FORECAST_ALPHA) for ts, station, minutes in rows if minutes < 500])
+    with _forecast_lock:
+        if _forecast["loaded"] is None:
+            return
+        for ts, station, minutes in rows:
+            _forecast["latest"][station] = (np.datetime64(ts, "m"), minutes)
+            if minutes >= 500:
+                continue
+            slot = _slot_of(ts)
+            profile = _forecast["profile"].setdefault(station, np.full(FORECAST_SLOTS, np.nan))
+            counts = _forecast["n"].setdefault(station, np.zeros(FORECAST_SLOTS, dtype=np.int64))
+            if counts[slot]:
+                profile[slot] += max(FORECAST_ALPHA, 1.0 / (counts[slot] + 1)) * (minutes - profile[slot])
+            else:
+                profile[slot] = minutes
+            counts[slot] += 1
+
+def _forecast_table():
+    import numpy as np
+    with _forecast_lock:
+        if _forecast["loaded"] is not None and time.monotonic() - _forecast["loaded"] < FORECAST_RELOAD_S:
+            return _forecast
+        profile, counts, latest = {}, {}, {}
+        try:
+            with db_connect() as conn:
+                for station, slot, n, mean in conn.execute("SELECT station, slot, n, mean FROM wait_forecast"):
+                    profile.setdefault(station, np.full(FORECAST_SLOTS, np.nan))[slot] = mean
+                    counts.setdefault(station, np.zeros(FORECAST_SLOTS, dtype=np.int64))[slot] = n
+                for station, ts, minutes in conn.execute(
+                        "SELECT station, MAX(timestamp), minutes FROM stats GROUP BY station"):
+                    latest[station] = (np.datetime64(ts, "m"), int(minutes))
+        except sqlite3.OperationalError:
+            pass
+        _forecast.update(loaded=time.monotonic(), profile=profile, n=counts, latest=latest)
+        return _forecast
+
+def forecast_waits(station, arrivals):
+    """
+    Erwartete Wartezeit (Min) bei Ankunft zu den Zeitpunkten `arrivals` (naive Lokalzeit, Array).
+    Profil des Wochen-Slots plus aktuelle Abweichung vom Profil, die mit dem Abstand zur Beobachtung abklingt.
+    """
+    import numpy as np
+    arrivals = np.asarray(arrivals, dtype="datetime64[m]")
+    table = _forecast_table()
+    profile = table["profile"].get(station)
+    obs_ts, obs = table["latest"].get(station, (None, None))
+    if obs is not None and obs >= 500:
+        obs = None  # Sperr-/Fehlerwert ist keine Warteschlange
+    if profile is None:
+        return np.full(arrivals.shape, float(obs or 0))
+    expected = profile[forecast_slots(arrivals)]
+    if obs is None:
+        return np.nan_to_num(expected)
+    baseline = profile[forecast_slots(obs_ts)]
+    anomaly = 0.0 if np.isnan(baseline) else obs - baseline
+    horizon = np.maximum((arrivals - obs_ts).astype(np.int64), 0)
+    blended = expected + anomaly * np.exp(-horizon / FORECAST_BLEND_TAU_MIN)
+    return np.maximum(np.where(np.isnan(expected), obs, blended), 0)
+
+def forecast_wait(station, arrival_time):
+    """Einzelwert für eine Ankunftszeit; aware Zeitstempel werden nach Schweizer Zeit umgerechnet."""
+    if arrival_time.tzinfo is not None:
+        arrival_time = arrival_time.astimezone(CH_TZ).replace(tzinfo=None)
+    return int(round(float(forecast_waits(station, [arrival_time])[0])))
+
+# --- INGESTION (COLLECTOR) & LESE-SEITE FÜR DIE UI ---
+
+STATUS_KEYS = {"furka_aktiv": "Furka", "loetschberg_aktiv": "Lötschberg"}
+
+def save_status(live):
+    try:
+        ts_str = current_slot()
+        # Nicht bestätigte Werte (Quelle gestört) nicht überschreiben: der alte Stand altert sichtbar
+        stale = live.get("stale_sources") or {}
+        rows = [(source, int(bool(live[key])), ts_str) for key, source in STATUS_KEYS.items()
+                if STATUS_SOURCE_OF[key] not in stale]
+        rows += [(p, int(bool(offen)), ts_str) for p, offen in (live.get("pass_status") or {}).items()]
+        with db_connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO feed_status VALUES (?, ?, ?)", rows)
+        _snapshot_record_status(rows)
+    except Exception as e: print(f"DB Error (Status): {e}")
+
+# --- SINGLE-FLIGHT: GENAU EINE INGESTION PRO SLOT (ÜBER THREADS UND PROZESSE) ---
+# Der Lease liegt in SQLite: wer die Zeile des Slots anlegt, ingestiert; alle anderen warten auf dessen Ergebnis.
+INGEST_LEASE_TTL_S = 120        # hängt ein Besitzer länger, darf ein anderer übernehmen
+INGEST_WAIT_S = 90              # so lange wartet ein Nicht-Besitzer höchstens auf das Ergebnis
+INGEST_POLL_S = 0.5
+INGEST_LEASE_RETENTION_DAYS = 2
+
+def _lease_owner():
+    return f"{os.getpid()}:{threading.get_ident()}"
+
+def acquire_ingest_lease(slot, owner=None, now=None):
+    """True, wenn `owner` den Slot ingestieren darf: Zeile neu angelegt oder abgelaufener Lease übernommen."""
+    owner, now = owner or _lease_owner(), now or time.time()
+    with db_connect() as conn:
+        if conn.execute("INSERT OR IGNORE INTO ingest_lease (slot, owner, acquired) VALUES (?, ?, ?)",
+                        (slot, owner, now)).rowcount:
+            return True
+        return conn.execute("""UPDATE ingest_lease SET owner = ?, acquired = ?
+                               WHERE slot = ? AND finished IS NULL AND acquired < ?""",
+                            (owner, now, slot, now - INGEST_LEASE_TTL_S)).rowcount == 1
+
+def finish_ingest_lease(slot, live, owner=None):
+    """Legt das Ergebnis für wartende Sessions/Prozesse ab und räumt alte Leases weg."""
+    cutoff = (datetime.datetime.now(CH_TZ) - datetime.timedelta(days=INGEST_LEASE_RETENTION_DAYS)).strftime('%Y-%m-%d %H:%M:%S')
+    with db_connect() as conn:
+        conn.execute("UPDATE ingest_lease SET finished = ?, result = ? WHERE slot = ? AND owner = ?",
+                     (time.time(), json.dumps(live, default=str), slot, owner or _lease_owner()))
+        conn.execute("DELETE FROM ingest_lease WHERE slot < ?", (cutoff,))
+
+def release_ingest_lease(slot, owner=None):
+    # Fehlgeschlagener Durchgang: Slot wieder freigeben, damit ein anderer es sofort versuchen kann
+    with db_connect() as conn:
+        conn.execute("DELETE FROM ingest_lease WHERE slot = ? AND owner = ? AND finished IS NULL",
+                     (slot, owner or _lease_owner()))
+
+def wait_for_ingest(slot, timeout=INGEST_WAIT_S):
+    """Ergebnis der laufenden Ingestion des Slots; None, wenn sie nicht rechtzeitig fertig wird."""
+    deadline = time.monotonic() + timeout
+    while True:
+        with db_connect() as conn:
+            row = conn.execute("SELECT finished, result FROM ingest_lease WHERE slot = ?", (slot,)).fetchone()
+        if row and row[0] is not None:
+            return json.loads(row[1])
+        if row is None or time.monotonic() >= deadline:
+            return None
+        time.sleep(INGEST_POLL_S)
+
+def ingest_cycle():
+    """
+    Ein kompletter Ingestion-Durchgang: alle Feeds holen, Wartezeiten + Status speichern, Sheets-Sync.
+    Läuft pro Slot genau einmal; parallele Aufrufer (andere Threads/Prozesse) bekommen dessen Ergebnis.
+    """
+    slot, owner = current_slot(), _lease_owner()
+    if not acquire_ingest_lease(slot, owner):
+        with timed("ingest:wait") as outcome:
+            live = wait_for_ingest(slot)
+            outcome["ok"] = live is not None
+        return live or get_latest_state()
+    try:
+        with timed("ingest"):
+            live = fetch_live_state()
+            store_wait_times(live["wait_times"])
+            save_status(live)
+        finish_ingest_lease(slot, live, owner)
+        # Nach der Freigabe: ein langer Export hält den Lease nicht fest
+        try:
+            with timed("history_export"):
+                export_history()
+        except Exception as e: print(f"History-Export Fehler: {e}")
+    except Exception:
+        release_ingest_lease(slot, owner)
+        raise
+    finally:
+        flush_metrics()
+    return live
+
+# Prozessweiter Snapshot: letzter Wert, Status und Ringpuffer je Station, von allen Sessions geteilt.
+# Der Schreiber (Ingestion im selben Prozess) trägt direkt ein; sonst wird nachgeladen, sobald
+# ein neuer Slot fällig ist (externer Collector), höchstens alle SNAPSHOT_RECHECK_S Sekunden.
+SNAPSHOT_RING_SIZE = 36     # 3 Stunden im 5-Minuten-Raster
+SNAPSHOT_RECHECK_S = 15
+STALE_AFTER_MIN = 15        # Wert/Status älter als 3 Slots -> in der UI als veraltet markiert
+
+_snapshot_lock = threading.Lock()
+_snapshot = {"db": None, "checked": 0.0, "state": None, "ring": {}}
+
+def _empty_state():
+    return {"wait_times": {}, "furka_aktiv": True, "loetschberg_aktiv": True,
+            "pass_status": {"Furkapass": False, "Grimselpass": False, "Nufenenpass": False, "Brünigpass": True},
+            "timestamp": None, "updated": {}}
+
+def _apply_status(state, status_rows):
+    for source, aktiv, *updated in status_rows:
+        if updated: state["updated"][source] = updated[0]
+        for key, name in STATUS_KEYS.items():
+            if source == name: state[key] = bool(aktiv)
+        if source in state["pass_status"]: state["pass_status"][source] = bool(aktiv)
+
+def _load_snapshot():
+    """Liest den zuletzt vom Collector geschriebenen Stand plus Ringpuffer aus der DB."""
+    state, ring = _empty_state(), {}
+    try:
+        with db_connect() as conn:
+            rows = conn.execute("""SELECT s.station, s.minutes, s.raw_text, s.timestamp FROM stats_full s
+                                   JOIN (SELECT station, MAX(timestamp) AS ts FROM stats GROUP BY station) m
+                                   ON s.station = m.station AND s.timestamp = m.ts""").fetchall()
+            status_rows = conn.execute("SELECT source, aktiv, updated FROM feed_status").fetchall()
+            # Ringpuffer = die letzten Slots vor dem jüngsten Datenpunkt (auch wenn der Collector länger stand)
+            latest = max((r[3] for r in rows), default=None)
+            cutoff = (datetime.datetime.strptime(latest, '%Y-%m-%d %H:%M:%S')
+                      - datetime.timedelta(minutes=5 * (SNAPSHOT_RING_SIZE - 1))).strftime('%Y-%m-%d %H:%M:%S') if latest else ""
+            recent = conn.execute("SELECT station, timestamp, minutes FROM stats WHERE timestamp >= ? ORDER BY station, timestamp",
+                                  (cutoff,)).fetchall()
+    except sqlite3.OperationalError:
+        # DB noch nicht initialisiert (Collector noch nie gelaufen)
+        return state, ring
+    for station, minutes, raw, ts in rows:
+        state["wait_times"][station] = {"min": minutes, "raw": raw}
+        state["updated"][station] = ts
+        state["timestamp"] = max(state["timestamp"] or ts, ts)
+    _apply_status(state, status_rows)
+    for station, ts, minutes in recent:
+        ring.setdefault(station, deque(maxlen=SNAPSHOT_RING_SIZE)).append((ts, minutes))
+    return state, ring
+
+def _current_snapshot():
+    with _snapshot_lock:
+        state = _snapshot["state"]
+        fresh = state is not None and _snapshot["db"] == DB_NAME and (
+            (state["timestamp"] or "") >= current_slot() or time.monotonic() - _snapshot["checked"] < SNAPSHOT_RECHECK_S)
+        if not fresh:
+            state, ring = _load_snapshot()
+            _snapshot.update(db=DB_NAME, checked=time.monotonic(), state=state, ring=ring)
+        return _snapshot
+
+def _snapshot_record_waits(rows):
+    with _snapshot_lock:
+        state = _snapshot["state"]
+        if state is None or _snapshot["db"] != DB_NAME:
+            return  # noch nie gelesen: der nächste Leser lädt ohnehin aus der DB
+        for ts, station, minutes, raw in rows:
+            state["wait_times"][station] = {"min": minutes, "raw": raw}
+            state["updated"][station] = ts
+            state["timestamp"] = max(state["timestamp"] or ts, ts)
+            ring = _snapshot["ring"].setdefault(station, deque(maxlen=SNAPSHOT_RING_SIZE))
+            if not ring or ring[-1][0] < ts:
+                ring.append((ts, minutes))
+
+def _snapshot_record_status(status_rows):
+    with _snapshot_lock:
+        if _snapshot["state"] is not None and _snapshot["db"] == DB_NAME:
+            _apply_status(_snapshot["state"], status_rows)
+
+def get_latest_state():
+    """
+    Letzter Stand aller Stationen (gleiche Form wie fetch_live_state) aus dem Prozess-Snapshot.
+    Löst keine Upstream-Abfragen aus und liest die DB nur, wenn ein neuer Slot fällig ist.
+    "stale" nennt Stationen/Status, die seit mehr als STALE_AFTER_MIN nicht bestätigt wurden (Name -> Alter in Min).
+    """
+    snap = _current_snapshot()
+    now = datetime.datetime.now(CH_TZ).replace(tzinfo=None)
+    with _snapshot_lock:
+        state = snap["state"]
+        ages = {name: int((now - datetime.datetime.strptime(ts, '%Y-%m-%d %H:%M:%S')).total_seconds() // 60)
+                for name, ts in state["updated"].items() if ts}
+        return {**state, "wait_times": {k: dict(v) for k, v in state["wait_times"].items()},
+                "pass_status": dict(state["pass_status"]), "updated": dict(state["updated"]),
+                "stale": {name: age for name, age in ages.items() if age > STALE_AFTER_MIN}}
+
+def get_recent_wait_times():
+    """Ringpuffer der letzten Slots je Station: {Station: [(timestamp, minutes), ...]} (älteste zuerst)."""
+    snap = _current_snapshot()
+    with _snapshot_lock:
+        return {station: list(ring) for station, ring in snap["ring"].items()}
+
+def seconds_until_next_ingest(now=None):
+    now = now or datetime.datetime.now(CH_TZ)
+    seconds_past_interval = (now.minute % 5) * 60 + now.second
+    seconds_to_wait = (INGEST_INTERVAL - seconds_past_interval) + INGEST_OFFSET
+    if seconds_to_wait < INGEST_OFFSET:
+        seconds_to_wait += INGEST_INTERVAL
+    return seconds_to_wait
+
+# --- GOOGLE MAPS: GEBÜNDELTE DISTANCE-MATRIX-ABFRAGEN ---
+
+MAPS_URL = "https://maps.googleapis.com/maps/api/distancematrix/json"
+MAPS_TIMEOUT = 10
+MAPS_MAX_PER_SIDE = 25     # Limit der Distance Matrix API pro Seite
+MAPS_MAX_ELEMENTS = 100    # Limit Elemente (Origins x Destinations) pro Request
+_maps_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="maps")
+
+def plan_matrix_requests(legs):
+    """
+    Teilt die benötigten Teilstrecken (origin, destination) auf möglichst wenige Matrix-Requests auf.
+    Gierig: immer die grösste Gruppe mit gemeinsamem Start bzw. Ziel zuerst; jedes Element wird gebraucht.
+    """
+    remaining = set(legs)
+    requests_plan = []
+    while remaining:
+        by_origin, by_dest = defaultdict(set), defaultdict(set)
+        for o, d in remaining:
+            by_origin[o].add(d)
+            by_dest[d].add(o)
+        o_best = max(by_origin, key=lambda k: len(by_origin[k]))
+        d_best = max(by_dest, key=lambda k: len(by_dest[k]))
+        if len(by_origin[o_best]) >= len(by_dest[d_best]):
+            origins, dests = [o_best], sorted(by_origin[o_best])[:min(MAPS_MAX_PER_SIDE, MAPS_MAX_ELEMENTS)]
+        else:
+            origins, dests = sorted(by_dest[d_best])[:min(MAPS_MAX_PER_SIDE, MAPS_MAX_ELEMENTS)], [d_best]
+        requests_plan.append((origins, dests))
+        remaining -= {(o, d) for o in origins for d in dests}
+    return requests_plan
+
+def _fetch_matrix(origins, destinations, avoid_tolls):
+    """Ein Distance-Matrix-Request; gibt {(origin, destination): Sekunden} für alle OK-Elemente zurück."""
+    params = {"origins": "|".join(origins), "destinations": "|".join(destinations), "mode": "driving",
+              "departure_time": "now", "traffic_model": "best_guess", "key": get_setting("G_MAPS_API_KEY")}
+    if avoid_tolls: params["avoid"] = "tolls"
+    with timed("maps") as outcome:
+        data = get_http_session().get(MAPS_URL, params=params, timeout=MAPS_TIMEOUT).json()
+        outcome["ok"] = data.get("status") == "OK"
+    result = {}
+    if data.get("status") != "OK": return result
+    for o, row in zip(origins, data["rows"]):
+        for d, el in zip(destinations, row["elements"]):
+            if el.get("status") == "OK":
+                result[(o, d)] = el.get("duration_in_traffic", el.get("duration"))["value"]
+    return result
+
+# --- PERSISTENTER FAHRZEIT-SPEICHER MIT WOCHENPROFIL ---
+
+TRAVEL_TIME_FRESHNESS_MIN = 15      # so alt darf eine Beobachtung sein, um direkt verwendet zu werden
+TRAVEL_PROFILE_MAX_AGE_DAYS = 28    # Beobachtungen für das Wochenprofil
+TRAVEL_PROFILE_MIN_SAMPLES = 2
+_travel_stats = {"fresh": 0, "profile": 0, "api": 0, "requests_saved": 0}
+_travel_stats_lock = threading.Lock()
+
+def normalize_place(name):
+    return " ".join(unicodedata.normalize("NFC", name).strip().lower().split())
+
+def time_of_week_bucket(now=None):
+    now = now or datetime.datetime.now(CH_TZ)
+    return now.weekday() * 24 + now.hour
+
+def lookup_travel_times(legs, avoid_tolls=False, now=None):
+    """
+    Fahrzeiten (Sekunden) aus dem lokalen Speicher: zuerst frische Beobachtungen, sonst das Profil
+    desselben Wochen-Buckets. Gibt {leg: (Sekunden, 'fresh' | 'profile')} für die gefundenen Legs zurück.
+    """
+    now = now or datetime.datetime.now(CH_TZ)
+    freshness = get_setting("TRAVEL_TIME_FRESHNESS_MIN", TRAVEL_TIME_FRESHNESS_MIN)
+    fresh_cutoff = (now - datetime.timedelta(minutes=freshness)).strftime('%Y-%m-%d %H:%M:%S')
+    profile_cutoff = (now - datetime.timedelta(days=TRAVEL_PROFILE_MAX_AGE_DAYS)).strftime('%Y-%m-%d %H:%M:%S')
+    bucket = time_of_week_bucket(now)
+    found = {}
+    try:
+        with db_connect() as conn:
+            for o, d in legs:
+                key = (normalize_place(o), normalize_place(d), int(avoid_tolls))
+                row = conn.execute("""SELECT seconds FROM travel_times WHERE origin = ? AND destination = ? AND avoid_tolls = ?
+                                      AND observed >= ? ORDER BY observed DESC LIMIT 1""", (*key, fresh_cutoff)).fetchone()
+                if row:
+                    found[(o, d)] = (row[0], "fresh")
+                    continue
+                n, avg = conn.execute("""SELECT COUNT(*), AVG(seconds) FROM travel_times WHERE origin = ? AND destination = ?
+                                         AND avoid_tolls = ? AND bucket = ? AND observed >= ?""", (*key, bucket, profile_cutoff)).fetchone()
+                if n >= TRAVEL_PROFILE_MIN_SAMPLES:
+                    found[(o, d)] = (int(avg), "profile")
+    except sqlite3.OperationalError:
+        pass
+    return found
+
+def record_travel_times(seconds_by_leg, avoid_tolls=False, now=None):
+    now = now or datetime.datetime.now(CH_TZ)
+    ts, bucket = now.strftime('%Y-%m-%d %H:%M:%S'), time_of_week_bucket(now)
+    rows = [(normalize_place(o), normalize_place(d), int(avoid_tolls), bucket, sec, ts) for (o, d), sec in seconds_by_leg.items()]
+    # Älter als das Profil-Fenster wird nie mehr gelesen
+    cutoff = (now - datetime.timedelta(days=TRAVEL_PROFILE_MAX_AGE_DAYS)).strftime('%Y-%m-%d %H:%M:%S')
+    try:
+        with db_connect() as conn:
+            conn.executemany("INSERT INTO travel_times VALUES (?, ?, ?, ?, ?, ?)", rows)
+            conn.execute("DELETE FROM travel_times WHERE observed < ?", (cutoff,))
+    except sqlite3.OperationalError as e: print(f"DB Error (Fahrzeiten): {e}")
+
+def get_travel_time_stats():
+    with _travel_stats_lock:
+        stats = dict(_travel_stats)
+    total = stats["fresh"] + stats["profile"] + stats["api"]
+    stats["hit_rate"] = round((stats["fresh"] + stats["profile"]) / total, 3) if total else 0.0
+    return stats
+
+def get_google_maps_durations(routes, avoid_tolls=False):
+    """
+    Fahrzeiten in Minuten für mehrere Routen auf einmal.
+    routes: {Name: [Start, Wegpunkt..., Ziel]}. Teilstrecken kommen zuerst aus dem lokalen Fahrzeit-Speicher;
+    nur fehlende werden zu möglichst wenigen, parallelen Matrix-Requests gebündelt.
+    Fehlt eine Teilstrecke, gibt die Route 999 zurück.
+    """
+    legs = {(a, b) for stops in routes.values() for a, b in zip(stops, stops[1:])}
+    stored = lookup_travel_times(legs, avoid_tolls)
+    seconds = {leg: sec for leg, (sec, _) in stored.items()}
+    missing = legs - set(stored)
+    plan = plan_matrix_requests(missing)
+    futures = [_maps_executor.submit(_fetch_matrix, o, d, avoid_tolls) for o, d in plan]
+    wait(futures, timeout=MAPS_TIMEOUT + 2)
+    fetched = {}
+    for f in futures:
+        try:
+            if f.done(): fetched.update(f.result())
+        except Exception as e: print(f"Maps Fehler: {e}")
+    if fetched: record_travel_times(fetched, avoid_tolls)
+    seconds.update(fetched)
+    with _travel_stats_lock:
+        for _, source in stored.values(): _travel_stats[source] += 1
+        _travel_stats["api"] += len(missing)
+        _travel_stats["requests_saved"] += len(plan_matrix_requests(legs)) - len(plan)
+    result = {}
+    for name, stops in routes.items():
+        parts = [seconds.get(leg) for leg in zip(stops, stops[1:])]
+        result[name] = sum(parts) // 60 if parts and None not in parts else 999
+    return result
+
+# --- FAHRPLAN-TABELLEN (BISECT / NUMPY) ---
+
+def _hm(h, m): return h * 60 + m
+
+def _every(hours, minutes): return [_hm(h, m) for h in hours for m in minutes]
+
+# Abfahrten in Minuten ab Mitternacht, je Tagestyp
+FURKA_FAHRPLAN = {
+    "mo": _every(range(6, 21), (5, 35)) + [_hm(21, 5)],
+    "di-do": _every(range(6, 22), (5,)),
+    "fr-so": _every(range(6, 22), (5, 35)) + [_hm(22, 5)],
+}
+LOETSCHBERG_FAHRPLAN = {
+    "mo-do": [_hm(5, 25), _hm(5, 43)] + _every(range(6, 22), (13, 43)) + [_hm(22, 48), _hm(23, 28)],
+    "fr-so": [_hm(5, 25), _hm(5, 27), _hm(5, 43), _hm(5, 58)] + _every(range(6, 24), (13, 27, 43, 58)),
+}
+
+# Fahrplanperioden pro Verlad: Gültigkeit (None = offen) und Tagestyp je Wochentag (Mo=0 ... So=6)
+SERVICE_PERIODS = {
+    "furka": [{"von": None, "bis": None, "fahrplan": FURKA_FAHRPLAN,
+               "wochentage": ("mo", "di-do", "di-do", "di-do", "fr-so", "fr-so", "fr-so")}],
+    "loetschberg": [{"von": None, "bis": None, "fahrplan": LOETSCHBERG_FAHRPLAN,
+                     "wochentage": ("mo-do", "mo-do", "mo-do", "mo-do", "fr-so", "fr-so", "fr-so")}],
+}
+BOARDING_BUFFER_MIN = 10  # Mindestzeit zwischen Ankunft an der Station und Abfahrt
+
+def _week_table(period):
+    """Alle Abfahrten einer Woche als sortierte Liste in Minuten ab Montag 00:00 (plus Montag der Folgewoche)."""
+    week = [wd * 1440 + m for wd, day_type in enumerate(period["wochentage"]) for m in sorted(period["fahrplan"][day_type])]
+    week.append(7 * 1440 + week[0])
+    return week
+
+for _periods in SERVICE_PERIODS.values():
+    for _period in _periods:
+        _period["woche_liste"] = _week_table(_period)
+
+def _service_period(route, day):
+    for period in SERVICE_PERIODS[route]:
+        if (period["von"] is None or period["von"] <= day) and (period["bis"] is None or day <= period["bis"]):
+            return period
+    raise ValueError(f"Kein Fahrplan für {route} am {day}")
+
+def next_departure(route, arrival_time):
+    """Nächste Abfahrt mindestens BOARDING_BUFFER_MIN nach der Ankunft (Sekunden werden ignoriert)."""
+    period = _service_period(route, arrival_time.date())
+    key = arrival_time.weekday() * 1440 + arrival_time.hour * 60 + arrival_time.minute + BOARDING_BUFFER_MIN
+    dep = period["woche_liste"][bisect_left(period["woche_liste"], key)]
+    offset = dep - arrival_time.weekday() * 1440
+    day_start = arrival_time.replace(hour=0, minute=0, second=0, microsecond=0)
+    return day_start + datetime.timedelta(minutes=offset)
+
+def next_departures(route, arrival_times):
+    """
+    Batch-Variante von next_departure: nimmt beliebig viele Ankunftszeiten (naiv, Lokalzeit)
+    und liefert die nächsten Abfahrten als datetime64[m]-Array in einem NumPy-Durchgang.
+    """
+    import numpy as np
+    arrivals = np.asarray(arrival_times, dtype="datetime64[m]")
+    days = arrivals.astype("datetime64[D]")
+    minute_of_day = (arrivals - days).astype(np.int64)
+    weekday = (days.astype(np.int64) + 3) % 7  # 1970-01-01 war ein Donnerstag
+    keys = weekday * 1440 + minute_of_day + BOARDING_BUFFER_MIN
+    result = np.empty(arrivals.shape, dtype="datetime64[m]")
+    for period in SERVICE_PERIODS[route]:
+        mask = np.ones(arrivals.shape, dtype=bool)
+        if period["von"] is not None: mask &= days >= np.datetime64(period["von"], "D")
+        if period["bis"] is not None: mask &= days <= np.datetime64(period["bis"], "D")
+        woche = np.asarray(period["woche_liste"], dtype=np.int64)
+        deps = woche[np.searchsorted(woche, keys[mask])]
+        result[mask] = days[mask] + (deps - weekday[mask] * 1440).astype("timedelta64[m]")
+    return result
+
+def get_furka_departure(arrival_time):
+    return next_departure("furka", arrival_time)
+
+def get_loetschberg_departure(arrival_time):
+    return next_departure("loetschberg", arrival_time)
+
+# --- PLANER: BESTE ABFAHRTSZEIT ÜBER DIE NÄCHSTEN 24 H ---
+
+VERLAD_ROUTEN = {
+    "Furka": {"route": "furka", "station": "Realp", "verlad": "Autoverlad Realp", "ausstieg": "Oberwald", "zug_dauer": 25},
+    "Lötschberg": {"route": "loetschberg", "station": "Kandersteg", "verlad": "Autoverlad Kandersteg", "ausstieg": "Goppenstein", "zug_dauer": 20},
+}
+
+def plan_departures(legs, jetzt, hours=24, step_min=15):
+    """
+    Bewertet alle Abfahrts-Slots der nächsten `hours` Stunden vektorisiert.
+    legs: {Name: {"anfahrt": Min, "ziel": Min, "verlad": Schlüssel aus VERLAD_ROUTEN oder None}}.
+    Fahrzeiten werden einmal erhoben und für alle Slots verwendet (keine Maps-Abfrage pro Slot).
+    """
+    import pandas as pd
+    import numpy as np
+    start = np.datetime64(jetzt.replace(second=0, microsecond=0, tzinfo=None), "m")
+    abfahrt = start + np.arange(0, hours * 60 + 1, step_min).astype("timedelta64[m]")
+    frames = []
+    for name, leg in legs.items():
+        anfahrt = np.timedelta64(int(leg["anfahrt"]), "m")
+        ankunft_station = abfahrt + anfahrt
+        if leg.get("verlad"):
+            spec = VERLAD_ROUTEN[leg["verlad"]]
+            zug = next_departures(spec["route"], ankunft_station)
+            fahrplan_warte = (zug - ankunft_station).astype(np.int64)
+            stau = forecast_waits(spec["station"], ankunft_station)
+            warte = np.maximum(fahrplan_warte, np.rint(stau).astype(np.int64))
+            total = int(leg["anfahrt"]) + warte + spec["zug_dauer"] + int(leg["ziel"])
+        else:
+            warte = np.zeros(len(abfahrt), dtype=np.int64)
+            total = np.full(len(abfahrt), int(leg["anfahrt"]) + int(leg["ziel"]), dtype=np.int64)
+        frames.append(pd.DataFrame({
+            "abfahrt": abfahrt, "route": name, "warte_min": warte, "total_min": total,
+            "ankunft": abfahrt + total.astype("timedelta64[m]"),
+        }))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+# Passrouten für den Sommer-Planer: Name -> (Pass, Wegpunkte zwischen Start und Ziel)
+PASS_ROUTEN = {
+    "Via Furkapass": ("Furkapass", ["Furkapass"]),
+    "Via Grimselpass": ("Grimselpass", ["Brünigpass", "Grimselpass"]),
+    "Via Nufenenpass": ("Nufenenpass", ["Airolo", "Nufenenpass"]),
+}
+
+def plan_best_departures(start, live, step_min=15, passes=False, ziel="Ried-Mörel"):
+    """
+    Planer der Entscheidungshilfen: baut aus dem Live-Status die offenen Routen (Autoverlade, mit passes=True
+    auch die Passstrassen), fragt alle Fahrzeiten gebündelt ab und bewertet die Abfahrts-Slots via plan_departures.
+    Routen ohne Fahrzeit (Maps-Fehler) fallen weg.
+    """
+    strecken, legs = {}, {}
+    for verlad, spec in VERLAD_ROUTEN.items():
+        if live[f"{spec['route']}_aktiv"]:
+            name = f"Via {verlad}"
+            strecken[f"{name}:anfahrt"] = [start, spec["verlad"]]
+            strecken[f"{name}:ziel"] = [spec["ausstieg"], ziel]
+            legs[name] = verlad
+    if passes:
+        pass_status = live["pass_status"]
+        for name, (pass_name, waypoints) in PASS_ROUTEN.items():
+            if pass_status.get(pass_name, False) and (pass_name != "Grimselpass" or pass_status.get("Brünigpass", True)):
+                strecken[f"{name}:anfahrt"] = [start, *waypoints, ziel]
+                legs[name] = None
+    dauer = get_google_maps_durations(strecken)
+    legs = {name: {"anfahrt": dauer[f"{name}:anfahrt"], "ziel": dauer.get(f"{name}:ziel", 0), "verlad": verlad}
+            for name, verlad in legs.items()}
+    legs = {k: v for k, v in legs.items() if v["anfahrt"] < 999 and v["ziel"] < 999}
+    return plan_departures(legs, datetime.datetime.now(CH_TZ), step_min=step_min)
+
+# --- STATUS-CHECKS MIT ORIGINALEN PROMPTS ---
+
+# --- LOKALER SPERR-KLASSIFIKATOR (GEMINI NUR BEI UNSICHEREN FÄLLEN) ---
+
+CLOSURE_TERMS = ("eingestellt", "geschlossen", "gesperrt", "unterbrochen", "sperrung", "unterbruch",
+                 "kein verlad", "keine verladung", "interrompu", "fermé", "interrotto", "chiuso", "suspended", "closed")
+# Ausfälle einzelner Züge sind keine Betriebseinstellung: nur schwaches Signal, entscheidet Gemini
+CANCELLATION_TERMS = ("ausfall", "ausfälle", "fällt aus", "fallen aus", "annulé", "soppresso", "cancelled")
+PARTIAL_TERMS = ("einzelne", "vereinzelt", "teilweise", "nächste", "verspätung", "verspätet")
+REOPEN_TERMS = ("wieder in betrieb", "wieder offen", "wieder geöffnet", "aufgehoben", "normalbetrieb",
+                "verkehrt wieder", "verkehren wieder", "fährt wieder", "fahren wieder", "wieder normal", "behoben",
+                "verkehrt normal", "verkehren normal", "planmässig", "nicht betroffen")
+CAR_TRAIN_TERMS = ("autoverlad", "autozug", "autozüge", "autoverladung", "verlad", "autotransport",
+                   "chargement des voitures", "carico auto")
+# Verladestationen werden auch vom Regionalverkehr bedient: allein kein sicherer Hinweis auf den Autoverlad
+CAR_TRAIN_STATIONS = ("realp", "oberwald", "kandersteg", "goppenstein")
+OTHER_SERVICE_TERMS = ("glacier express", "zermatt", "regionalverkehr", "regionalzug", "personenzug", "personenverkehr",
+                       "bahnersatz", "ersatzbus", "bus", "schienenersatz", "fernverkehr", "interregio", "regioexpress",
+                       "s-bahn", "göschenen", "andermatt", "disentis", "brig", "visp", "spiez", "frutigen", "bergstrecke")
+CLASSIFIER_MIN_CONFIDENCE = 0.75
+
+def _terms_pattern(terms):
+    # Wortanfang als Grenze: "autozug" trifft auch "Autozuges", aber "bus" nicht "Omnibus"
+    return re.compile(r"\b(?:" + "|".join(re.escape(t) for t in terms) + ")", re.IGNORECASE)
+
+_CLOSURE_RE = _terms_pattern(CLOSURE_TERMS)
+_CANCELLATION_RE = _terms_pattern(CANCELLATION_TERMS)
+_CAR_TRAIN_STATION_RE = _terms_pattern(CAR_TRAIN_STATIONS)
+# Einzelner Zug ("Ausfall 14:30") oder ausdrücklich nur ein Teil der Züge
+_PARTIAL_RE = re.compile(_terms_pattern(PARTIAL_TERMS).pattern + r"|\b\d{1,2}[:.]\d{2}\b", re.IGNORECASE)
+_REOPEN_RE = _terms_pattern(REOPEN_TERMS)
+_CAR_TRAIN_RE = _terms_pattern(CAR_TRAIN_TERMS)
+_OTHER_SERVICE_RE = _terms_pattern(OTHER_SERVICE_TERMS)
+
+def classify_closure_item(text):
+    """
+    Regelbasierte Einschätzung einer einzelnen Meldung.
+    Gibt ('GESPERRT' | 'OFFEN' | None, Konfidenz) zurück; None = Meldung sagt nichts über den Betrieb.
+    Sicher (>= CLASSIFIER_MIN_CONFIDENCE) ist GESPERRT nur bei einer Einstellung des Autoverlads selbst;
+    Zugausfälle und Meldungen, die nur eine Station nennen, bleiben unsicher und gehen an Gemini.
+    """
+    closure = _CLOSURE_RE.search(text) is not None
+    if not closure and not _CANCELLATION_RE.search(text):
+        return None, 0.0
+    reopen = _REOPEN_RE.search(text) is not None
+    car_train = _CAR_TRAIN_RE.search(text) is not None
+    station = _CAR_TRAIN_STATION_RE.search(text) is not None
+    other = _OTHER_SERVICE_RE.search(text) is not None
+    if reopen: return "OFFEN", 0.85
+    if not closure:
+        # Nur Ausfälle: einzelne Züge heisst Betrieb läuft, pauschal "Autozüge fallen aus" eher zu
+        if not (car_train or station) or other: return "OFFEN", 0.85
+        return ("OFFEN", 0.6) if _PARTIAL_RE.search(text) else ("GESPERRT", 0.6)
+    if car_train and not other: return "GESPERRT", 0.95
+    if car_train or station: return "GESPERRT", 0.6
+    if other: return "OFFEN", 0.85
+    return "GESPERRT", 0.5
+
+def classify_closure(items):
+    """
+    Aggregiert die Einzelmeldungen zu einer Entscheidung samt Konfidenz.
+    Ohne Sperr-Stichwort gilt der Betrieb (wie bisher) als offen.
+    """
+    return _aggregate_closure([(text, classify_closure_item(text)) for text in items])
+
+def _aggregate_closure(classified):
+    decisions = [(d, c, text) for text, (d, c) in classified if d]
+    if not decisions:
+        return {"decision": "OFFEN", "confidence": 0.98, "reason": "keine Sperrmeldung"}
+    closed = [x for x in decisions if x[0] == "GESPERRT"]
+    if closed:
+        d, c, text = max(closed, key=lambda x: x[1])
+        return {"decision": "GESPERRT", "confidence": c, "reason": text[:160]}
+    d, c, text = min(decisions, key=lambda x: x[1])
+    return {"decision": "OFFEN", "confidence": c, "reason": text[:160]}
+
+def _llm_closure_decision(prompt, local):
+    """Fragt Gemini; versteht die Antwort weder OFFEN noch GESPERRT, gilt die lokale Entscheidung."""
+    answer = generate_content_with_fallback(prompt).upper()
+    if "GESPERRT" in answer: return dict(local, decision="GESPERRT", source="gemini")
+    if "OFFEN" in answer: return dict(local, decision="OFFEN", source="gemini")
+    return dict(local, source="regeln")
+
+def classify_furka_status(response):
+    # Einzelbewertungen stammen aus den Feed-Records: nur neue/geänderte Items wurden neu klassifiziert
+    records = process_feed("mgb_furka", response.content)
+    items = [r["text"] for r in records]
+    local = dict(_aggregate_closure([(r["text"], r["closure"]) for r in records]), source="regeln")
+    if local["confidence"] >= CLASSIFIER_MIN_CONFIDENCE:
+        return local
+    feed_text = " | ".join(items)
+    prompt = f"""
+        Analysiere diesen RSS-Feed der Matterhorn Gotthard Bahn: "{feed_text}"
+        
+        FRAGE: Ist der AUTOVERLAD (Autozüge) am Furka zwischen Realp und Oberwald aktuell eingestellt oder gesperrt?
+        HINWEIS: Meldungen über den Glacier Express, den Regionalverkehr oder andere Linien (z.B. Visp-Zermatt) 
+        bedeuten NICHT, dass der Autoverlad am Furka zu ist.
+        
+        Antworte NUR mit 'GESPERRT' oder 'OFFEN'.
+        """
+    return _llm_closure_decision(prompt, local)
+
+def classify_loetschberg_status(payload):
+    items = [n.get("title", "") for n in payload.get("trafficInformations", [])]
+    local = dict(classify_closure(items), source="regeln")
+    if local["confidence"] >= CLASSIFIER_MIN_CONFIDENCE:
+        return local
+    meldungen = " | ".join(items)
+    prompt = f"""
+        Analysiere diese Verkehrsmeldungen der BLS: "{meldungen}"
+        
+        FRAGE: Ist der AUTOVERLAD (Autozüge) zwischen Kandersteg und Goppenstein aktuell GESPERRT?
+        HINWEIS: Ein Unterbruch des BAHNVERKEHRS (Personenzüge) bedeutet NICHT zwingend, dass der Autoverlad zu ist.
+        
+        Antworte NUR mit 'GESPERRT' oder 'OFFEN'.
+        """
+    return _llm_closure_decision(prompt, local)
+
+def check_furka_status(response):
+    if response.status_code != 200: return True
+    return classify_furka_status(response)["decision"] == "OFFEN"
+
+def check_loetschberg_status(payload):
+    return classify_loetschberg_status(payload)["decision"] == "OFFEN"
+
+def parse_pass_status(content):
+    status_dict = {"Furkapass": False, "Grimselpass": False, "Nufenenpass": False, "Brünigpass": True}
+    try:
+        for record in process_feed("alpen_paesse", content):
+            title = record["title"]
+            for p in status_dict.keys():
+                if p in title:
+                    if "offen" in title.lower(): status_dict[p] = True
+                    elif any(x in title.lower() for x in ["wintersperre", "geschlossen", "gesperrt"]): status_dict[p] = False
+    except: pass
+    return status_dict
+
+# Ohne Antwort (auch keine alte) gilt der zuletzt gespeicherte Status statt pauschal "offen"
+def get_furka_status():
+    response = fetch_source("mgb_furka", stale_ok=True)
+    try: return check_furka_status(response) if response is not None else get_latest_state()["furka_aktiv"]
+    except Exception as e:
+        print(f"Fehler Furka-Status: {e}")
+        return get_latest_state()["furka_aktiv"]
+
+def get_loetschberg_status():
+    response = fetch_source("bls_traffic", stale_ok=True)
+    try: return check_loetschberg_status(response.json()) if response is not None else get_latest_state()["loetschberg_aktiv"]
+    except Exception as e:
+        print(f"Fehler Lötschberg-Status: {e}")
+        return get_latest_state()["loetschberg_aktiv"]
+
+def get_pass_status():
+    response = fetch_source("alpen_paesse", stale_ok=True)
+    return parse_pass_status(response.content) if response is not None else get_latest_state()["pass_status"]
+
+# --- KI REPORTE MIT ORIGINALEN PROMPTS ---
+
+def get_gemini_summer_report(routen_daten, pass_status):
+    machbare = {k: v for k, v in routen_daten.items() if v < 9000}
+    paesse_offen = any([pass_status.get("Furkapass"), pass_status.get("Grimselpass"), pass_status.get("Nufenenpass")])
+    prompt = f"""
+        Du bist ein herzlicher, urchiger Schweizer Bergführer im Sommer.
+        Analysiere diese Lage für die Fahrt nach Ried-Mörel:
+        - Pässe-Status: {pass_status}
+        - Fahrzeiten (was noch geht): {machbare}
+
+        STRATEGISCHE ANWEISUNGEN:
+        1. FALL BEIDE VERLADE ZU (Furka & Lötschberg): Preise die Pässe (Furka, Grimsel oder Nufenen) als die 'perfekte Ausweichroute' an. Schwärme von der Freiheit auf der Strasse und dem Panorama! 🏔️
+        2. FALL ALLES ZU (Verlade UND Pässe): Schlage mit einem Augenzwinkern vor, jetzt den Helikopter zu rufen, da Ried-Mörel sonst nur noch für Adler erreichbar ist. 🚁
+        3. FALL NORMALBETRIEB: Wenn ein Pass offen ist und maximal 20 Min länger dauert als der Tunnel, befiehl fast schon den Pass zu nehmen – wegen der Aussicht. ☀️
+        4. ZUSATZINFO: Brünigpass-Status nur erwähnen, wenn Lötschberg ein Thema ist.
+
+        TONFALL:
+        - Begeistert, herzlich, maximal 4 Sätze.
+        - Emojis: 🏔️, ☀️, 🏎️, 🚁, 🧀.
+        """
+    return generate_content_with_fallback(prompt)
+
+def get_gemini_winter_report(winter_daten):
+    f_aktiv = winter_daten.get('furka_aktiv', False)
+    l_aktiv = winter_daten.get('loetschberg_aktiv', False)
+    prompt = f"""
+        Du bist ein humorvoller, aber sehr kompetenter Schweizer Bergführer.
+        Analysiere die aktuelle Winter-Verkehrslage nach Ried-Mörel:
+
+        DATEN:
+        - Autoverlad Lötschberg: {'AKTIV' if l_aktiv else 'GESPERRT'} (Zeit: {winter_daten.get('total_l')} Min)
+        - Autoverlad Furka: {'AKTIV' if f_aktiv else 'GESPERRT'} (Zeit: {winter_daten.get('total_f')} Min)
+        - Nächste Abfahrten: Lötschberg {winter_daten.get('abfahrt_l')}, Furka {winter_daten.get('abfahrt_f')}
+
+        AUFGABE:
+        1. TOTALAUSFALL: Wenn BEIDE Verladestationen gesperrt sind, rate dem User DRINGEND, zu Hause zu bleiben. 
+           Empfiehl eine lustige Indoor-Aktivität (z.B. Käsefondue im Wohnzimmer, "Trocken-Skifahren" auf dem Teppich oder Walliser Weisswein-Degustation im Pyjama).
+        2. NUR EINER OFFEN: Erkläre kurz, dass dies aktuell die einzige Verbindung ins Wallis ist.
+        3. BEIDE OFFEN: Vergleiche Wartezeiten und Abfahrten, empfiehl die effizienteste Route.
+        4. TONFALL: Herzlich, "urchig" schweizerisch, max. 4 Sätze. Nutze Emojis: ❄️, 🧀, 🍷, 🚂.
+        """
+    return generate_content_with_fallback(prompt)
+
+def get_gemini_situation_report(current_data, df_history):
+    trend_summary = ""
+    if df_history is not None and not df_history.empty:
+        latest_entries = df_history.head(20) 
+        trend_summary = latest_entries[['timestamp', 'station', 'minutes']].to_string()
+
+    prompt = f"""
+        Du bist ein Experte für Verkehrsfluss beim Schweizer Autoverlad.
+        Analysiere die aktuelle Lage und den Trend der letzten Stunden:
+        
+        AKTUELL: {current_data}
+        HISTORIE/TREND: {trend_summary}
+
+        AUFGABE:
+        - Erstelle einen kompakten Lagebericht (max. 3-4 Sätze). Der Text soll ohne Überschrift ausgegeben werden.
+        - Erwähne, ob die Wartezeiten gerade steigen, fallen oder stabil sind.
+        - Fasse die Lage in Richtung Wallis (Realp, Kandersteg) und in Richtung Mittelland (Oberwald, Goppenstein) zusammen.
+        - Nutze Sätze wie "am Furka Autoverlad in xxx...", "Auf dem Weg ins Wallis in xxx ...", "Vor dem Autoverlad in xxx..." oder ähnlich.
+        - Gib eine kurze Empfehlung (z.B. "Geduld einpacken" oder "Freie Fahrt").
+        - Tonalität: Sachlich, hilfsbereit, leicht "schweizerisch" angehaucht.
+        - Nutze sparsam Emojis passend zur Lage (🚗, ⏳, ✅, ⚠️).
+        """
+    return generate_content_with_fallback(prompt)
@@ -1,16 +1,21 @@
 import streamlit as st
 import datetime
+import time
 from logic import (
-    get_latest_wait_times, 
-    get_google_maps_duration, 
+    forecast_wait,
+    get_google_maps_durations,
     get_furka_departure, 
     get_loetschberg_departure,
-    get_furka_status,
-    get_loetschberg_status, # Neu importiert
-    get_pass_status,
+    get_latest_state,
+    render_planner,
+    get_travel_time_stats,
+    record_metric,
+    CH_TZ,
     get_gemini_summer_report
 )
 
+render_start = time.perf_counter()
+
 # 1. Seiteneinstellungen
 st.set_page_config(page_title="Routen-Check Wallis | Sommer", layout="wide")
 
@@ -22,54 +27,57 @@ start = st.text_input("Startpunkt:", value="Buchrain")
 
 if st.button("Sommer-Route berechnen"):
     with st.spinner("Frage Pässe, Verkehr und Verlade ab..."):
-        jetzt = datetime.datetime.now()
-        
-        # --- 0. STATUS CHECK PÄSSE ---
-        pass_status = get_pass_status()
+        jetzt = datetime.datetime.now(CH_TZ).replace(tzinfo=None)
         
-        # --- 1. PASS-ROUTEN (DIREKT) ---
+        # --- 0. STATUS PÄSSE & VERLADE (aus der DB, vom Collector geschrieben) ---
+        live = get_latest_state()
+        if live["stale"]:
+            st.warning("⚠️ Veraltete Daten (Quelle gestört): " + ", ".join(f"{k} seit {v} Min" for k, v in live["stale"].items()))
+        pass_status = live["pass_status"]
+        furka_verlad_aktiv = live["furka_aktiv"]
+        loetschberg_verlad_aktiv = live["loetschberg_aktiv"]
+
+        # Alle benötigten Fahrzeiten gebündelt in möglichst wenigen, parallelen Maps-Requests
+        strecken = {"anfahrt_f": [start, "Autoverlad Realp"], "anfahrt_l": [start, "Autoverlad Kandersteg"]}
         if pass_status.get("Furkapass", False):
-            zeit_furkapass = get_google_maps_duration(start, "Ried-Mörel", waypoints=["Furkapass"])
-        else:
-            zeit_furkapass = 9999
-
+            strecken["furkapass"] = [start, "Furkapass", "Ried-Mörel"]
         if pass_status.get("Grimselpass", False) and pass_status.get("Brünigpass", True):
-            zeit_grimsel = get_google_maps_duration(start, "Ried-Mörel", waypoints=["Brünigpass", "Grimselpass"])
-        else:
-            zeit_grimsel = 9999
-
+            strecken["grimsel"] = [start, "Brünigpass", "Grimselpass", "Ried-Mörel"]
         if pass_status.get("Nufenenpass", False):
-            zeit_nufenen = get_google_maps_duration(start, "Ried-Mörel", waypoints=["Airolo", "Nufenenpass"])
-        else:
-            zeit_nufenen = 9999
+            strecken["nufenen"] = [start, "Airolo", "Nufenenpass", "Ried-Mörel"]
+        if furka_verlad_aktiv: strecken["ziel_f"] = ["Oberwald", "Ried-Mörel"]
+        if loetschberg_verlad_aktiv: strecken["ziel_l"] = ["Goppenstein", "Ried-Mörel"]
+        dauer = get_google_maps_durations(strecken)
+        
+        # --- 1. PASS-ROUTEN (DIREKT) ---
+        zeit_furkapass = dauer.get("furkapass", 9999)
+        zeit_grimsel = dauer.get("grimsel", 9999)
+        zeit_nufenen = dauer.get("nufenen", 9999)
 
         # --- 2. AUTOVERLAD-ROUTEN ---
-        furka_verlad_aktiv = get_furka_status()
-        loetschberg_verlad_aktiv = get_loetschberg_status() # Neu: Status Lötschberg prüfen
-        
         # Furka Verlad Berechnung
-        anfahrt_f = get_google_maps_duration(start, "Autoverlad Realp")
+        anfahrt_f = dauer["anfahrt_f"]
         if furka_verlad_aktiv:
             ankunft_realp = jetzt + datetime.timedelta(minutes=anfahrt_f)
             naechster_zug_f = get_furka_departure(ankunft_realp)
             if naechster_zug_f:
                 warte_min = int((naechster_zug_f - ankunft_realp).total_seconds() / 60)
-                effektive_warte_f = max(warte_min, get_latest_wait_times("Realp"))
-                total_f_verlad = anfahrt_f + effektive_warte_f + 25 + get_google_maps_duration("Oberwald", "Ried-Mörel")
+                effektive_warte_f = max(warte_min, forecast_wait("Realp", ankunft_realp))
+                total_f_verlad = anfahrt_f + effektive_warte_f + 25 + dauer["ziel_f"]
             else: 
                 total_f_verlad = 9999
         else: 
             total_f_verlad = 999999
 
         # Lötschberg Verlad Berechnung
-        anfahrt_l = get_google_maps_duration(start, "Autoverlad Kandersteg")
+        anfahrt_l = dauer["anfahrt_l"]
         if loetschberg_verlad_aktiv: # Neu: Prüfung eingebaut
             ankunft_kandersteg = jetzt + datetime.timedelta(minutes=anfahrt_l)
             naechster_zug_l = get_loetschberg_departure(ankunft_kandersteg)
             if naechster_zug_l:
                 warte_min_l = int((naechster_zug_l - ankunft_kandersteg).total_seconds() / 60)
-                effektive_warte_l = max(warte_min_l, get_latest_wait_times("Kandersteg"))
-                total_l_verlad = anfahrt_l + effektive_warte_l + 20 + get_google_maps_duration("Goppenstein", "Ried-Mörel")
+                effektive_warte_l = max(warte_min_l, forecast_wait("Kandersteg", ankunft_kandersteg))
+                total_l_verlad = anfahrt_l + effektive_warte_l + 20 + dauer["ziel_l"]
             else: 
                 total_l_verlad = 9999
         else:
@@ -157,3 +165,12 @@ if st.button("Sommer-Route berechnen"):
         st.success(f"✅ **Mathematische Empfehlung:** Nimm **{beste_route}** ({schnellste_zeit} Min).")
     else:
         st.error("⚠️ Aktuell scheinen alle Routen gesperrt zu sein.")
+
+# --- PLANER: BESTE ABFAHRTSZEIT IN DEN NÄCHSTEN 24H ---
+render_planner(start, get_latest_state(), passes=True)
+
+maps_stats = get_travel_time_stats()
+st.caption(f"🗺️ Fahrzeiten: {maps_stats['fresh']} frisch aus dem Speicher, {maps_stats['profile']} aus dem Wochenprofil, "
+           f"{maps_stats['api']} live abgefragt (Trefferquote {maps_stats['hit_rate']:.0%}, {maps_stats['requests_saved']} Maps-Requests gespart)")
+
+record_metric("render:sommer", (time.perf_counter() - render_start) * 1000)
@@ -1,15 +1,21 @@
 import streamlit as st
 import datetime
+import time
 from logic import (
-    get_latest_wait_times, 
-    get_google_maps_duration, 
+    forecast_wait,
+    get_google_maps_durations,
     get_furka_departure, 
     get_loetschberg_departure,
-    get_furka_status,
-    get_loetschberg_status,  # Neu importiert
+    get_latest_state,
+    render_planner,
+    get_travel_time_stats,
+    record_metric,
+    CH_TZ,
     get_gemini_winter_report
 )
 
+render_start = time.perf_counter()
+
 # 1. Seiteneinstellungen
 st.set_page_config(page_title="Routen-Check Wallis | Winter", layout="wide")
 
@@ -21,23 +27,32 @@ start = st.text_input("Startpunkt:", value="Buchrain")
 
 if st.button("Route jetzt berechnen"):
     with st.spinner("Frage Verkehrsdaten und Fahrpläne ab..."):
-        jetzt = datetime.datetime.now()
+        jetzt = datetime.datetime.now(CH_TZ).replace(tzinfo=None)
         
         # --- DATENABFRAGE & STATUS ---
-        furka_aktiv = get_furka_status()
-        loetschberg_aktiv = get_loetschberg_status() # Neu: Status Lötschberg prüfen
+        live = get_latest_state()
+        if live["stale"]:
+            st.warning("⚠️ Veraltete Daten (Quelle gestört): " + ", ".join(f"{k} seit {v} Min" for k, v in live["stale"].items()))
+        furka_aktiv = live["furka_aktiv"]
+        loetschberg_aktiv = live["loetschberg_aktiv"]
+
+        # Alle Fahrzeiten gebündelt in möglichst wenigen, parallelen Maps-Requests
+        strecken = {"anfahrt_f": [start, "Autoverlad Realp"], "anfahrt_l": [start, "Autoverlad Kandersteg"]}
+        if furka_aktiv: strecken["ziel_f"] = ["Oberwald", "Ried-Mörel"]
+        if loetschberg_aktiv: strecken["ziel_l"] = ["Goppenstein", "Ried-Mörel"]
+        dauer = get_google_maps_durations(strecken)
         
         # --- ROUTE A: FURKA (REALP) ---
-        anfahrt_f = get_google_maps_duration(start, "Autoverlad Realp")
+        anfahrt_f = dauer["anfahrt_f"]
         if furka_aktiv:
             ankunft_realp = jetzt + datetime.timedelta(minutes=anfahrt_f)
             naechster_zug_f = get_furka_departure(ankunft_realp)
             if naechster_zug_f:
                 wartezeit_fahrplan_f = int((naechster_zug_f - ankunft_realp).total_seconds() / 60)
-                stau_f = get_latest_wait_times("Realp")
+                stau_f = forecast_wait("Realp", ankunft_realp)
                 effektive_warte_f = max(wartezeit_fahrplan_f, stau_f)
                 zug_f_dauer = 25 
-                ziel_f = get_google_maps_duration("Oberwald", "Ried-Mörel")
+                ziel_f = dauer["ziel_f"]
                 total_f = anfahrt_f + effektive_warte_f + zug_f_dauer + ziel_f
                 ankunft_ziel_f = jetzt + datetime.timedelta(minutes=total_f)
             else:
@@ -47,16 +62,16 @@ if st.button("Route jetzt berechnen"):
             naechster_zug_f = None
 
         # --- ROUTE B: LÖTSCHBERG (KANDERSTEG) ---
-        anfahrt_l = get_google_maps_duration(start, "Autoverlad Kandersteg")
+        anfahrt_l = dauer["anfahrt_l"]
         if loetschberg_aktiv: # Neu: Nur berechnen wenn aktiv
             ankunft_kandersteg = jetzt + datetime.timedelta(minutes=anfahrt_l)
             naechster_zug_l = get_loetschberg_departure(ankunft_kandersteg)
             if naechster_zug_l:
                 wartezeit_fahrplan_l = int((naechster_zug_l - ankunft_kandersteg).total_seconds() / 60)
-                stau_l = get_latest_wait_times("Kandersteg")
+                stau_l = forecast_wait("Kandersteg", ankunft_kandersteg)
                 effektive_warte_l = max(wartezeit_fahrplan_l, stau_l)
                 zug_l_dauer = 20
-                ziel_l = get_google_maps_duration("Goppenstein", "Ried-Mörel")
+                ziel_l = dauer["ziel_l"]
                 total_l = anfahrt_l + effektive_warte_l + zug_l_dauer + ziel_l
                 ankunft_ziel_l = jetzt + datetime.timedelta(minutes=total_l)
             else:
@@ -146,3 +161,12 @@ if st.button("Route jetzt berechnen"):
         st.success(f"✅ **Mathematische Empfehlung:** Über den **Furka** sparst du ca. {total_l - total_f} Minuten.")
     else:
         st.success(f"✅ **Mathematische Empfehlung:** Über den **Lötschberg** sparst du ca. {total_f - total_l} Minuten.")
+
+# --- PLANER: BESTE ABFAHRTSZEIT IN DEN NÄCHSTEN 24H ---
+render_planner(start, get_latest_state())
+
+maps_stats = get_travel_time_stats()
+st.caption(f"🗺️ Fahrzeiten: {maps_stats['fresh']} frisch aus dem Speicher, {maps_stats['profile']} aus dem Wochenprofil, "
+           f"{maps_stats['api']} live abgefragt (Trefferquote {maps_stats['hit_rate']:.0%}, {maps_stats['requests_saved']} Maps-Requests gespart)")
+
+record_metric("render:winter", (time.perf_counter() - render_start) * 1000)
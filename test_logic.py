@@ -0,0 +1,727 @@
+import time
+import core
+
+
+def test_fetch_sources_runs_in_parallel(monkeypatch):
+    # Vier Feeds à 0.3 s dürfen zusammen nicht 1.2 s dauern
+    monkeypatch.setattr(core, "fetch_source_with_age", lambda name, stale_ok=False: time.sleep(0.3) or (name, 0))
+    t0 = time.perf_counter()
+    res = core.fetch_sources_with_age()
+    assert time.perf_counter() - t0 < 0.9
+    assert res == {name: (name, 0) for name in core.FEED_SOURCES}
+
+
+def _furka_waits(monkeypatch, rss):
+    # Gleicher Weg wie fetch_live_state: Feed-Records -> Wartezeiten
+    monkeypatch.setattr(core, "_feed_state", {})
+    monkeypatch.setattr(core, "_feed_events", core.deque(maxlen=core.FEED_EVENT_LOG_SIZE))
+    return core.furka_wait_times(core.process_feed("mgb_furka", rss.encode("utf-8")))
+
+
+def test_furka_feed_defaults_missing_station(monkeypatch):
+    rss = """<rss><channel><item><title>Wartezeit Realp</title>
+    <description>ca. 1 Stunde</description></item></channel></rss>"""
+    res = _furka_waits(monkeypatch, rss)
+    assert res["Realp"]["min"] == 60
+    assert res["Oberwald"] == {"min": 0, "raw": "Keine Meldung"}
+
+
+def test_ingest_and_read_back_latest_state(tmp_path, monkeypatch):
+    monkeypatch.setattr(core, "DB_NAME", str(tmp_path / "t.db"))
+    monkeypatch.setattr(core, "restore_from_gsheets", lambda conn: None)
+    core.init_db()
+    live = {"wait_times": {"Realp": {"min": 30, "raw": "30 Minuten"}},
+            "furka_aktiv": False, "loetschberg_aktiv": True,
+            "pass_status": {"Furkapass": True, "Grimselpass": False, "Nufenenpass": False, "Brünigpass": True}}
+    monkeypatch.setattr(core, "fetch_live_state", lambda: live)
+    core.ingest_cycle()
+    state = core.get_latest_state()
+    assert state["wait_times"]["Realp"] == {"min": 30, "raw": "30 Minuten"}
+    assert state["furka_aktiv"] is False and state["loetschberg_aktiv"] is True
+    assert state["pass_status"]["Furkapass"] is True
+
+
+class _FakeResponse:
+    def __init__(self, status_code, headers=None, content=b""):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = content
+
+
+class _FakeSession:
+    def __init__(self):
+        self.calls = []
+
+    def get(self, url, headers=None, timeout=None):
+        self.calls.append(dict(headers or {}))
+        if headers and headers.get("If-None-Match") == '"v1"':
+            return _FakeResponse(304)
+        return _FakeResponse(200, {"ETag": '"v1"'}, b"<rss/>")
+
+
+def test_cached_get_ttl_and_revalidation(monkeypatch):
+    session = _FakeSession()
+    monkeypatch.setattr(core, "get_http_session", lambda: session)
+    monkeypatch.setattr(core, "_http_cache", {})
+    monkeypatch.setattr(core, "_http_cache_stats", {"hits": 0, "misses": 0, "revalidated": 0})
+    url = "https://example.invalid/feed"
+
+    first = core.cached_get(url, ttl=60)
+    assert core.cached_get(url, ttl=60) is first
+    assert len(session.calls) == 1
+
+    # TTL abgelaufen -> bedingter Request, 304 liefert die gespeicherte Response
+    assert core.cached_get(url, ttl=0) is first
+    assert session.calls[-1]["If-None-Match"] == '"v1"'
+    stats = core.get_http_cache_stats()
+    assert (stats["hits"], stats["misses"], stats["revalidated"]) == (1, 1, 1)
+
+
+class _FakeWorksheet:
+    def __init__(self, rows=None, fail=False):
+        self.rows = rows or []
+        self.fail = fail
+
+    def col_values(self, col):
+        return [r[col - 1] for r in self.rows]
+
+    def append_row(self, row):
+        self.rows.append(row)
+
+    def append_rows(self, rows, value_input_option=None):
+        if self.fail: raise RuntimeError("quota")
+        self.rows.extend(rows)
+
+
+def test_gsheets_outbox_appends_incrementally_and_retries(tmp_path, monkeypatch):
+    monkeypatch.setattr(core, "DB_NAME", str(tmp_path / "t.db"))
+    monkeypatch.setattr(core, "restore_from_gsheets", lambda conn: None)
+    core.init_db()
+    ws = _FakeWorksheet([core.GSHEETS_COLUMNS, ["2024-01-01 10:00:00", "Realp", 0, ""]], fail=True)
+    monkeypatch.setattr(core, "get_gsheets_worksheet", lambda name: ws)
+
+    core.enqueue_for_gsheets({"Realp": {"min": 15, "raw": "15 Minuten"}}, "2024-01-01 10:05:00")
+    try: core.flush_gsheets_outbox("Sheet1")
+    except RuntimeError: pass
+    assert core.get_gsheets_backlog() == 1
+
+    ws.fail = False
+    core.enqueue_for_gsheets({"Realp": {"min": 30, "raw": "30 Minuten"}}, "2024-01-01 10:10:00")
+    assert core.flush_gsheets_outbox("Sheet1") == 2
+    assert [r[0] for r in ws.rows[2:]] == ["2024-01-01 10:05:00", "2024-01-01 10:10:00"]
+    # Slot unterhalb der High-Water-Mark wird nicht mehr angehängt
+    assert core.enqueue_for_gsheets({"Realp": {"min": 0}}, "2024-01-01 10:05:00") == 0
+    assert core.get_gsheets_backlog() == 0
+
+
+class _RangeWorksheet:
+    def __init__(self, rows, padding=0):
+        self.rows = rows
+        self.row_count = len(rows) + padding  # Rastergrösse inkl. leerer Zeilen unter den Daten
+        self.cells_read = 0
+
+    def get(self, a1):
+        start, end = a1.split(":")
+        r0, r1 = int(start[1:]), int(end[1:])
+        width = 1 if end[0] == "A" else 4
+        out = [row[:width] for row in self.rows[r0 - 1:r1]]
+        self.cells_read += sum(len(r) for r in out)
+        return out
+
+
+def test_restore_loads_only_window_idempotently(tmp_path, monkeypatch):
+    import datetime
+    now = datetime.datetime.now(core.CH_TZ).replace(second=0, microsecond=0)
+    rows = [core.GSHEETS_COLUMNS]
+    for i in range(2000, -1, -1):
+        ts = (now - datetime.timedelta(minutes=5 * i)).strftime('%Y-%m-%d %H:%M:%S')
+        rows.append([ts, "Realp", str(i % 7), "raw"])
+    ws = _RangeWorksheet(rows)
+    monkeypatch.setattr(core, "DB_NAME", str(tmp_path / "t.db"))
+    monkeypatch.setattr(core, "get_gsheets_worksheet", lambda name: ws)
+    monkeypatch.setattr(core, "RESTORE_CHUNK_ROWS", 100)
+    restore = core.restore_from_gsheets
+    monkeypatch.setattr(core, "restore_from_gsheets", lambda conn, hours=None: None)
+    core.init_db()
+    monkeypatch.setattr(core, "restore_from_gsheets", restore)
+
+    import sqlite3
+    with sqlite3.connect(core.DB_NAME) as conn:
+        first = core.restore_from_gsheets(conn, hours=24)
+        second = core.restore_from_gsheets(conn, hours=24)
+        count = conn.execute("SELECT COUNT(*) FROM stats").fetchone()[0]
+    # 24 h = 288 Slots, nur ein Bruchteil des Sheets wird gelesen
+    assert first["rows"] == 288 and second["rows"] == 0 and count == 288
+    assert ws.cells_read < len(rows) * 4 / 2
+
+
+def test_restore_start_row_skips_empty_padding_rows(monkeypatch):
+    import datetime
+    now = datetime.datetime.now(core.CH_TZ).replace(second=0, microsecond=0)
+    rows = [core.GSHEETS_COLUMNS] + [[(now - datetime.timedelta(minutes=5 * i)).strftime('%Y-%m-%d %H:%M:%S'), "Realp", "0", ""]
+                                     for i in range(575, -1, -1)]
+    cutoff = (now - datetime.timedelta(hours=24)).strftime('%Y-%m-%d %H:%M:%S')
+    monkeypatch.setattr(core, "RESTORE_CHUNK_ROWS", 100)
+    expected = core.find_restore_start_row(_RangeWorksheet(rows), cutoff)
+    assert expected == 2 + 288
+    # Gleiche Daten in einem Raster mit 2000 leeren Zeilen darunter
+    padded = _RangeWorksheet(rows, padding=2000)
+    assert core.find_restore_start_row(padded, cutoff) == expected
+
+
+def test_init_db_migrates_legacy_stats_in_place(tmp_path, monkeypatch):
+    import sqlite3
+    db = str(tmp_path / "legacy.db")
+    with sqlite3.connect(db) as conn:
+        conn.execute("CREATE TABLE stats (timestamp DATETIME, station TEXT, minutes INTEGER, raw_text TEXT)")
+        conn.executemany("INSERT INTO stats VALUES (?, ?, ?, ?)", [
+            ("2024-01-01 10:00:00", "Realp", 10, "a"),
+            ("2024-01-01 10:00:00", "Realp", 99, "dup"),
+            ("2024-01-01 10:05:00", "Realp", 15, "a"),
+        ])
+    monkeypatch.setattr(core, "DB_NAME", db)
+    core.init_db()
+    core.init_db()
+    with sqlite3.connect(db) as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("SELECT minutes, raw_text FROM stats_full ORDER BY timestamp").fetchall() == [(10, "a"), (15, "a")]
+        assert conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0] == 1
+        pk = [r[1] for r in conn.execute("PRAGMA table_info(stats)") if r[5]]
+        assert set(pk) == {"timestamp", "station"}
+
+
+def test_migrations_are_atomic_and_run_once_under_concurrency(tmp_path, monkeypatch):
+    import sqlite3
+    from concurrent.futures import ThreadPoolExecutor
+    monkeypatch.setattr(core, "restore_from_gsheets", lambda conn: None)
+    # Rest eines abgebrochenen Laufs: stats_new existiert schon, Version ist noch 0
+    db = str(tmp_path / "crashed.db")
+    with sqlite3.connect(db) as conn:
+        conn.execute("CREATE TABLE stats (timestamp DATETIME, station TEXT, minutes INTEGER, raw_text TEXT)")
+        conn.execute("CREATE TABLE stats_new (timestamp DATETIME)")
+        conn.execute("INSERT INTO stats VALUES ('2024-01-01 10:00:00', 'Realp', 10, 'a')")
+    monkeypatch.setattr(core, "DB_NAME", db)
+    core.init_db()
+    with sqlite3.connect(db) as conn:
+        assert conn.execute("SELECT minutes, raw_text FROM stats_full").fetchall() == [(10, "a")]
+
+    monkeypatch.setattr(core, "DB_NAME", str(tmp_path / "fresh.db"))
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        list(pool.map(lambda _: core.init_db(), range(6)))  # wirft bei doppelter Migration
+    with sqlite3.connect(core.DB_NAME) as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == len(core.SCHEMA_MIGRATIONS)
+
+
+def test_rollups_follow_each_ingest(tmp_path, monkeypatch):
+    import sqlite3
+    monkeypatch.setattr(core, "DB_NAME", str(tmp_path / "t.db"))
+    monkeypatch.setattr(core, "restore_from_gsheets", lambda conn: None)
+    core.init_db()
+    for minute, value in zip(range(0, 60, 5), range(10, 130, 10)):
+        monkeypatch.setattr(core, "current_slot", lambda now=None, m=minute: f"2024-07-06 09:{m:02d}:00")
+        core.save_to_db({"Realp": {"min": value, "raw": ""}})
+    with sqlite3.connect(core.DB_NAME) as conn:
+        hourly = conn.execute("SELECT bucket, n, min_minutes, avg_minutes, max_minutes, p90_minutes FROM stats_hourly").fetchall()
+        daily = conn.execute("SELECT bucket, n FROM stats_daily").fetchall()
+    assert hourly == [("2024-07-06 09:00:00", 12, 10, 65.0, 120, 110)]
+    assert daily == [("2024-07-06 00:00:00", 12)]
+
+
+def test_gemini_models_and_responses_are_cached(monkeypatch):
+    calls = {"list": 0, "generate": 0}
+
+    class _Model:
+        name = "models/gemini-2.0-flash"
+        supported_generation_methods = ["generateContent"]
+
+    class _Generative:
+        def __init__(self, name): pass
+
+        def generate_content(self, prompt):
+            calls["generate"] += 1
+            return type("R", (), {"text": "OFFEN"})()
+
+    monkeypatch.setitem(core._config, "settings", {"GEMINI_API_KEY": "k"})
+    genai = core._genai()
+    monkeypatch.setattr(genai, "configure", lambda api_key: None)
+    monkeypatch.setattr(genai, "list_models", lambda: calls.__setitem__("list", calls["list"] + 1) or [_Model()])
+    monkeypatch.setattr(genai, "GenerativeModel", _Generative)
+    monkeypatch.setattr(core, "_gemini_models", {"api_key": None, "models": None, "fetched": 0.0})
+    monkeypatch.setattr(core, "_gemini_responses", {})
+
+    assert core.generate_content_with_fallback("feed A") == "OFFEN"
+    assert core.generate_content_with_fallback("feed A") == "OFFEN"
+    assert core.generate_content_with_fallback("feed B") == "OFFEN"
+    assert calls == {"list": 1, "generate": 2}
+
+
+def test_closure_classifier_matches_labelled_corpus():
+    import json, os
+    with open(os.path.join(os.path.dirname(__file__), "benchmarks", "data", "closure_corpus.json"), encoding="utf-8") as f:
+        corpus = json.load(f)
+    for case in filter(lambda c: c["label"], corpus):
+        result = core.classify_closure(case["items"])
+        if result["confidence"] >= core.CLASSIFIER_MIN_CONFIDENCE:
+            assert result["decision"] == case["label"], case["id"]
+
+
+def test_closure_classifier_asks_gemini_only_when_unsure(monkeypatch):
+    prompts = []
+    monkeypatch.setattr(core, "generate_content_with_fallback", lambda p: prompts.append(p) or "🤖 Päuseli")
+    sure = {"trafficInformations": [{"title": "Autoverlad Kandersteg - Goppenstein eingestellt"}]}
+    assert core.check_loetschberg_status(sure) is False and prompts == []
+    # Unsicher -> Gemini; unverständliche Antwort -> lokale Entscheidung statt stillem "offen"
+    unsure = {"trafficInformations": [{"title": "Unterbruch zwischen Goppenstein und Brig"}]}
+    result = core.classify_loetschberg_status(unsure)
+    assert len(prompts) == 1 and result["decision"] == "GESPERRT" and result["source"] == "regeln"
+    # Einzelne Zugausfälle sind keine Einstellung des Verlads: nie sicher GESPERRT, Gemini entscheidet
+    partial = {"trafficInformations": [{"title": "Autoverlad Lötschberg: Ausfall der Abfahrt 16:43 ab Kandersteg"}]}
+    assert core.check_loetschberg_status(partial) is True and len(prompts) == 2
+
+
+def test_maps_legs_are_batched_and_waypoints_summed(tmp_path, monkeypatch):
+    monkeypatch.setattr(core, "DB_NAME", str(tmp_path / "t.db"))
+    monkeypatch.setattr(core, "restore_from_gsheets", lambda conn: None)
+    core.init_db()
+    requests_made = []
+
+    class _MapsSession:
+        def get(self, url, params=None, timeout=None):
+            origins, dests = params["origins"].split("|"), params["destinations"].split("|")
+            requests_made.append((origins, dests))
+            rows = [{"elements": [{"status": "OK", "duration_in_traffic": {"value": 600 * (len(o) + len(d))}}
+                                  for d in dests]} for o in origins]
+            return type("R", (), {"json": lambda self: {"status": "OK", "rows": rows}})()
+
+    monkeypatch.setattr(core, "get_http_session", lambda: _MapsSession())
+    monkeypatch.setitem(core._config, "settings", {"G_MAPS_API_KEY": "k"})
+    res = core.get_google_maps_durations({
+        "anfahrt_f": ["A", "Realp"], "anfahrt_l": ["A", "Kandersteg"],
+        "ziel_f": ["Oberwald", "RM"], "ziel_l": ["Goppenstein", "RM"],
+        "pass": ["A", "Furkapass", "RM"],
+    })
+    # 6 Teilstrecken -> 2 Requests (gemeinsamer Start bzw. gemeinsames Ziel)
+    assert len(requests_made) == 2
+    assert res["pass"] == (600 * (1 + 9) + 600 * (9 + 2)) // 60
+    assert res["anfahrt_f"] == 600 * 6 // 60
+
+    # Zweiter Aufruf (auch anders geschrieben) kommt komplett aus dem Fahrzeit-Speicher
+    again = core.get_google_maps_durations({"anfahrt_f": [" a ", "REALP"], "pass": ["A", "Furkapass", "RM"]})
+    assert len(requests_made) == 2 and again == {"anfahrt_f": res["anfahrt_f"], "pass": res["pass"]}
+    assert core.get_travel_time_stats()["requests_saved"] >= 2
+
+
+def test_planner_builds_open_routes_once_for_both_pages(monkeypatch):
+    asked, planned = [], {}
+    durations = {"Via Furka:anfahrt": 90, "Via Furka:ziel": 30, "Via Lötschberg:anfahrt": 999,
+                 "Via Lötschberg:ziel": 40, "Via Grimselpass:anfahrt": 180}
+    monkeypatch.setattr(core, "get_google_maps_durations", lambda strecken: asked.append(strecken) or
+                        {k: durations[k] for k in strecken})
+    monkeypatch.setattr(core, "plan_departures", lambda legs, jetzt, step_min: planned.update(legs, step=step_min))
+    live = {"furka_aktiv": True, "loetschberg_aktiv": True,
+            "pass_status": {"Furkapass": False, "Grimselpass": True, "Brünigpass": True, "Nufenenpass": False}}
+
+    core.plan_best_departures("Buchrain", live, step_min=5)
+    # Winter: nur Verlade; Lötschberg ohne Fahrzeit (Maps-Fehler) fällt weg
+    assert set(asked[0]) == {"Via Furka:anfahrt", "Via Furka:ziel", "Via Lötschberg:anfahrt", "Via Lötschberg:ziel"}
+    assert asked[0]["Via Furka:anfahrt"] == ["Buchrain", "Autoverlad Realp"]
+    assert planned == {"Via Furka": {"anfahrt": 90, "ziel": 30, "verlad": "Furka"}, "step": 5}
+
+    planned.clear()
+    core.plan_best_departures("Buchrain", dict(live, furka_aktiv=False), passes=True)
+    assert asked[1]["Via Grimselpass:anfahrt"] == ["Buchrain", "Brünigpass", "Grimselpass", "Ried-Mörel"]
+    assert planned == {"Via Grimselpass": {"anfahrt": 180, "ziel": 0, "verlad": None}, "step": 15}
+
+
+def test_travel_times_fall_back_to_weekday_hour_profile_and_prune_old_rows(tmp_path, monkeypatch):
+    import datetime
+    import sqlite3
+    monkeypatch.setattr(core, "DB_NAME", str(tmp_path / "t.db"))
+    monkeypatch.setattr(core, "restore_from_gsheets", lambda conn: None)
+    core.init_db()
+    leg = ("Buchrain", "Realp")
+    saturday_9 = core.CH_TZ.localize(datetime.datetime(2024, 7, 6, 9, 10))
+    core.record_travel_times({leg: 3600}, now=saturday_9 - datetime.timedelta(days=7))
+    later = saturday_9 + datetime.timedelta(minutes=30)
+    assert core.lookup_travel_times([leg], now=later) == {}  # nur 1 Beobachtung im Bucket: unter TRAVEL_PROFILE_MIN_SAMPLES
+
+    core.record_travel_times({leg: 4200}, now=saturday_9 - datetime.timedelta(days=14))
+    assert core.lookup_travel_times([leg], now=later) == {leg: (3900, "profile")}  # Mittel Sa 09-10 Uhr
+    assert core.lookup_travel_times([leg], now=later + datetime.timedelta(hours=1)) == {}  # anderer Bucket
+
+    # Ein neuer Eintrag räumt alles ausserhalb des Profil-Fensters weg
+    core.record_travel_times({leg: 3000}, now=saturday_9 + datetime.timedelta(days=core.TRAVEL_PROFILE_MAX_AGE_DAYS - 10))
+    with sqlite3.connect(core.DB_NAME) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM travel_times").fetchone()[0] == 2
+
+
+def test_wait_forecast_blends_profile_with_current_observation(tmp_path, monkeypatch):
+    import datetime
+    import numpy as np
+    monkeypatch.setattr(core, "DB_NAME", str(tmp_path / "t.db"))
+    monkeypatch.setattr(core, "restore_from_gsheets", lambda conn: None)
+    core.init_db()
+
+    def ingest(ts, minutes):
+        monkeypatch.setattr(core, "current_slot", lambda now=None: ts)
+        core.save_to_db({"Realp": {"min": minutes, "raw": ""}})
+
+    for day in ("2024-06-22", "2024-06-29", "2024-07-06"):  # Samstage
+        ingest(f"{day} 07:00:00", 5)
+        ingest(f"{day} 09:00:00", 60)
+        core.forecast_waits("Realp", [])  # Speicherkopie laden, ab hier inkrementell nachgeführt
+    ingest("2024-07-13 07:00:00", 20)
+
+    sat = datetime.datetime(2024, 7, 13)
+    arrivals = [sat.replace(hour=7), sat.replace(hour=9)]
+    incremental = core.forecast_waits("Realp", arrivals)
+    assert incremental[0] == 20
+    assert abs(incremental[1] - (60 + (20 - 8.75) * np.exp(-2))) < 1e-9
+    assert core.forecast_wait("Realp", sat.replace(hour=9)) == 62
+    assert core.forecast_wait("Oberwald", sat) == 0
+
+    core._forecast["loaded"] = None  # aus der Tabelle neu laden: identisch zur Speicherkopie
+    assert np.allclose(core.forecast_waits("Realp", arrivals), incremental)
+
+
+def test_latest_state_snapshot_serves_readers_without_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(core, "DB_NAME", str(tmp_path / "t.db"))
+    monkeypatch.setattr(core, "restore_from_gsheets", lambda conn: None)
+    core.init_db()
+    monkeypatch.setattr(core, "current_slot", lambda now=None: "2024-07-06 09:00:00")
+    core.save_to_db({"Realp": {"min": 10, "raw": "10 Minuten"}})
+    assert core.get_latest_state()["wait_times"]["Realp"]["min"] == 10  # Snapshot aus der DB geladen
+
+    monkeypatch.setattr(core, "current_slot", lambda now=None: "2024-07-06 09:05:00")
+    core.save_to_db({"Realp": {"min": 25, "raw": "25 Minuten"}, "Kandersteg": {"min": 0, "raw": "Keine Meldung"}})
+    core.save_status({"furka_aktiv": False, "loetschberg_aktiv": True, "pass_status": {}})
+
+    def no_db():
+        raise AssertionError("Leser darf die DB nicht anfassen")
+    monkeypatch.setattr(core, "db_connect", no_db)
+    for _ in range(3):
+        state = core.get_latest_state()
+        assert state["wait_times"]["Realp"] == {"min": 25, "raw": "25 Minuten"}
+        assert state["furka_aktiv"] is False and state["timestamp"] == "2024-07-06 09:05:00"
+    assert core.get_latest_wait_times("Kandersteg") == 0
+    assert core.get_recent_wait_times()["Realp"] == [("2024-07-06 09:00:00", 10), ("2024-07-06 09:05:00", 25)]
+    state["wait_times"]["Realp"]["min"] = 999  # Kopie, der Snapshot bleibt unverändert
+    assert core.get_latest_wait_times("Realp") == 25
+
+
+def test_chart_window_reads_incrementally_with_local_bounds(tmp_path, monkeypatch):
+    import datetime
+    monkeypatch.setattr(core, "DB_NAME", str(tmp_path / "t.db"))
+    monkeypatch.setattr(core, "restore_from_gsheets", lambda conn: None)
+    core.init_db()
+    now = core.CH_TZ.localize(datetime.datetime(2024, 7, 6, 12, 0))
+    with core.db_connect() as conn:
+        core.insert_stats(conn, [("2024-07-05 11:55:00", "Realp", 10, ""), ("2024-07-05 12:05:00", "Realp", 20, ""),
+                                  ("2024-07-06 11:00:00", "Realp", 999, ""), ("2024-07-06 11:55:00", "Realp", 30, "")])
+    assert list(core.get_chart_window(24, now=now)["minutes"]) == [20, 30]
+
+    queries = []
+    read = core._read_chart_rows
+    monkeypatch.setattr(core, "_read_chart_rows", lambda conn, where, param: queries.append((where, param)) or read(conn, where, param))
+    with core.db_connect() as conn:
+        core.insert_stats(conn, [("2024-07-06 12:05:00", "Realp", 40, "")])
+    later = now + datetime.timedelta(minutes=10)
+    assert list(core.get_chart_window(24, now=later)["minutes"]) == [30, 40]  # 12:05 vom Vortag fällt raus
+    assert queries == [("timestamp > ?", "2024-07-06 11:55:00")]
+
+
+def test_lttb_keeps_endpoints_and_peaks():
+    import numpy as np
+    x = np.arange(1000)
+    y = np.zeros(1000)
+    y[437] = 180
+    idx = core.lttb_indices(x, y, 50)
+    assert len(idx) == 50 and idx[0] == 0 and idx[-1] == 999
+    assert 437 in idx and np.all(np.diff(idx) > 0)
+    assert list(core.lttb_indices(x[:10], y[:10], 50)) == list(range(10))
+
+
+def test_delay_parser_matches_labelled_corpus():
+    import json, os
+    with open(os.path.join(os.path.dirname(__file__), "benchmarks", "data", "delay_messages.json"), encoding="utf-8") as f:
+        corpus = json.load(f)
+    for case in corpus:
+        info = core.parse_delay_message(case["text"])
+        assert (info.minutes, info.station, info.direction) == (case["minutes"], case["station"], case["direction"]), case["text"]
+        assert info.wait is case["wait"], case["text"]  # Uhrzeiten/Fahrplantext sind keine Wartezeit-Meldung
+        assert core.parse_time_to_minutes(case["text"]) == case["minutes"]
+
+
+def test_delay_parser_is_memoized_and_feeds_rss_in_other_languages(monkeypatch):
+    core.parse_delay_message.cache_clear()
+    for _ in range(3):
+        core.parse_time_to_minutes("Wartezeit in Realp ca. 30 Minuten")
+    assert core.parse_delay_message.cache_info().hits == 2
+    xml = """<rss><channel>
+      <item><title>Temps d'attente Oberwald</title><description>Temps d'attente à Oberwald env. 45 minutes</description></item>
+      <item><title>Autoverlad Furka</title><description>Départ toutes les heures</description></item>
+    </channel></rss>"""
+    res = _furka_waits(monkeypatch, xml)
+    assert res["Oberwald"]["min"] == 45
+    assert res["Realp"] == {"min": 0, "raw": "Keine Meldung"}
+
+
+def test_rss_items_are_processed_incrementally_with_change_events(monkeypatch):
+    def feed(*items):
+        body = "".join(f"<item><guid>{g}</guid><pubDate>{d}</pubDate><title>{t}</title><description>{t}</description></item>"
+                       for g, d, t in items)
+        return f"<rss><channel>{body}</channel></rss>".encode("utf-8")
+
+    classified = []
+    original = core.classify_closure_item
+    monkeypatch.setattr(core, "classify_closure_item", lambda text: classified.append(text) or original(text))
+    monkeypatch.setattr(core, "_feed_state", {})
+    monkeypatch.setattr(core, "_feed_listeners", [])
+    events = []
+    core.subscribe_feed_events(events.append)
+    source = "test_feed"
+    a = ("a", "Mon, 01 Jul 2024 08:00:00", "Wartezeit Realp ca. 30 Minuten")
+    b = ("b", "Mon, 01 Jul 2024 08:00:00", "Wartezeit Oberwald Keine Wartezeit")
+
+    records = core.process_feed(source, feed(a, b))
+    assert [r["delay"].minutes for r in records] == [30, 0] and len(classified) == 2
+    assert core.process_feed(source, feed(a, b)) is records  # gleicher Payload: kein Parse
+
+    a2 = ("a", "Mon, 01 Jul 2024 08:05:00", "Wartezeit Realp ca. 45 Minuten")
+    c = ("c", "Mon, 01 Jul 2024 08:05:00", "Autoverlad Furka eingestellt")
+    records = core.process_feed(source, feed(a2, c))
+    assert classified[2:] == ["Wartezeit Realp ca. 45 Minuten Wartezeit Realp ca. 45 Minuten",
+                              "Autoverlad Furka eingestellt Autoverlad Furka eingestellt"]
+    assert [(e["kind"], e["key"]) for e in events] == [
+        ("added", "a"), ("added", "b"), ("changed", "a"), ("added", "c"), ("removed", "b")]
+    assert core.furka_wait_times(records)["Realp"]["min"] == 45
+
+
+def test_metrics_record_stage_latency_and_errors(tmp_path, monkeypatch):
+    import collections
+    import pytest
+    monkeypatch.setattr(core, "DB_NAME", str(tmp_path / "t.db"))
+    monkeypatch.setattr(core, "restore_from_gsheets", lambda conn: None)
+    # Eigener Puffer und eigene Breaker-Zustände; nach dem Test gilt wieder der Modulzustand
+    monkeypatch.setattr(core, "_metrics_buffer", [])
+    monkeypatch.setattr(core, "_metrics_flushed", {"at": time.monotonic()})
+    monkeypatch.setattr(core, "_source_health", collections.defaultdict(
+        lambda: {"failures": 0, "open_until": 0.0, "probing": False, "last_error": None, "last_ok": None}))
+    core.init_db()
+
+    for ms in range(1, 101):
+        core.record_metric("fetch:bls_delays", ms)
+    with pytest.raises(ValueError):
+        with core.timed("db_write"):
+            raise ValueError("kaputt")
+    with core.timed("db_write") as outcome:
+        outcome["ok"] = False
+
+    def failing_get(url, ttl, headers=None):
+        raise ConnectionError("timeout")
+    monkeypatch.setattr(core, "cached_get", failing_get)
+    monkeypatch.setattr(core, "_last_good", {})
+    assert core.fetch_source("mgb_furka") is None
+
+    summary = core.get_metrics_summary(24).set_index("stage")
+    assert summary.loc["fetch:bls_delays", "n"] == 100
+    assert summary.loc["fetch:bls_delays", "p50_ms"] == 50.5
+    assert summary.loc["fetch:bls_delays", "p99_ms"] == 99.0
+    assert summary.loc["fetch:bls_delays", "fehlerquote"] == 0
+    assert summary.loc["db_write", "fehlerquote"] == 1
+    assert summary.loc["fetch:mgb_furka", "fehlerquote"] == 1
+
+
+def test_offline_e2e_benchmark_runs_against_local_stubs():
+    import sys, os
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), "benchmarks"))
+    import e2e
+    db_before = core.DB_NAME
+    report = e2e.run(repeat=1, latency_ms=0, sheets_latency_ms=0, gemini_latency_ms=0, warmup=0)
+    assert core.DB_NAME == db_before
+    assert set(report["results"]) == {name for name, _ in e2e.scenarios({"clock": None})}
+    assert all(r["n"] == 1 and r["median_ms"] > 0 for r in report["results"].values())
+    assert {"bls_delays", "bls_traffic", "mgb_furka", "alpen_paesse", "maps"} <= set(report["upstream_requests"])
+
+
+def test_circuit_breaker_serves_last_good_value_and_backs_off(tmp_path, monkeypatch):
+    import collections
+    monkeypatch.setattr(core, "DB_NAME", str(tmp_path / "t.db"))
+    monkeypatch.setattr(core, "restore_from_gsheets", lambda conn: None)
+    core.init_db()
+    monkeypatch.setattr(core, "_last_good", {})
+    monkeypatch.setattr(core, "_source_health", collections.defaultdict(
+        lambda: {"failures": 0, "open_until": 0.0, "probing": False, "last_error": None, "last_ok": None}))
+    calls = []
+    upstream = {"down": False}
+
+    def fake_get(url, ttl, headers=None):
+        calls.append(url)
+        if upstream["down"]:
+            raise TimeoutError("read timed out")
+        return _FakeResponse(200, content=b'{"trafficInformations": []}')
+    monkeypatch.setattr(core, "cached_get", fake_get)
+
+    good, age = core.fetch_source_with_age("bls_traffic")
+    assert good is not None and age == 0
+    upstream["down"] = True
+    for _ in range(core.CIRCUIT_FAILURE_THRESHOLD):
+        response, age = core.fetch_source_with_age("bls_traffic")
+        assert response is good and age >= 0  # letzter guter Stand statt None
+    assert core.get_source_health()["bls_traffic"]["zustand"] == "offen"
+
+    n = len(calls)
+    assert core.fetch_source("bls_traffic") is good
+    assert len(calls) == n  # Breaker offen: kein Upstream-Aufruf, keine Wartezeit
+
+    # Gestörte Quelle: Status wird nicht überschrieben, sondern altert sichtbar
+    core.save_status({"furka_aktiv": True, "loetschberg_aktiv": False, "pass_status": {}})
+    live = core.fetch_live_state(("bls_traffic",))
+    assert "bls_traffic" in live["stale_sources"]
+    core.save_status(live)
+    assert core.get_latest_state()["loetschberg_aktiv"] is False
+
+    # Nach Ablauf der Pause genau ein Probe-Request; Erfolg schliesst den Breaker
+    upstream["down"] = False
+    core._source_health["bls_traffic"]["open_until"] = 0.0
+    assert core.fetch_source_with_age("bls_traffic")[1] == 0
+    assert core.get_source_health()["bls_traffic"]["zustand"] == "ok"
+
+
+def test_last_good_age_uses_cache_fetch_time_and_half_open_allows_one_probe(monkeypatch):
+    import collections
+    monkeypatch.setattr(core, "_last_good", {})
+    monkeypatch.setattr(core, "_source_health", collections.defaultdict(
+        lambda: {"failures": 0, "open_until": 0.0, "probing": False, "last_error": None, "last_ok": None}))
+    cached = _FakeResponse(200, content=b"{}")
+    url = core.FEED_SOURCES["bls_traffic"]["url"]
+    monkeypatch.setattr(core, "_http_cache", {url: {"response": cached, "fetched": time.monotonic() - 50,
+                                                    "fetched_at": time.time() - 50, "etag": None, "last_modified": None}})
+    assert core.fetch_source("bls_traffic") is cached  # Cache-Treffer, kein Upstream
+    assert core.get_source_health()["bls_traffic"]["alter_s"] >= 50  # nicht "gerade eben geholt"
+
+    # Halb offener Breaker: der Stale-Pfad startet die Probe, weitere Aufrufer starten keine zweite
+    probes = []
+    monkeypatch.setattr(core, "_revalidate_in_background", probes.append)
+    core._last_good["bls_traffic"] = (cached, time.time() - 600)
+    core._source_health["bls_traffic"].update(failures=core.CIRCUIT_FAILURE_THRESHOLD, open_until=0.0)
+    for _ in range(3):
+        assert core.fetch_source("bls_traffic", stale_ok=True) is cached
+    assert probes == ["bls_traffic"] and core._source_health["bls_traffic"]["probing"] is True
+    # Diagnose der UI: nur der gehaltene Stand, weder Abfrage noch Probe
+    response, age = core.get_last_good_response("bls_traffic")
+    assert response is cached and age >= 600 and probes == ["bls_traffic"]
+    assert core.get_last_good_response("mgb_furka") == (None, None)
+
+
+def test_core_cold_import_is_fast_and_streamlit_free():
+    import os
+    import sys
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), "benchmarks"))
+    import import_time
+    result = import_time.cold_import("core")
+    assert result["loaded"] == []  # numpy, pandas, requests, Streamlit, Gemini, Sheets erst beim ersten Gebrauch
+    assert result["ms"] < import_time.CORE_IMPORT_BUDGET_MS
+
+
+def test_settings_are_injectable(monkeypatch):
+    monkeypatch.setitem(core._config, "settings", {"RESTORE_WINDOW_HOURS": 6})
+    monkeypatch.setitem(core._config, "provider", lambda key: {"G_MAPS_API_KEY": "k"}[key])
+    assert core.get_setting("RESTORE_WINDOW_HOURS", 24) == 6
+    assert core.get_setting("G_MAPS_API_KEY") == "k"
+    assert core.get_setting("FEHLT", "default") == "default"
+    messages = []
+    monkeypatch.setitem(core._config, "notify", lambda level, text: messages.append((level, text)))
+    core.notify("warning", "Cloud-Restore übersprungen")
+    assert messages == [("warning", "Cloud-Restore übersprungen")]
+
+
+def test_gsheets_worksheet_opens_through_public_gspread_api(monkeypatch):
+    import gspread
+    import pytest
+    url = "https://docs.google.com/spreadsheets/d/abc"
+    opened = []
+
+    class _Client:
+        def open_by_url(self, spreadsheet):
+            opened.append(spreadsheet)
+            return type("Book", (), {"worksheet": lambda self, name: f"ws:{name}"})()
+
+    monkeypatch.setattr(gspread, "service_account_from_dict", lambda creds: opened.append(creds) or _Client())
+    monkeypatch.setitem(core._config, "settings", {"connections": {"gsheets": {
+        "spreadsheet": url, "worksheet": "Sheet1", "type": "service_account", "client_email": "svc@x"}}})
+    assert core._open_gsheets_worksheet("Sheet1") == "ws:Sheet1"
+    assert opened == [{"type": "service_account", "client_email": "svc@x"}, url]
+
+    monkeypatch.setitem(core._config, "settings", {"connections": {}})
+    with pytest.raises(RuntimeError, match="connections.gsheets"):
+        core._open_gsheets_worksheet("Sheet1")
+
+
+def test_ingest_runs_once_per_slot_across_concurrent_callers(tmp_path, monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+    monkeypatch.setattr(core, "DB_NAME", str(tmp_path / "t.db"))
+    monkeypatch.setattr(core, "restore_from_gsheets", lambda conn: None)
+    monkeypatch.setattr(core, "INGEST_POLL_S", 0.01)
+    core.init_db()
+    slot = {"ts": "2024-07-06 09:00:00"}
+    monkeypatch.setattr(core, "current_slot", lambda now=None: slot["ts"])
+    calls = []
+
+    def fetch_live_state():
+        calls.append(slot["ts"])
+        time.sleep(0.2)
+        return {"wait_times": {"Realp": {"min": 15, "raw": "15 Minuten"}}, "furka_aktiv": True,
+                "loetschberg_aktiv": True, "pass_status": {}}
+    monkeypatch.setattr(core, "fetch_live_state", fetch_live_state)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda _: core.ingest_cycle(), range(8)))
+    assert calls == ["2024-07-06 09:00:00"]  # ein Upstream-/Sheets-Durchgang, egal wie viele Aufrufer
+    assert all(r["wait_times"]["Realp"]["min"] == 15 for r in results)
+
+    slot["ts"] = "2024-07-06 09:05:00"
+    core.ingest_cycle()
+    assert len(calls) == 2  # neuer Slot -> neue Ingestion
+
+    # Hängender Besitzer: nach Ablauf des Leases darf ein anderer Prozess übernehmen
+    slot["ts"] = "2024-07-06 09:10:00"
+    assert core.acquire_ingest_lease(slot["ts"], owner="tot:1", now=time.time() - core.INGEST_LEASE_TTL_S - 1)
+    assert not core.acquire_ingest_lease(slot["ts"], owner="anderer:2", now=time.time() - core.INGEST_LEASE_TTL_S + 5)
+    core.ingest_cycle()
+    assert len(calls) == 3
+
+
+def test_history_export_is_incremental_and_reads_only_needed_partitions(tmp_path, monkeypatch):
+    import datetime
+    monkeypatch.setattr(core, "DB_NAME", str(tmp_path / "t.db"))
+    monkeypatch.setattr(core, "restore_from_gsheets", lambda conn: None)
+    core.init_db()
+    rows = [(f"2024-07-{day:02d} {hour:02d}:00:00", station, day + hour, f"Wartezeit {day + hour} Minuten")
+            for day in (4, 5, 6) for hour in (8, 12) for station in ("Realp", "Kandersteg")]
+    with core.db_connect() as conn:
+        core.insert_stats(conn, rows)
+    now = core.CH_TZ.localize(datetime.datetime(2024, 7, 6, 15, 0))
+    history = str(tmp_path / "history")
+
+    first = core.export_history(history, now=now, max_days=1)
+    assert first == {"partitions": ["2024-07-04"], "rows": 4, "pending": 1}  # gedeckelt pro Zyklus
+    second = core.export_history(history, now=now)
+    assert second == {"partitions": ["2024-07-05"], "rows": 4, "pending": 0}  # laufender Tag bleibt draussen
+    assert core.export_history(history, now=now)["partitions"] == []
+    assert core.export_history(history, now=now + datetime.timedelta(days=1))["partitions"] == ["2024-07-06"]
+
+    # Nachtrag (z.B. Restore) für einen schon exportierten Tag: nur diese Partition wird neu geschrieben
+    late = [("2024-07-04 20:00:00", "Realp", 33, "Nachtrag")]
+    with core.db_connect() as conn:
+        core.insert_stats(conn, late)
+    assert core.export_history(history, now=now + datetime.timedelta(days=1))["partitions"] == ["2024-07-04"]
+    rows += late
+
+    assert len(core.history_partitions("2024-07-05", "2024-07-06", history)) == 1
+    df = core.read_history("2024-07-05 10:00:00", "2024-07-07", columns=["minutes"], stations=["Realp"], directory=history)
+    assert list(df.columns) == ["minutes"]
+    assert df["minutes"].tolist() == [17, 14, 18]
+    full = core.read_history(datetime.date(2024, 7, 1), datetime.date(2024, 8, 1), directory=history)
+    assert len(full) == len(rows) and full["raw_text"].iloc[0] == "Wartezeit 12 Minuten"
+    assert core.read_history("2024-06-01", "2024-06-30", directory=history).empty